@@ -3,14 +3,39 @@ import time
 import random
 import sys
 from datetime import datetime
-from collections import Counter
-from ollama import chat
+from ollama import Client, AsyncClient
 import subprocess
 import os
 import tempfile
 import re
+import atexit
+import threading
+import asyncio
+import weakref
+import contextvars
+from azrion_store import JournalStore, SQLiteStore, PersistenceWorker, TrackedDict, write_json_atomic
+from azrion_index import HistoryIndex
+from azrion_archive import SegmentedArchive
+from azrion_stats import TopK, SpaceSaving, STOPWORDS
+from azrion_cache import ReplyCache, AudioCache
+from azrion_recall import Recall, hash_embed, np
+from azrion_metrics import Metrics
+from azrion_router import ModelRouter
+from azrion_matcher import KeywordMatcher
+from azrion_files import FileIndex
+import azrion_sysmon
+from azrion_exec import Executor
+from azrion_tts import PiperEngine, RawPlayer, SpeechPipeline, voice_id
 
 MEMORY_FILE = "azrion_memory.json"
+JOURNAL_FILE = "azrion_memory.journal"
+SQLITE_FILE = "azrion_memory.db"
+INDEX_FILE = "azrion_history.idx"
+ARCHIVE_DIR = "azrion_archive"
+REPLY_CACHE_FILE = "azrion_reply_cache.json"
+VECTORS_FILE = "azrion_vectors.f32"
+TTS_CACHE_DIR = "azrion_tts_cache"
+FILE_INDEX_FILE = "azrion_files.idx"
 
 # --- SYSTEM PROMPT (required for context) ---
 SYSTEM_PROMPT = """
@@ -20,16 +45,95 @@ Do NOT generate long paragraphs unless required.
 """
 
 # --- TUNABLES ---
-SHORT_TERM_LIMIT = 12   # number of recent messages to send to the model (keeps replies fast)
+SHORT_TERM_LIMIT = 12   # recent messages kept in history; CONTEXT_TOKEN_BUDGET picks how many are sent
 TYPE_DELAY = 0.005      # typing delay per character (seconds); increase to slow typing
+STREAM_REPLIES = True   # show model tokens as they arrive (no fake typing delay)
+CHAT_MODEL = "llama3.1:latest"
+FAST_MODEL = None       # small pulled model for greetings / chit-chat, e.g. "llama3.2:1b" (None = everything goes to CHAT_MODEL)
+ROUTE_MAX_WORDS = 8     # inputs longer than this always go to CHAT_MODEL
+ROUTE_SLOW_SECONDS = 3.0   # a model whose recent time-to-first-token averages above this counts as slow
+OLLAMA_HOST = None      # None = $OLLAMA_HOST or the local default
+OLLAMA_KEEP_ALIVE = "30m"  # how long Ollama keeps the model loaded after a request (-1 = forever)
+OLLAMA_IDLE_UNLOAD = None  # seconds without a turn before we ask Ollama to unload (None = never)
+WARMUP_ON_GREETING = True  # load the model in the background while the greeting is shown
+COLD_LOAD_SECONDS = 0.5    # a turn whose model load took longer than this counts as cold
+CONTEXT_TOKEN_BUDGET = 1500  # estimated tokens of recent messages sent with each turn
+CONTEXT_MAX_MESSAGE_TOKENS = 400  # a single longer message (pasted trace, run: output) is clipped
+ROLLING_SUMMARY = True  # fold messages that leave the window into a running summary (background)
+SUMMARY_MIN_PENDING = 4 # fold once at least this many messages have left the window
+SUMMARY_CHUNK_TOKENS = 1500  # max estimated tokens of new messages folded per summary call
+SUMMARY_MAX_WORDS = 120 # target length of the running summary
+SUMMARY_IDLE_SECONDS = 30  # the summarizer only calls the model after this long without a turn
+PROMPT_CHECKPOINT_KEEP = 0.5  # share of CONTEXT_TOKEN_BUDGET the window keeps when it is re-anchored
+RECALL = True           # add similar past exchanges from full_history to the prompt (needs numpy)
+RECALL_TOP_K = 3        # messages retrieved per turn (each brings its user/assistant partner)
+RECALL_MIN_SCORE = 0.5  # cosine similarity below this is not worth the prompt space
+RECALL_MAX_CHARS = 300  # recalled messages are clipped to this many characters
+EMBED_MODEL = "hash"    # "hash" = built-in stand-in, no model needed; or an Ollama embedding model ("nomic-embed-text")
+RECALL_FAILURE_BACKOFF = 600  # seconds recall is skipped after an embedding call failed (model not pulled, Ollama down)
+EMBED_BATCH = 32        # messages per embedding request while catching up
+RECALL_COARSE_DIMS = 64 # leading dimensions scanned first, then the best candidates are reranked (0 = exact scan);
+                        # only used with MATRYOSHKA_MODELS, whose leading dimensions carry most of the meaning
+MATRYOSHKA_MODELS = ("nomic-embed-text", "mxbai-embed-large")
+REPLY_CACHE = False     # reuse model replies for repeated short inputs ("hey", "huh") in the same context
+REPLY_CACHE_SIZE = 256  # max cached replies (least recently used are dropped)
+REPLY_CACHE_TTL = 6 * 3600  # seconds a cached reply stays valid
+REPLY_CACHE_CONTEXT = 2 # previous messages that must match too (0 = ignore context)
+REPLY_CACHE_MAX_WORDS = 4   # only inputs this short are cached
+REPLY_CACHE_PERSIST = True  # keep the cache in REPLY_CACHE_FILE between runs
+MEMORY_BACKEND = "journal"  # "journal" (MEMORY_FILE + JOURNAL_FILE), "sqlite" (SQLITE_FILE, lazy) or "json" (full rewrite)
+JOURNAL_COMPACT_EVERY = 200  # journal records before they are folded back into MEMORY_FILE
+ARCHIVE_SEGMENTS = True # journal backend: keep full_history in compressed segments under ARCHIVE_DIR
+ARCHIVE_SEGMENT_SIZE = 1000  # messages per archive segment
+INDEX_SAVE_EVERY = 200  # newly indexed messages before the search index is rewritten to INDEX_FILE
+SAVE_IN_BACKGROUND = True  # write memory on a background thread (after the reply is shown)
+SAVE_DEBOUNCE = 0.5     # seconds of quiet before a background save; bursts become one write
+SAVE_MAX_DELAY = 5.0    # ...but never hold unsaved changes longer than this
+TOP_TOPICS = 5          # most frequent words listed as "Top topics" in the context summary
+STATS_CAPACITY = 2000   # max distinct words kept in stats (Space-Saving sketch); None = unbounded dict
+STATS_MIN_WORD_LEN = 3  # shorter words (and STOPWORDS) are not counted as topics
+FILE_INDEX = True       # answer "search files for" from an index of FILE_INDEX_ROOT (False = run fd every time)
+FILE_INDEX_ROOT = "~"
+FILE_INDEX_REFRESH = 300   # seconds between background refreshes (only changed directories are re-listed)
+FILE_INDEX_HIDDEN = False  # also index dot-files / dot-directories (fd skips them too)
+FILE_INDEX_EXCLUDE = ["node_modules", "__pycache__"]
+FILE_SEARCH_PAGE = 30   # paths shown per "search files for" answer
+TTS_PERSISTENT = True   # keep one piper process + one audio player running (False = new piper + WAV file per reply)
+TTS_CACHE = True        # keep synthesized sentences (raw PCM) so recurring lines play instantly
+TTS_CACHE_MB = 64       # size bound of TTS_CACHE_DIR (least recently spoken files go first)
+TTS_PIPELINE_DEPTH = 2  # synthesized sentences allowed to wait for the player (the next one renders while one plays)
+COMMAND_TIMEOUT = 30    # seconds before a system command (playerctl, trash, fd...) is killed
+COMMAND_MAX_OUTPUT = 64 * 1024  # characters of a command's output that are kept
+RUN_WAIT = 10           # seconds a "run:" reply waits for its command (streaming its output) before leaving it in the background
+RUN_TIMEOUT = 600       # "run:" commands are killed after this many seconds
+SYSMON = True           # answer "show cpu / ram / disk" from /proc with a background sampler (False = top / free / df)
+SYSMON_INTERVAL = 2.0   # seconds between CPU / memory samples (processes every SYSMON_PROC_INTERVAL)
+SYSMON_PROC_INTERVAL = 5.0
+SYSMON_WINDOW = 60      # seconds the "avg" numbers cover
+SYSMON_TOP = 5          # processes listed with the CPU / RAM answers
+METRICS = False         # time every stage of a turn (stats, system_action, llm, save, tts...); see metrics.report()
+METRICS_WINDOW = 1000   # recent samples per stage kept for percentiles
+METRICS_EXPORT = None   # e.g. "azrion_metrics.prom" (Prometheus text) or "azrion_turns.jsonl"; written with each save
+PROFILE_SLOWEST = 0     # keep cProfile + tracemalloc reports of the N slowest turns (slows every turn; 0 = off)
+PROFILE_DIR = "azrion_profiles"
 # -----------------
 
+# --- METRICS (per-stage timing; spans are no-ops while METRICS is off) ---
+metrics = Metrics(enabled=METRICS, window=METRICS_WINDOW, profile_slowest=PROFILE_SLOWEST,
+                  profile_dir=PROFILE_DIR)
+if METRICS and METRICS_EXPORT:
+    atexit.register(lambda: metrics.export(METRICS_EXPORT))
+
 # --- LOAD OR INITIALIZE MEMORY ---
-try:
-    with open(MEMORY_FILE, "r") as f:
-        memory = json.load(f)
-except FileNotFoundError:
-    memory = {
+def _is_topic_word(word):
+    return len(word) >= STATS_MIN_WORD_LEN and word not in STOPWORDS
+
+def _stats_sketch(raw=None):
+    # bounded stats; also migrates an old unbounded {word: count} dict
+    return SpaceSaving.from_json(raw, STATS_CAPACITY, keep=_is_topic_word)
+
+def _empty_memory():
+    return {
         "history": [],        # short-term recent messages (trimmed to SHORT_TERM_LIMIT)
         "full_history": [],   # full archive (searchable)
         "habits": {},         # track daily activities, keywords
@@ -40,9 +144,60 @@ except FileNotFoundError:
             "liked_schools": [],
             "favorite_philosophers": [],
             "favorite_quotes": []
-        }
+        },
+        "rolling_summary": None,  # {"text", "upto", "anchor", "pinned"}: see build_context_window
     }
 
+def _fold_journal_into_json():
+    """
+    Back to the "json" backend after the journal one ran: its snapshot lacks
+    full_history (in ARCHIVE_DIR) and the newest changes (in JOURNAL_FILE).
+    Write them all into MEMORY_FILE once, then set the journal files aside
+    (renamed, not deleted) so they are not applied twice.
+    """
+    archive = SegmentedArchive(ARCHIVE_DIR) if os.path.isdir(ARCHIVE_DIR) else None
+    old = JournalStore(MEMORY_FILE, JOURNAL_FILE, archive=archive,
+                       stats_factory=_stats_sketch if STATS_CAPACITY else TrackedDict).load(_empty_memory())
+    data = dict(old)
+    data["full_history"] = list(old["full_history"])
+    if hasattr(data["stats"], "to_json"):
+        data["stats"] = data["stats"].to_json()
+    else:
+        data["stats"] = dict(data["stats"])
+    write_json_atomic(MEMORY_FILE, data)
+    suffix = datetime.now().strftime(".folded-%Y%m%d-%H%M%S")
+    for path in (JOURNAL_FILE, ARCHIVE_DIR):
+        if os.path.exists(path):
+            os.replace(path, path + suffix)
+
+if MEMORY_BACKEND == "sqlite":
+    # full_history / stats / tasks are read from the DB on demand, not loaded here.
+    # The first run imports MEMORY_FILE (+ journal and ARCHIVE_DIR) once.
+    _store = SQLiteStore(SQLITE_FILE, history_limit=SHORT_TERM_LIMIT)
+    _old_archive = SegmentedArchive(ARCHIVE_DIR) if os.path.isdir(ARCHIVE_DIR) else None
+    memory = _store.load(_empty_memory(), json_path=MEMORY_FILE, journal_path=JOURNAL_FILE,
+                         archive=_old_archive,
+                         stats_sketch=_stats_sketch() if STATS_CAPACITY else None,
+                         stats_factory=_stats_sketch if STATS_CAPACITY else None)
+elif MEMORY_BACKEND == "journal":
+    # snapshot + replay of everything journaled since the last compaction;
+    # full_history goes to the segmented archive (moved there on first run)
+    _archive = SegmentedArchive(ARCHIVE_DIR, segment_size=ARCHIVE_SEGMENT_SIZE) if ARCHIVE_SEGMENTS else None
+    _store = JournalStore(MEMORY_FILE, JOURNAL_FILE, compact_every=JOURNAL_COMPACT_EVERY, archive=_archive,
+                          stats_factory=_stats_sketch if STATS_CAPACITY else TrackedDict)
+    memory = _store.load(_empty_memory())
+else:
+    _store = None
+    if os.path.exists(JOURNAL_FILE) or os.path.isdir(ARCHIVE_DIR):
+        _fold_journal_into_json()
+    try:
+        with open(MEMORY_FILE, "r") as f:
+            memory = json.load(f)
+    except FileNotFoundError:
+        memory = _empty_memory()
+    if STATS_CAPACITY:
+        memory["stats"] = _stats_sketch(memory.get("stats"))
+
 # Ensure fields exist (in case old memory file is missing some keys)
 memory.setdefault("history", [])
 memory.setdefault("full_history", [])
@@ -51,11 +206,74 @@ memory.setdefault("preferences", {})
 memory.setdefault("stats", {})
 memory.setdefault("tasks", [])
 memory.setdefault("philosophy", {"liked_schools": [], "favorite_philosophers": [], "favorite_quotes": []})
+if not memory.get("rolling_summary"):
+    # start summarizing from the current window on; never re-read the whole archive
+    memory["rolling_summary"] = {"text": "", "upto": len(memory["full_history"]) - len(memory["history"])}
+memory["rolling_summary"].setdefault("anchor", memory["rolling_summary"]["upto"])
+memory["rolling_summary"].setdefault("pinned", memory["rolling_summary"]["text"])
+
+# --- TOP TOPICS (kept up to date by update_stats instead of re-sorting all stats every turn) ---
+_top_topics = TopK.from_counts(memory["stats"], TOP_TOPICS)
+_context_summary = None   # cached summarize_context() text; None = needs rebuilding
+
+# --- SEARCH INDEX over full_history (only messages newer than the saved index get tokenized) ---
+_history_index = HistoryIndex(INDEX_FILE)
+_history_index.load()
+_history_index.catch_up(memory["full_history"])
+
+def _save_index_on_exit():
+    with memory_lock:
+        if _history_index.dirty:
+            _history_index.save()
+
+atexit.register(_save_index_on_exit)
+
+# --- REPLY CACHE (opt-in) ---
+reply_cache = ReplyCache(REPLY_CACHE_SIZE, REPLY_CACHE_TTL,
+                         path=REPLY_CACHE_FILE if REPLY_CACHE_PERSIST else None) if REPLY_CACHE else None
 
 # --- UTILITIES ---
+# Held while memory (and the search index) is being changed or written, so the
+# background writer never saves a half-updated turn.
+memory_lock = threading.RLock()
+
+def _write_memory():
+    with metrics.span("persist"):
+        _write_memory_now()
+    if METRICS and METRICS_EXPORT:
+        metrics.export(METRICS_EXPORT)
+
+def _write_memory_now():
+    with memory_lock:
+        if _store is not None:
+            # journal: only this turn's changes are appended; sqlite: commit the turn
+            _store.save(memory)
+        else:
+            data = dict(memory)
+            if isinstance(data["stats"], SpaceSaving):
+                data["stats"] = data["stats"].to_json()
+            write_json_atomic(MEMORY_FILE, data)
+        if _history_index.dirty >= INDEX_SAVE_EVERY:
+            _history_index.save()
+    if reply_cache is not None and reply_cache.dirty:
+        reply_cache.save()
+
+_writer = PersistenceWorker(_write_memory, debounce=SAVE_DEBOUNCE, max_delay=SAVE_MAX_DELAY) \
+    if SAVE_IN_BACKGROUND else None
+if _writer is not None:
+    atexit.register(_writer.stop)   # runs before _save_index_on_exit (atexit is LIFO)
+
 def save_memory():
-    with open(MEMORY_FILE, "w") as f:
-        json.dump(memory, f, indent=4)
+    """Persist memory: queued for the background writer, or written right away."""
+    if _writer is not None:
+        _writer.notify()
+    else:
+        _write_memory()
+
+def archive_message(msg):
+    """Append a message to full_history and index it for search."""
+    memory["full_history"].append(msg)
+    _history_index.add(len(memory["full_history"]) - 1, msg.get("content", ""))
 
 def type_out(text, delay=TYPE_DELAY):
     """Print text with a typing animation."""
@@ -65,81 +283,165 @@ def type_out(text, delay=TYPE_DELAY):
         time.sleep(delay)
     print()  # final newline
 
+# --- REPLY SINKS (where streamed reply text goes) ---
+# A sink gets write(text) for every chunk as it arrives and end() once the
+# reply (including any push text / quote) is complete.
+class StdoutSink:
+    """Print chunks straight to the console."""
+    def write(self, text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    def end(self):
+        print()
+
+class CallbackSink:
+    """Hand chunks to a function, e.g. a Qt signal's emit."""
+    def __init__(self, on_text, on_end=None):
+        self.on_text = on_text
+        self.on_end = on_end
+
+    def write(self, text):
+        self.on_text(text)
+
+    def end(self):
+        if self.on_end:
+            self.on_end()
+
+# also after an emoji when a new sentence starts: most fixed lines end in one instead of
+# punctuation, and the greeting strings them together ("…so are you 😌 Back to coding huh?")
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…])\s+|\n+|(?<=[\u2600-\u27bf\ufe0f\U0001f000-\U0001faff])\s+(?=[A-Z])")
+
+def split_sentences(text):
+    """The sentences SentenceSink would pass on for text."""
+    return [part.strip() for part in SENTENCE_BOUNDARY.split(text) if part.strip()]
+
+class SentenceSink:
+    """Buffer chunks and pass on whole sentences (for speaking while the model still writes)."""
+    _boundary = SENTENCE_BOUNDARY
+
+    def __init__(self, on_sentence):
+        self.on_sentence = on_sentence
+        self.buffer = ""
+
+    def write(self, text):
+        self.buffer += text
+        parts = self._boundary.split(self.buffer)
+        self.buffer = parts.pop()
+        for sentence in parts:
+            if sentence.strip():
+                self.on_sentence(sentence.strip())
+
+    def end(self):
+        if self.buffer.strip():
+            self.on_sentence(self.buffer.strip())
+        self.buffer = ""
+
+class TeeSink:
+    """Send the same reply to several sinks (e.g. console + voice)."""
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, text):
+        for sink in self.sinks:
+            sink.write(text)
+
+    def end(self):
+        for sink in self.sinks:
+            sink.end()
+
+def _deliver(text, sink):
+    """Show a finished reply: through the sink, or with the typing effect."""
+    if sink is None:
+        type_out(text)
+    else:
+        sink.write(text)
+        sink.end()
+
 # --- GREETING + FLIRTY HABIT SUGGESTIONS ---
+# (first hour, last hour + 1, lines); anything outside these is night
+TIME_GREETINGS = [
+    (5, 12, [
+        "Mornin’, sunshine 🌞 ready to crush bugs or dive into philosophy?",
+        "Good morning, cutie 😴☕ let's code or question reality?",
+        "Yo, you awake? Perfect time for some mind-bending thoughts 😏",
+        "Morning! Ready to flirt with logic AND me? 😆"
+    ]),
+    (12, 17, [
+        "Afternoon, genius ☕ fancy a coding spree or an anime break?",
+        "Yo afternoon champ 😎 let's make some chaos with code or ideas!",
+        "Good afternoon! Let's ponder life and roast bugs together 😌",
+        "Afternoon vibes… and you look hot thinking 😏"
+    ]),
+    (17, 21, [
+        "Evening, handsome 🌆 coding + philosophy session, or just me?",
+        "Good evening! Time for existential crises & anime discussions 😏",
+        "Yo evening brainiac, let's debate existence & hot takes 😎",
+        "Evening vibes activated, and so are you 😌"
+    ]),
+]
+NIGHT_GREETINGS = [
+    "Late night? Damn, mysterious AND cute 🌙",
+    "Night owl mode ON 🦉✨ ready to think or procrastinate?",
+    "It’s midnight… let's question life and crush some bugs 😏",
+    "Burning the night candle? I like that naughty dedication 😌"
+]
+
+# Habit-based suggestions (short), in the order they are added
+HABIT_GREETINGS = {
+    "coding": [
+        "Back to coding huh? Don’t break the keyboard 😏",
+        "Bug-fighting hero returns… kinda hot tbh 😌",
+        "Code session again? I approve 😎",
+    ],
+    "anime": [
+        "Anime binge? You always pick the best ones 😏",
+        "Time for cute characters or me? 😌",
+    ],
+    "study": [
+        "Studying like a nerdy hottie 😎 keep it up!",
+        "Books before me? I forgive, but just barely 😏",
+    ],
+    "movie": [
+        "Movie mood? Save a seat for me 😌🎬",
+        "Cinema vibes activated… let's critique like philosophers 😏",
+    ],
+}
+
+FLIRT_EMOJIS = ["😉", "😏", "😘", "😎", "👀", "🤭", "💋"]
+
+# Philosophical/random mood lines (only one will trigger)
+PHILOSOPHY_GREETINGS = [
+    "Feeling absurd today? Camus would be proud 😏 👀",
+    "Ever wonder if life is just a cosmic bug we keep debugging? 😌",
+    "Kafka vibes activated… embrace the chaos 😏",
+    "Nihilism check: nothing matters but you're still cute 😎",
+    "Existential crisis speedrun% any%? I'm here for it 😉"
+]
+
 def get_ai_greeting():
+    # start loading the model now; it's ready by the time the user has read this
+    if WARMUP_ON_GREETING:
+        warmup_model()
+        if FAST_MODEL:
+            warmup_model(FAST_MODEL)
     hour = datetime.now().hour
 
     # Time-based greeting
-    if 5 <= hour < 12:
-        time_greeting = random.choice([
-            "Mornin’, sunshine 🌞 ready to crush bugs or dive into philosophy?",
-            "Good morning, cutie 😴☕ let's code or question reality?",
-            "Yo, you awake? Perfect time for some mind-bending thoughts 😏",
-            "Morning! Ready to flirt with logic AND me? 😆"
-        ])
-    elif 12 <= hour < 17:
-        time_greeting = random.choice([
-            "Afternoon, genius ☕ fancy a coding spree or an anime break?",
-            "Yo afternoon champ 😎 let's make some chaos with code or ideas",
-            "Good afternoon! Let's ponder life and roast bugs together 😌",
-            "Afternoon vibes… and you look hot thinking 😏"
-        ])
-    elif 17 <= hour < 21:
-        time_greeting = random.choice([
-            "Evening, handsome 🌆 coding + philosophy session, or just me?",
-            "Good evening! Time for existential crises & anime discussions 😏",
-            "Yo evening brainiac, let's debate existence & hot takes 😎",
-            "Evening vibes activated, and so are you 😌"
-        ])
-    else:
-        time_greeting = random.choice([
-            "Late night? Damn, mysterious AND cute 🌙",
-            "Night owl mode ON 🦉✨ ready to think or procrastinate?",
-            "It’s midnight… let's question life and crush some bugs 😏",
-            "Burning the night candle? I like that naughty dedication 😌"
-        ])
+    time_greeting = random.choice(next((lines for start, end, lines in TIME_GREETINGS
+                                        if start <= hour < end), NIGHT_GREETINGS))
 
     # Habit-based suggestions (short)
     recent_habits = memory.get("habits", {})
-    habit_comments = []
-
-    if "coding" in recent_habits:
-        habit_comments.append(random.choice([
-            "Back to coding huh? Don’t break the keyboard 😏",
-            "Bug-fighting hero returns… kinda hot tbh 😌",
-            "Code session again? I approve 😎",
-        ]))
-    if "anime" in recent_habits:
-        habit_comments.append(random.choice([
-            "Anime binge? You always pick the best ones 😏",
-            "Time for cute characters or me? 😌",
-        ]))
-    if "study" in recent_habits:
-        habit_comments.append(random.choice([
-            "Studying like a nerdy hottie 😎 keep it up!",
-            "Books before me? I forgive, but just barely 😏",
-        ]))
-    if "movie" in recent_habits:
-        habit_comments.append(random.choice([
-            "Movie mood? Save a seat for me 😌🎬",
-            "Cinema vibes activated… let's critique like philosophers 😏",
-        ]))
+    habit_comments = [random.choice(lines) for habit, lines in HABIT_GREETINGS.items()
+                      if habit in recent_habits]
 
     habit_text = " ".join(habit_comments) if habit_comments else ""
 
-    flirt_text = random.choice(["😉", "😏", "😘", "😎", "👀", "🤭", "💋"])
-
-    # Philosophical/random mood lines (only one will trigger)
-    philosophy_lines = [
-        "Feeling absurd today? Camus would be proud 😏 👀",
-        "Ever wonder if life is just a cosmic bug we keep debugging? 😌",
-        "Kafka vibes activated… embrace the chaos 😏",
-        "Nihilism check: nothing matters but you're still cute 😎",
-        "Existential crisis speedrun% any%? I'm here for it 😉"
-    ]
+    flirt_text = random.choice(FLIRT_EMOJIS)
 
     # Choose EITHER time greeting OR a philosophical one — not both
-    greeting_choice = random.choice([time_greeting, random.choice(philosophy_lines)])
+    greeting_choice = random.choice([time_greeting, random.choice(PHILOSOPHY_GREETINGS)])
 
     # Build final greeting (habit_text optional)
     if habit_text:
@@ -147,58 +449,93 @@ def get_ai_greeting():
     else:
         return f"{greeting_choice} {flirt_text}"
 
+# --- KEYWORD MATCHING (every keyword list below is compiled into one automaton) ---
+# Register with keywords.add(word, (group, name)); scan_message() then finds all
+# of them in a single pass over the lower-cased message, however many there are.
+keywords = KeywordMatcher()
+_last_scan = (None, None)
+
+def scan_message(user_input):
+    """Keyword matches of user_input (the last message's result is reused)."""
+    global _last_scan
+    text, matches = _last_scan
+    if text != user_input or matches is None:
+        matches = keywords.scan(user_input.lower().strip())
+        _last_scan = (user_input, matches)
+    return matches
+
 # --- FLIRTY / MOTIVATIONAL / ROAST RESPONSES ---
-def ai_react_to_user_message(msg):
-    msg_lower = msg.lower()
-    push_msgs = []
-    
+MOOD_WORDS = [
+    ("lazy", ["lazy", "tired", "procrastinate"]),
+    ("stuck", ["stuck", "bug", "error"]),
+    ("down", ["fail", "lost", "can't"]),
+]
+for _mood, _words in MOOD_WORDS:
+    for _word in _words:
+        keywords.add(_word, ("mood", _mood))
+
+PUSH_MESSAGES = {
     # Motivation / roasting
-    if any(word in msg_lower for word in ["lazy", "tired", "procrastinate"]):
-        push_msgs = [
-            "Lazy? Not on my watch 😏 Get up and fix that bug!",
-            "Tired? Pff, you look fine to me, now go smash some code 😌",
-            "Procrastinating again? That's cute… but annoying 😏"
-        ]
-    elif any(word in msg_lower for word in ["stuck", "bug", "error"]):
-        push_msgs = [
-            "Stuck huh? Let's solve it before I roast you 😎",
-            "Another bug? I swear, you do this on purpose 😏",
-            "Errors are cute when you fix them 😌"
-        ]
-    elif any(word in msg_lower for word in ["fail", "lost", "can't"]):
-        push_msgs = [
-            "Can't? You mean won't? 😏 Let's try again, genius.",
-            "Failure is just a word… and you don’t give up 😌",
-            "Lost? I’ll guide you… but only if you admit I’m right 😎"
-        ]
-    else:
-        push_msgs = [
-            "I hear you, darling 😏",
-            "Tell me more, I’m all ears 😌",
-            "Interesting… continue, cutie 😎",
-            "Hmmm, I see. Careful, I might flirt back 😏"
-        ]
-    
-    return random.choice(push_msgs)
+    "lazy": [
+        "Lazy? Not on my watch 😏 Get up and fix that bug!",
+        "Tired? Pff, you look fine to me, now go smash some code 😌",
+        "Procrastinating again? That's cute… but annoying 😏"
+    ],
+    "stuck": [
+        "Stuck huh? Let's solve it before I roast you 😎",
+        "Another bug? I swear, you do this on purpose 😏",
+        "Errors are cute when you fix them 😌"
+    ],
+    "down": [
+        "Can't? You mean won't? 😏 Let's try again, genius.",
+        "Failure is just a word… and you don’t give up 😌",
+        "Lost? I’ll guide you… but only if you admit I’m right 😎"
+    ],
+    None: [
+        "I hear you, darling 😏",
+        "Tell me more, I’m all ears 😌",
+        "Interesting… continue, cutie 😎",
+        "Hmmm, I see. Careful, I might flirt back 😏"
+    ],
+}
+
+def detect_mood(msg):
+    """"lazy", "stuck", "down" or None (first matching group wins)."""
+    found = scan_message(msg).names("mood")
+    for mood, _ in MOOD_WORDS:
+        if mood in found:
+            return mood
+    return None
+
+def ai_react_to_user_message(msg):
+    return random.choice(PUSH_MESSAGES[detect_mood(msg)])
 
 # --- PHILOSOPHY TRACKING (keeps memory of liked schools / quotes) ---
-def track_philosophy(user_input):
-    schools = ["existentialism", "absurdism", "nihilism", "stoicism", "stoic", "existentialist", "absurdist", "nihilist"]
-    philosophers = ["camus", "nietzsche", "kierkegaard", "sartre", "dostoevsky", "epictetus", "seneca", "marcus aurelius", "plato", "aristotle"]
-    msg = user_input.lower()
+PHILOSOPHY_SCHOOLS = ["existentialism", "absurdism", "nihilism", "stoicism", "stoic", "existentialist", "absurdist", "nihilist"]
+PHILOSOPHERS = ["camus", "nietzsche", "kierkegaard", "sartre", "dostoevsky", "epictetus", "seneca", "marcus aurelius", "plato", "aristotle"]
+for _name in PHILOSOPHY_SCHOOLS:
+    keywords.add(_name, ("school", _name))
+for _name in PHILOSOPHERS:
+    keywords.add(_name, ("philosopher", _name))
 
-    for s in schools:
-        if s in msg and s not in memory["philosophy"]["liked_schools"]:
-            memory["philosophy"]["liked_schools"].append(s)
-    for p in philosophers:
-        if p in msg and p not in memory["philosophy"]["favorite_philosophers"]:
-            memory["philosophy"]["favorite_philosophers"].append(p)
+def track_philosophy(user_input):
+    matches = scan_message(user_input)
+
+    # list order, not match order, so memory fills up the same way as always
+    if matches.any("school"):
+        for s in PHILOSOPHY_SCHOOLS:
+            if matches.has("school", s) and s not in memory["philosophy"]["liked_schools"]:
+                memory["philosophy"]["liked_schools"].append(s)
+    if matches.any("philosopher"):
+        for p in PHILOSOPHERS:
+            if matches.has("philosopher", p) and p not in memory["philosophy"]["favorite_philosophers"]:
+                memory["philosophy"]["favorite_philosophers"].append(p)
 
     # Detect and save quoted lines if user provides them using quotes (“ ”)
     if "“" in user_input and "”" in user_input:
         try:
             quote_text = user_input.split("“")[1].split("”")[0]
-            philosopher = random.choice(philosophers).title()
+            philosopher = random.choice(PHILOSOPHERS).title()
             memory["philosophy"]["favorite_quotes"].append((philosopher, quote_text))
         except Exception:
             pass
@@ -221,60 +558,109 @@ def get_philosophy_quote():
 
 # --- MEMORY HELPERS (stats / habits) ---
 def update_stats(user_input):
+    global _context_summary, _top_topics
+    stats = memory["stats"]
     words = [w.lower() for w in user_input.split() if w.isalpha()]
     for word in words:
-        memory["stats"][word] = memory["stats"].get(word, 0) + 1
+        if not _is_topic_word(word):
+            continue
+        if isinstance(stats, SpaceSaving):
+            count = stats.add(word)
+            if stats.evicted in _top_topics.counts:
+                # only happens while the sketch is nearly empty; just re-seed
+                _top_topics = TopK.from_counts(stats, TOP_TOPICS)
+                _context_summary = None
+        else:
+            count = stats.get(word, 0) + 1
+            stats[word] = count
+        if _top_topics.update(word, count):
+            _context_summary = None
+
+HABIT_KEYWORDS = ["study", "work", "sleep", "music", "exercise", "code", "coding", "anime", "movie"]
+for _name in HABIT_KEYWORDS:
+    keywords.add(_name, ("habit", _name))
 
 def track_habits(user_input):
-    keywords = ["study", "work", "sleep", "music", "exercise", "code", "coding", "anime", "movie"]
-    for kw in keywords:
-        if kw in user_input.lower():
+    global _context_summary
+    found = scan_message(user_input).names("habit")
+    for kw in HABIT_KEYWORDS:
+        if kw in found:
             memory["habits"][kw] = memory["habits"].get(kw, 0) + 1
+            _context_summary = None
 
 def summarize_context():
-    top_words = Counter(memory["stats"]).most_common(5)
-    top_words_str = ", ".join([w for w, _ in top_words])
-    habits_str = ", ".join([f"{k}:{v}" for k, v in memory["habits"].items()])
-    return f"Top topics: {top_words_str}. Habits: {habits_str}."
+    global _context_summary
+    if _context_summary is None:
+        top_words_str = ", ".join(_top_topics.words())
+        habits_str = ", ".join([f"{k}:{v}" for k, v in memory["habits"].items()])
+        _context_summary = f"Top topics: {top_words_str}. Habits: {habits_str}."
+    return _context_summary
 
 # --- TASK / REMINDER SYSTEM ---
 def add_task(task_desc):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    memory["tasks"].append({"description": task_desc, "status": "pending", "time": timestamp})
+    with memory_lock:
+        memory["tasks"].append({"description": task_desc, "status": "pending", "time": timestamp})
     save_memory()
 
 def complete_task(task_desc):
-    for t in memory.get("tasks", []):
-        if task_desc.lower() in t["description"].lower():
-            t["status"] = "done"
+    with memory_lock:
+        for t in memory.get("tasks", []):
+            if task_desc.lower() in t["description"].lower():
+                t["status"] = "done"
     save_memory()
 
+TASK_REMINDERS = [
+    "Hey, you didn’t finish '{task}' 😏 Let's pick up where we left off.",
+    "Don’t be a pussy 😎 Finish '{task}' already!",
+    "Come on, genius, '{task}' isn’t done yet. Do what must be done 😌",
+    "Your code awaits 😏 Stop procrastinating and tackle '{task}'."
+]
+
 def check_pending_tasks():
     pending = [t for t in memory.get("tasks", []) if t["status"] == "pending"]
     if not pending:
         return ""
     task = random.choice(pending)
-    reminders = [
-        f"Hey, you didn’t finish '{task['description']}' 😏 Let's pick up where we left off.",
-        f"Don’t be a pussy 😎 Finish '{task['description']}' already!",
-        f"Come on, genius, '{task['description']}' isn’t done yet. Do what must be done 😌",
-        f"Your code awaits 😏 Stop procrastinating and tackle '{task['description']}'."
-    ]
-    return random.choice(reminders)
+    return random.choice(TASK_REMINDERS).format(task=task["description"])
 
 # --- SEARCH FULL HISTORY (on-demand)
-def search_full_history(query):
-    """Return matching full_history entries that contain the query (case-insensitive)."""
-    q = query.lower().strip()
+def search_full_history(query, limit=None, rank="recent"):
+    """
+    Return full_history entries containing every word of the query (case-insensitive).
+    Use "quotes" for an exact phrase. rank="recent" (newest first) or "relevance".
+    Stops once `limit` results are found; previews are only built for those.
+    """
+    with memory_lock:
+        hits = _history_index.search(query, memory["full_history"], limit=limit, rank=rank)
     results = []
-    for entry in memory.get("full_history", []):
+    for _, entry in hits:
         content = entry.get("content", "")
-        if q in content.lower():
-            # show timestamp + a short preview
-            preview = content if len(content) < 200 else content[:197] + "..."
-            results.append(f"[{entry.get('time','?')}] {preview}")
+        # show timestamp + a short preview
+        preview = content if len(content) < 200 else content[:197] + "..."
+        results.append(f"[{entry.get('time','?')}] {preview}")
     return results
 
+def export_full_history(path, start_time=None, end_time=None):
+    """
+    Write full_history (optionally only [start_time, end_time], "%Y-%m-%d %H:%M:%S")
+    to `path` as JSON lines. Streams, so the archive is never loaded at once.
+    Returns the number of messages written.
+    """
+    full_history = memory["full_history"]
+    if hasattr(full_history, "iter_range"):
+        entries = full_history.iter_range(start_time, end_time)
+    else:
+        entries = (e for e in full_history
+                   if (start_time is None or e.get("time", "") >= start_time)
+                   and (end_time is None or e.get("time", "") <= end_time))
+    count = 0
+    with open(path, "w") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+            count += 1
+    return count
+
 def _prepare_tts_text(text: str) -> str:
     """
     Clean LLM text for speaking:
@@ -300,44 +686,132 @@ def _prepare_tts_text(text: str) -> str:
     return text.strip()
 
 
+PIPER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "piper", "piper")
+PIPER_BIN = os.path.join(PIPER_DIR, "piper")
+PIPER_MODEL = os.path.join(PIPER_DIR, "en_US-kathleen-low.onnx")
+
+# piper stays loaded between replies; audio goes to one paplay/aplay through a pipe
+tts_engine = PiperEngine(PIPER_BIN, PIPER_MODEL)
+tts_player = RawPlayer(tts_engine.sample_rate)
+atexit.register(tts_player.close)
+atexit.register(tts_engine.close)
+# keyed by voice + cleaned text, so anything said before (greetings, confirmations) skips piper
+tts_cache = AudioCache(TTS_CACHE_DIR, TTS_CACHE_MB * 1024 * 1024, voice_id(PIPER_MODEL))
+
+def synthesize(clean):
+    """PCM (s16le mono, tts_engine.sample_rate) for already-cleaned text; None if piper is unavailable."""
+    if not TTS_PERSISTENT:
+        return None
+    if TTS_CACHE:
+        pcm = tts_cache.get(clean)
+        if pcm is not None:
+            return pcm
+    with metrics.span("tts_synth"):
+        pcm = tts_engine.synthesize(clean)
+    if pcm and TTS_CACHE:
+        tts_cache.put(clean, pcm)
+    return pcm
+
+def play(pcm):
+    """Play PCM from synthesize(); returns once it has been heard (False if stopped)."""
+    with metrics.span("tts_play"):
+        return tts_player.play(pcm)
+
+def _synthesize_sentence(sentence):
+    clean = _prepare_tts_text(sentence)
+    return synthesize(clean) if clean else b""
+
+def _say_sentence_once(sentence):
+    _say_once(_prepare_tts_text(sentence))
+
+# sentence N+1 is synthesized while N plays; without persistent piper each sentence goes through _say_once
+speech = SpeechPipeline(_synthesize_sentence, play, tts_player.stop,
+                        depth=TTS_PIPELINE_DEPTH, fallback=_say_sentence_once)
+
+def speak(text):
+    """Queue text for speaking, sentence by sentence, and return at once (SentenceSink(speak) for streamed replies)."""
+    for sentence in split_sentences(text or ""):
+        speech.speak(sentence)
+
 def say(text):
-    """Speak Azrion's reply using Piper TTS (WAV -> paplay)."""
+    """Speak Azrion's reply using Piper TTS and wait until it has been heard."""
     if not text:
         return
-
-    clean = _prepare_tts_text(text)
-    if not clean:
+    if not TTS_PERSISTENT:
+        # one piper run for the whole reply beats one per sentence
+        clean = _prepare_tts_text(text)
+        if clean:
+            _say_once(clean)
         return
 
-    #print(f"[TTS INPUT] {clean!r}")  # DEBUG: what we send to Piper
+    #print(f"[TTS INPUT] {text!r}")  # DEBUG: what we send to Piper
 
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    piper_dir = os.path.join(base_dir, "piper", "piper")
-    piper_bin = os.path.join(piper_dir, "piper")
-    model_path = os.path.join(piper_dir, "en_US-kathleen-low.onnx")
+    speak(text)
+    speech.wait()
 
+def stop_speaking():
+    """Drop whatever is queued for speaking and cut the current sentence short."""
+    speech.interrupt()
+
+def static_phrases():
+    """Every fixed line Azrion speaks, plus the reminders for the tasks pending right now."""
+    lines = [line for _, _, group in TIME_GREETINGS for line in group]
+    lines += NIGHT_GREETINGS + PHILOSOPHY_GREETINGS
+    lines += [line for group in HABIT_GREETINGS.values() for line in group]
+    lines += [line for group in PUSH_MESSAGES.values() for line in group]
+    lines += list(ACTION_REPLIES.values())
+    for task in memory.get("tasks", []):
+        if task["status"] == "pending":
+            lines += [reminder.format(task=task["description"]) for reminder in TASK_REMINDERS]
+    return lines
+
+def prewarm_tts(extra=()):
+    """
+    Synthesize static_phrases() (and extra) into the TTS cache ahead of time,
+    sentence by sentence as they are spoken. Returns how many were new.
+    """
+    if not (TTS_PERSISTENT and TTS_CACHE):
+        return 0
+    added = 0
+    for line in static_phrases() + list(extra):
+        for sentence in split_sentences(line):
+            clean = _prepare_tts_text(sentence)
+            if clean and clean not in tts_cache and synthesize(clean):
+                added += 1
+    return added
+
+def _say_once(clean):
+    """The one-shot path: a new piper run writing a temporary WAV, played with paplay / aplay."""
     # Make a temporary WAV file
     with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
         wav_path = f.name
 
-    # Generate WAV with Piper
-    cmd_tts = [
-        piper_bin,
-        "--model", model_path,
-        "--output_file", wav_path,
-    ]
-    subprocess.run(
-       cmd_tts,
-       input=clean.encode("utf-8"),
-       check=False,
-       stdout=subprocess.DEVNULL,
-       stderr=subprocess.DEVNULL,
-    )
-    # Play WAV (use paplay; if it fails, fall back to aplay)
     try:
-        subprocess.run(["paplay", wav_path], check=False)
-    except FileNotFoundError:
-        subprocess.run(["aplay", wav_path], check=False)
+        # Generate WAV with Piper
+        cmd_tts = [
+            PIPER_BIN,
+            "--model", PIPER_MODEL,
+            "--output_file", wav_path,
+        ]
+        with metrics.span("tts_synth"):
+            subprocess.run(
+               cmd_tts,
+               input=clean.encode("utf-8"),
+               check=False,
+               stdout=subprocess.DEVNULL,
+               stderr=subprocess.DEVNULL,
+            )
+        # Play WAV (use paplay; if it fails, fall back to aplay)
+        with metrics.span("tts_play"):
+            try:
+                subprocess.run(["paplay", wav_path], check=False)
+            except FileNotFoundError:
+                subprocess.run(["aplay", wav_path], check=False)
+    finally:
+        try:
+            os.remove(wav_path)
+        except OSError:
+            pass
 
 def run_detached_command(cmd_list):
     """
@@ -355,22 +829,39 @@ def run_detached_command(cmd_list):
     except Exception as e:
         return f"Command failed: {e}"
 
-def run_sys_command(cmd_list):
+# commands run on executor threads: killed after their timeout, output capped
+executor = Executor(default_timeout=COMMAND_TIMEOUT, max_output=COMMAND_MAX_OUTPUT)
+
+def _job_notes(job):
+    """" [exit 1]" / " [timed out after 30s]" / " [output truncated]" for a finished job."""
+    notes = ""
+    if job.status == "timeout":
+        notes += f" [timed out after {job.timeout:.0f}s]"
+    elif job.status == "killed":
+        notes += " [killed]"
+    elif job.returncode:
+        notes += f" [exit {job.returncode}]"
+    if job.truncated:
+        notes += " [output truncated]"
+    return notes
+
+def run_sys_command(cmd_list, timeout=None):
     """
     Run a system command safely and return its output as text.
     cmd_list must be a list, e.g. ["firefox"] or ["xdg-open", "https://google.com"].
+    Waits at most `timeout` seconds (COMMAND_TIMEOUT by default), then kills it.
     """
-    try:
-        result = subprocess.run(
-            cmd_list,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            check=False
-        )
-        return result.stdout.strip() if result.stdout else "Command executed."
-    except Exception as e:
-        return f"Command failed: {e}"
+    job = executor.run(cmd_list, timeout)
+    if job.error is not None:
+        return f"Command failed: {job.error}"
+    out = job.output().strip()
+    if job.status in ("timeout", "killed") or job.truncated:
+        return (out or "Command executed.") + "\n" + _job_notes(job).strip()
+    return out or "Command executed."
+
+def run_background_command(cmd_list, timeout=None):
+    """Start a system command without waiting for it (output kept in executor.jobs)."""
+    return executor.submit(cmd_list, timeout)
 
 
 def notify(msg):
@@ -379,357 +870,1300 @@ def notify(msg):
     Requires: sudo pacman -Sy libnotify  (on Garuda/Arch). [web:23]
     """
     # notify-send "Azrion" "message"
-    run_sys_command(["notify-send", "Azrion", msg])
+    run_background_command(["notify-send", "Azrion", msg])
+
 
+# --- FILE INDEX (paths under FILE_INDEX_ROOT, refreshed in the background) ---
+file_index = FileIndex(FILE_INDEX_FILE, FILE_INDEX_ROOT, skip_hidden=not FILE_INDEX_HIDDEN,
+                       exclude=FILE_INDEX_EXCLUDE)
+_file_index_lock = threading.Lock()
+_file_index_started = False
 
-def system_action(user_input):
+def _ensure_file_index():
+    """
+    Load the saved index and start its refresher on the first file search
+    (not on import: the refresher walks FILE_INDEX_ROOT). True once it can answer.
+    """
+    global _file_index_started
+    with _file_index_lock:
+        if not _file_index_started:
+            _file_index_started = True
+            file_index.load()
+            file_index.start(FILE_INDEX_REFRESH)
+    return file_index.ready
+
+PAGE_RE = re.compile(r"^(.*?)\s+page\s+(\d+)$", re.I)
+
+def search_files(pattern, page=1):
+    """Reply for "search files for <pattern> [page N]" from the file index."""
+    mode, total, paths = file_index.search(pattern, limit=FILE_SEARCH_PAGE,
+                                           offset=(page - 1) * FILE_SEARCH_PAGE)
+    if not total:
+        return f"No files found matching '{pattern}'."
+    pages = -(-total // FILE_SEARCH_PAGE)
+    if not paths:
+        return f"Only {pages} page(s) of results for '{pattern}'."
+    what = "Closest matches" if mode == "fuzzy" else "Found these paths"
+    where = f" (page {page}/{pages}, {total} total)" if pages > 1 else ""
+    text = f"{what} for '{pattern}'{where}:\n" + "\n".join(paths)
+    if page < pages:
+        text += f"\n…say \"search files for {pattern} page {page + 1}\" for more."
+    return text
+
+# fixed replies of the handlers below (kept together so they can be pre-synthesized, see prewarm_tts)
+ACTION_REPLIES = {
+    "browser": "Opening your browser 🔥",
+    "code": "Launching VS Code 😎",
+    "files": "Opening your file manager 😌",
+    "youtube": "Opening YouTube 👀",
+    "google": "Opening Google for you 😌",
+    "github": "Opening GitHub 😎",
+    "search_google": "What do you want me to search on Google?",
+    "search_youtube": "What do you want me to search on YouTube?",
+    "play": "Playing your music 🎵",
+    "pause": "Pausing your music 😌",
+    "next": "Skipping to the next track 😎",
+    "previous": "Going back to the previous track 👀",
+    "cpu": "Here’s a quick CPU snapshot:",
+    "ram": "Here’s your memory usage:",
+    "disk": "Here’s your disk usage:",
+    "search_files": "Tell me what filename or pattern to search for.",
+    "run": "You need to give me a command after 'run:'.",
+}
+
+# set by system_action for its handlers: {"sink", "rest"}; a handler that streams
+# into the sink stores in "rest" the part of its reply that still has to be shown
+_action_stream = contextvars.ContextVar("azrion_action_stream", default=None)
+
+# Intents in check order: (handler, all_of). Each handler takes the raw
+# user_input and returns the reply, or None to let the later intents try.
+SYSTEM_ACTIONS = []
+
+def system_intent(contains=(), prefix=None, all_of=()):
+    """
+    Register the decorated handler as a system_action intent. It is tried when
+    the message contains any of `contains`, starts with `prefix`, or contains
+    every word of `all_of`; intents are tried in the order they are registered.
+    """
+    def register(handler):
+        index = len(SYSTEM_ACTIONS)
+        SYSTEM_ACTIONS.append((handler, tuple(all_of)))
+        for phrase in contains:
+            keywords.add(phrase, ("action", index))
+        if prefix:
+            keywords.add(prefix, ("action", index), prefix=True)
+        for word in all_of:
+            keywords.add(word, ("action", index))
+        return handler
+    return register
+
+
+def system_action(user_input, stream=None):
     """
     Parse natural language commands and trigger system actions.
     Returns a user-facing string if something was executed, or None if no action matched.
+    stream = {"sink": sink, "rest": None} lets long commands show output as it
+    comes; afterwards "rest" (if not None) is what is left to show of the reply.
     """
-    text = user_input.lower().strip()
-
-    # --- Open common apps ---
-    if "open browser" in text or "open firefox" in text:
-        run_detached_command(["firefox"])
-        return "Opening your browser 🔥"
-
-    if "open code" in text or "open vscode" in text or "open vs code" in text:
-        run_detached_command(["code"])
-        return "Launching VS Code 😎"
-
-    if "open files" in text or "open file manager" in text or "open dolphin" in text:
-        run_detached_command(["dolphin"])
-        return "Opening your file manager 😌"
-
-    if "open youtube" in text or ("youtube" in text and "open" in text):
-        run_detached_command(["firedragon", "--new-window", "https://www.youtube.com"])
-        return "Opening YouTube 👀"
-
-    if "open google" in text:
-        run_detached_command(["firedragon", "--new-window", "https://www.google.com"])
-        return "Opening Google for you 😌"
-
-    if "open github" in text:
-        run_detached_command(["firedragon", "--new-window", "https://github.com"])
-        return "Opening GitHub 😎"
-
-    # Generic open URL: "open: https://example.com"
-    if text.startswith("open:"):
-        url = user_input[5:].strip()
-        if url:
-            run_detached_command(["firedragon", "--new-window", url])
-            return f"Opening {url} 🔥"
-
-
-    # --- Web search helpers (Google / YouTube) ---
-    if text.startswith("search google for "):
-        import urllib.parse
-        query = user_input[len("search google for "):].strip()
-        if not query:
-            return "What do you want me to search on Google?"
-        url = "https://www.google.com/search?q=" + urllib.parse.quote(query)
-        run_detached_command(["firedragon", "--new-window", url])
-        return f"Searching Google for \"{query}\" 🔍"
-
-    if text.startswith("search youtube for "):
-        import urllib.parse
-        query = user_input[len("search youtube for "):].strip()
-        if not query:
-            return "What do you want me to search on YouTube?"
-        url = "https://www.youtube.com/results?search_query=" + urllib.parse.quote(query)
+    matches = scan_message(user_input)
+    token = _action_stream.set(stream)
+    try:
+        for index in sorted(matches.names("action")):
+            handler, all_of = SYSTEM_ACTIONS[index]
+            if all_of and not all(word in matches.patterns for word in all_of):
+                continue
+            reply = handler(user_input)
+            if reply is not None:
+                return reply
+        return None
+    finally:
+        _action_stream.reset(token)
+
+
+# --- Open common apps ---
+@system_intent(contains=["open browser", "open firefox"])
+def _open_browser(user_input):
+    run_detached_command(["firefox"])
+    return ACTION_REPLIES["browser"]
+
+@system_intent(contains=["open code", "open vscode", "open vs code"])
+def _open_code(user_input):
+    run_detached_command(["code"])
+    return ACTION_REPLIES["code"]
+
+@system_intent(contains=["open files", "open file manager", "open dolphin"])
+def _open_file_manager(user_input):
+    run_detached_command(["dolphin"])
+    return ACTION_REPLIES["files"]
+
+@system_intent(all_of=["youtube", "open"])
+@system_intent(contains=["open youtube"])
+def _open_youtube(user_input):
+    run_detached_command(["firedragon", "--new-window", "https://www.youtube.com"])
+    return ACTION_REPLIES["youtube"]
+
+@system_intent(contains=["open google"])
+def _open_google(user_input):
+    run_detached_command(["firedragon", "--new-window", "https://www.google.com"])
+    return ACTION_REPLIES["google"]
+
+@system_intent(contains=["open github"])
+def _open_github(user_input):
+    run_detached_command(["firedragon", "--new-window", "https://github.com"])
+    return ACTION_REPLIES["github"]
+
+# Generic open URL: "open: https://example.com"
+@system_intent(prefix="open:")
+def _open_url(user_input):
+    url = user_input[5:].strip()
+    if url:
         run_detached_command(["firedragon", "--new-window", url])
-        return f"Searching YouTube for \"{query}\" 🎵"
-
-
-    # --- Media control (requires playerctl installed) [web:52][web:57][web:60] ---
-    if "play music" in text or "resume music" in text:
-        run_sys_command(["playerctl", "play"])
-        return "Playing your music 🎵"
+        return f"Opening {url} 🔥"
+    return None
 
-    if "pause music" in text or "stop music" in text:
-        run_sys_command(["playerctl", "pause"])
-        return "Pausing your music 😌"
 
-    if "next song" in text or "next track" in text:
-        run_sys_command(["playerctl", "next"])
-        return "Skipping to the next track 😎"
+# --- Web search helpers (Google / YouTube) ---
+@system_intent(prefix="search google for ")
+def _search_google(user_input):
+    import urllib.parse
+    query = user_input[len("search google for "):].strip()
+    if not query:
+        return ACTION_REPLIES["search_google"]
+    url = "https://www.google.com/search?q=" + urllib.parse.quote(query)
+    run_detached_command(["firedragon", "--new-window", url])
+    return f"Searching Google for \"{query}\" 🔍"
+
+@system_intent(prefix="search youtube for ")
+def _search_youtube(user_input):
+    import urllib.parse
+    query = user_input[len("search youtube for "):].strip()
+    if not query:
+        return ACTION_REPLIES["search_youtube"]
+    url = "https://www.youtube.com/results?search_query=" + urllib.parse.quote(query)
+    run_detached_command(["firedragon", "--new-window", url])
+    return f"Searching YouTube for \"{query}\" 🎵"
+
+
+# --- Media control (requires playerctl installed) [web:52][web:57][web:60] ---
+@system_intent(contains=["play music", "resume music"])
+def _play_music(user_input):
+    run_background_command(["playerctl", "play"])
+    return ACTION_REPLIES["play"]
+
+@system_intent(contains=["pause music", "stop music"])
+def _pause_music(user_input):
+    run_background_command(["playerctl", "pause"])
+    return ACTION_REPLIES["pause"]
+
+@system_intent(contains=["next song", "next track"])
+def _next_track(user_input):
+    run_background_command(["playerctl", "next"])
+    return ACTION_REPLIES["next"]
+
+@system_intent(contains=["previous song", "previous track"])
+def _previous_track(user_input):
+    run_background_command(["playerctl", "previous"])
+    return ACTION_REPLIES["previous"]
+
+# --- System info / monitoring (read from /proc by sysmon; top / free / df without it) ---
+# the sampler thread starts with the first question (_monitor()), not on import
+sysmon = None
+if SYSMON and azrion_sysmon.available():
+    sysmon = azrion_sysmon.SystemMonitor(SYSMON_INTERVAL, SYSMON_WINDOW, SYSMON_PROC_INTERVAL)
+
+def _monitor():
+    if sysmon is not None:
+        sysmon.start()
+    return sysmon
+
+@system_intent(contains=["show cpu", "cpu usage"])
+def _show_cpu(user_input):
+    if _monitor() is not None:
+        return ACTION_REPLIES["cpu"] + "\n" + sysmon.cpu_report(SYSMON_TOP)
+    out = run_sys_command(["bash", "-lc", "top -b -n1 | head -n5"])
+    return ACTION_REPLIES["cpu"] + "\n" + out
+
+@system_intent(contains=["show ram", "memory usage"])
+def _show_ram(user_input):
+    if _monitor() is not None:
+        return ACTION_REPLIES["ram"] + "\n" + sysmon.memory_report(SYSMON_TOP)
+    out = run_sys_command(["bash", "-lc", "free -h"])
+    return ACTION_REPLIES["ram"] + "\n" + out
+
+@system_intent(contains=["disk usage", "show disk"])
+def _show_disk(user_input):
+    if sysmon is not None:     # statvfs on demand, no samples needed
+        return ACTION_REPLIES["disk"] + "\n" + sysmon.disk_report()
+    out = run_sys_command(["bash", "-lc", "df -h | head -n10"])
+    return ACTION_REPLIES["disk"] + "\n" + out
+
+# --- File and folder management (simple, explicit) ---
+@system_intent(prefix="create folder ")
+def _create_folder(user_input):
+    # Example: "create folder projects in Documents"
+    try:
+        rest = user_input[len("create folder "):].strip()
+        # Try to split "name in path"
+        if " in " in rest.lower():
+            name_part, path_part = rest.split(" in ", 1)
+            folder_name = name_part.strip()
+            target_rel = path_part.strip()
+        else:
+            folder_name = rest
+            target_rel = ""
+        base = os.path.expanduser("~")
+        target_dir = os.path.join(base, target_rel) if target_rel else base
+        os.makedirs(os.path.join(target_dir, folder_name), exist_ok=True)
+        return f"Created folder '{folder_name}' in '{target_dir}'."
+    except Exception as e:
+        return f"Could not create folder: {e}"
 
-    if "previous song" in text or "previous track" in text:
-        run_sys_command(["playerctl", "previous"])
-        return "Going back to the previous track 👀"
+@system_intent(prefix="create file ")
+def _create_file(user_input):
+    # Example: "create file notes.txt in Documents"
+    try:
+        rest = user_input[len("create file "):].strip()
+        if " in " in rest.lower():
+            name_part, path_part = rest.split(" in ", 1)
+            file_name = name_part.strip()
+            target_rel = path_part.strip()
+        else:
+            file_name = rest
+            target_rel = ""
+        base = os.path.expanduser("~")
+        target_dir = os.path.join(base, target_rel) if target_rel else base
+        os.makedirs(target_dir, exist_ok=True)
+        file_path = os.path.join(target_dir, file_name)
+        if not os.path.exists(file_path):
+            with open(file_path, "w") as f:
+                f.write("")
+        return f"Created file '{file_name}' in '{target_dir}'."
+    except Exception as e:
+        return f"Could not create file: {e}"
 
-    # --- System info / monitoring ---
-    if "show cpu" in text or "cpu usage" in text:
-        out = run_sys_command(["bash", "-lc", "top -b -n1 | head -n5"])
-        return "Here’s a quick CPU snapshot:\n" + out
+@system_intent(prefix="list files in ")
+def _list_files(user_input):
+    # Example: "list files in Documents"
+    try:
+        target_rel = user_input[len("list files in "):].strip()
+        base = os.path.expanduser("~")
+        target_dir = os.path.join(base, target_rel)
+        if not os.path.isdir(target_dir):
+            return f"'{target_dir}' is not a directory."
+        items = os.listdir(target_dir)
+        if not items:
+            return f"No files in '{target_dir}'."
+        listing = "\n".join(items[:50])
+        return f"Files in '{target_dir}':\n{listing}"
+    except Exception as e:
+        return f"Could not list files: {e}"
 
-    if "show ram" in text or "memory usage" in text:
-        out = run_sys_command(["bash", "-lc", "free -h"])
-        return "Here’s your memory usage:\n" + out
+@system_intent(prefix="open folder ")
+def _open_folder(user_input):
+    # Examples:
+    #   "open folder Documents"
+    #   "open folder Documents/DSA"
+    #   "open folder SY_BTech/Subjects/DSA"
+    target_rel = user_input[len("open folder "):].strip()
+    if target_rel:
+        base = os.path.expanduser("~")
+        # Allow nested paths
+        target_dir = os.path.join(base, target_rel)
+        run_sys_command(["xdg-open", target_dir])
+        return f"Opening folder '{target_dir}' 😌"
+    return None
 
-    if "disk usage" in text or "show disk" in text:
-        out = run_sys_command(["bash", "-lc", "df -h | head -n10"])
-        return "Here’s your disk usage:\n" + out
+# --- Local file search (file index; fd until the first index build is done) ---
+@system_intent(prefix="search files for ")
+def _search_files(user_input):
+    # Example: "search files for demo.py"
+    pattern = user_input[len("search files for "):].strip()
+    if not pattern:
+        return ACTION_REPLIES["search_files"]
+    if FILE_INDEX and _ensure_file_index():
+        paged = PAGE_RE.match(pattern)
+        if paged:
+            return search_files(paged.group(1).strip(), int(paged.group(2)) or 1)
+        return search_files(pattern)
+    # index disabled or still being built for the first time
+    cmd = ["fd", pattern, os.path.expanduser("~")]
+    out = run_sys_command(cmd)
+    if not out.strip():
+        return f"No files found matching '{pattern}'."
+    lines = out.splitlines()[:30]
+    result_text = "\n".join(lines)
+    return f"Found these paths for '{pattern}':\n{result_text}"
+
+# --- Delete files and folders (moves to trash if possible) ---
+@system_intent(prefix="delete file ")
+def _delete_file(user_input):
+    # Example: "delete file notes.txt in Documents"
+    try:
+        rest = user_input[len("delete file "):].strip()
+        if " in " in rest.lower():
+            name_part, path_part = rest.split(" in ", 1)
+            file_name = name_part.strip()
+            target_rel = path_part.strip()
+        else:
+            file_name = rest
+            target_rel = ""
+        base = os.path.expanduser("~")
+        target_dir = os.path.join(base, target_rel) if target_rel else base
+        file_path = os.path.join(target_dir, file_name)
+        if not os.path.exists(file_path):
+            return f"File '{file_path}' does not exist."
+        # Prefer trash-cli or gio trash if available
+        # Attempt trash-cli
+        out = run_sys_command(["trash-put", file_path])
+        if "command not found" in out.lower():
+            # Fallback: gio trash
+            out2 = run_sys_command(["gio", "trash", file_path])
+            if "command not found" in out2.lower():
+                # Last resort: permanent delete (be careful)
+                os.remove(file_path)
+                return f"Permanently deleted file '{file_path}'."
+        return f"Moved file '{file_path}' to Trash."
+    except Exception as e:
+        return f"Could not delete file: {e}"
 
-    # --- File and folder management (simple, explicit) ---
-    if text.startswith("create folder "):
-        # Example: "create folder projects in Documents"
+@system_intent(prefix="delete folder ")
+def _delete_folder(user_input):
+    # Example: "delete folder test_azrion in Documents"
+    try:
+        import shutil
+        rest = user_input[len("delete folder "):].strip()
+        if " in " in rest.lower():
+            name_part, path_part = rest.split(" in ", 1)
+            folder_name = name_part.strip()
+            target_rel = path_part.strip()
+        else:
+            folder_name = rest
+            target_rel = ""
+        base = os.path.expanduser("~")
+        target_dir = os.path.join(base, target_rel) if target_rel else base
+        folder_path = os.path.join(target_dir, folder_name)
+        if not os.path.exists(folder_path):
+            return f"Folder '{folder_path}' does not exist."
+        # Use trash when possible
+        out = run_sys_command(["trash-put", folder_path])
+        if "command not found" in out.lower():
+            out2 = run_sys_command(["gio", "trash", folder_path])
+            if "command not found" in out2.lower():
+                # Fallback: recursive delete – careful
+                shutil.rmtree(folder_path)
+                return f"Permanently deleted folder '{folder_path}'."
+        return f"Moved folder '{folder_path}' to Trash."
+    except Exception as e:
+        return f"Could not delete folder: {e}"
+
+# --- Raw command (explicit, potentially unsafe) ---
+@system_intent(prefix="run:")
+def _run_command(user_input):
+    # Example: run: ls -la
+    cmd = user_input[4:].strip()
+    if not cmd:
+        return ACTION_REPLIES["run"]
+    # Output goes to the sink line by line for up to RUN_WAIT seconds; a command
+    # that is still going then keeps running as a background job.
+    stream = _action_stream.get()
+    sink = stream["sink"] if stream else None
+    if sink is not None:
+        sink.write("Command output:\n")
+    # Use a shell explicitly; only you should use this, it's powerful.
+    job = executor.submit(["bash", "-lc", cmd], timeout=RUN_TIMEOUT,
+                          on_line=sink.write if sink is not None else None)
+    job.wait(RUN_WAIT)
+    shown = job.detach()
+    if job.error is not None:
+        tail = f"Command failed: {job.error}"
+    elif job.running:
+        tail = (f"…still running as job #{job.id} (say \"job status {job.id}\" for its output, "
+                f"\"kill job {job.id}\" to stop it).")
+    else:
+        tail = ("" if shown.strip() else "Command executed.") + _job_notes(job)
+    if sink is not None:
+        stream["rest"] = ("\n" if shown and not shown.endswith("\n") and tail else "") + tail.strip()
+    body = shown.strip()
+    return "Command output:\n" + body + ("\n" if body and tail.strip() else "") + tail.strip()
+
+# whole-message commands only, in forms ordinary chat doesn't use ("jobs are hard", "job 2 went well")
+JOB_RE = re.compile(r"^(?:(kill|stop) job|job status) #?(\d+)$")
+
+@system_intent(prefix="list jobs")
+def _list_jobs(user_input):
+    if user_input.strip().lower() != "list jobs":
+        return None
+    jobs = executor.all_jobs()
+    if not jobs:
+        return "No commands running or run lately 😌"
+    return "Recent commands:\n" + "\n".join(job.describe() for job in jobs[-10:])
+
+@system_intent(prefix="job status ")
+@system_intent(prefix="kill job ")
+@system_intent(prefix="stop job ")
+def _job_command(user_input):
+    m = JOB_RE.match(user_input.strip().lower())
+    if not m:
+        return None
+    job = executor.get(int(m.group(2)))
+    if job is None:
+        return f"I don't remember a job #{m.group(2)}."
+    if m.group(1):
+        if not executor.kill(job.id):
+            return f"Job #{job.id} already ended: {job.describe()}"
+        job.wait(executor.kill_grace * 2)
+        return f"Stopped it 😎 {job.describe()}"
+    out = job.output().strip()
+    lines = out.splitlines()
+    if len(lines) > 30:
+        out = "…\n" + "\n".join(lines[-30:])
+    return f"{job.describe()}{_job_notes(job) if not job.running else ''}\n{out or '(no output yet)'}"
+
+# --- OLLAMA CLIENT (one reused connection, warmup, keep-alive) ---
+_client = None
+_client_lock = threading.Lock()
+_idle_timer = None
+# cold = Ollama had to load the model for that turn (load_duration > COLD_LOAD_SECONDS)
+llm_stats = {"cold_turns": 0, "warm_turns": 0, "warmups": 0, "last_warmup": None,
+             "checkpoints": 0, "prompt_tokens_est": 0, "prompt_eval_tokens": 0}
+
+def get_client():
+    """The shared Ollama client (keeps its HTTP connection alive between turns)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = Client(host=OLLAMA_HOST)
+        return _client
+
+def _meta(response, key, default=None):
+    """Read a field from an Ollama response object or dict."""
+    value = getattr(response, key, None)
+    if value is None and isinstance(response, dict):
+        value = response.get(key)
+    return default if value is None else value
+
+def warmup_model(model=CHAT_MODEL, background=True):
+    """Ask Ollama to load `model` now (empty prompt), so the first real turn is warm."""
+    def _run():
+        start = time.perf_counter()
         try:
-            rest = user_input[len("create folder "):].strip()
-            # Try to split "name in path"
-            if " in " in rest.lower():
-                name_part, path_part = rest.split(" in ", 1)
-                folder_name = name_part.strip()
-                target_rel = path_part.strip()
-            else:
-                folder_name = rest
-                target_rel = ""
-            base = os.path.expanduser("~")
-            target_dir = os.path.join(base, target_rel) if target_rel else base
-            os.makedirs(os.path.join(target_dir, folder_name), exist_ok=True)
-            return f"Created folder '{folder_name}' in '{target_dir}'."
+            response = get_client().generate(model=model, prompt="", keep_alive=OLLAMA_KEEP_ALIVE)
         except Exception as e:
-            return f"Could not create folder: {e}"
+            llm_stats["last_warmup"] = {"model": model, "error": str(e)}
+            return
+        router.mark_loaded(model)
+        llm_stats["warmups"] += 1
+        llm_stats["last_warmup"] = {
+            "model": model,
+            "seconds": time.perf_counter() - start,
+            "load_seconds": _meta(response, "load_duration", 0) / 1e9,
+        }
+    if background:
+        threading.Thread(target=_run, name="azrion-warmup", daemon=True).start()
+    else:
+        _run()
 
-    if text.startswith("create file "):
-        # Example: "create file notes.txt in Documents"
-        try:
-            rest = user_input[len("create file "):].strip()
-            if " in " in rest.lower():
-                name_part, path_part = rest.split(" in ", 1)
-                file_name = name_part.strip()
-                target_rel = path_part.strip()
-            else:
-                file_name = rest
-                target_rel = ""
-            base = os.path.expanduser("~")
-            target_dir = os.path.join(base, target_rel) if target_rel else base
-            os.makedirs(target_dir, exist_ok=True)
-            file_path = os.path.join(target_dir, file_name)
-            if not os.path.exists(file_path):
-                with open(file_path, "w") as f:
-                    f.write("")
-            return f"Created file '{file_name}' in '{target_dir}'."
-        except Exception as e:
-            return f"Could not create file: {e}"
+def unload_model(model=CHAT_MODEL):
+    """Tell Ollama to free the model right away (keep_alive=0)."""
+    try:
+        get_client().generate(model=model, prompt="", keep_alive=0)
+    except Exception:
+        pass
+    router.mark_unloaded(model)
+
+def _touch_idle_timer(model):
+    """Restart the idle-unload countdown after a turn."""
+    global _idle_timer
+    if not OLLAMA_IDLE_UNLOAD:
+        return
+    if _idle_timer is not None:
+        _idle_timer.cancel()
+    _idle_timer = threading.Timer(OLLAMA_IDLE_UNLOAD, unload_model, args=(model,))
+    _idle_timer.daemon = True
+    _idle_timer.start()
+
+def _record_load(final_response):
+    load = _meta(final_response, "load_duration", 0) / 1e9
+    cold = load > COLD_LOAD_SECONDS
+    # prompt tokens Ollama actually evaluated; a cached prefix is not counted
+    prompt_eval = _meta(final_response, "prompt_eval_count", None)
+    last_turn.update(load=load, cold=cold, prompt_eval=prompt_eval)
+    llm_stats["cold_turns" if cold else "warm_turns"] += 1
+    if prompt_eval is not None:
+        llm_stats["prompt_eval_tokens"] += prompt_eval
+        llm_stats["prompt_tokens_est"] += last_turn["prompt_est"]
+        if METRICS:
+            metrics.annotate(prompt_eval=prompt_eval, prompt_est=last_turn["prompt_est"])
+
+# --- MODEL ROUTING (small model for chit-chat, CHAT_MODEL for real questions) ---
+router = ModelRouter(keep_alive=OLLAMA_KEEP_ALIVE, slow_seconds=ROUTE_SLOW_SECONDS)
+_router_synced = False
+
+SUBSTANTIVE_WORDS = {
+    "explain", "why", "how", "write", "code", "debug", "fix", "compare", "difference",
+    "summarize", "summary", "plan", "analyze", "translate", "steps", "recommend", "teach",
+    "calculate", "define", "meaning", "story", "essay", "script", "function", "install",
+}
+CODE_RE = re.compile(r"```|[{}]|\w\(.*\)|Traceback|^\s*(def|class|import) ", re.M)
+
+def classify_input(user_input):
+    """
+    "chat" (greeting, banter, mood) or "substantive" from cheap features:
+    length, question / task keywords, anything that looks like code or
+    pasted output, and the mood ai_react_to_user_message reacts to.
+    """
+    words = re.findall(r"[\w']+", user_input.lower())
+    if not words:
+        return "chat"
+    if len(words) > ROUTE_MAX_WORDS or "\n" in user_input.strip() or CODE_RE.search(user_input):
+        return "substantive"
+    if SUBSTANTIVE_WORDS.intersection(words):
+        return "substantive"
+    # "stuck / bug / error" wants actual help; tired or down wants company
+    if detect_mood(user_input) == "stuck":
+        return "substantive"
+    return "chat"
+
+def _sync_router():
+    """Once: learn from Ollama which models are loaded right now."""
+    global _router_synced
+    _router_synced = True
+    try:
+        loaded = _meta(get_client().ps(), "models", [])
+    except Exception:
+        return
+    for entry in loaded:
+        name = _meta(entry, "model", None) or _meta(entry, "name", None)
+        if name:
+            router.mark_loaded(name)
 
-    if text.startswith("list files in "):
-        # Example: "list files in Documents"
+def choose_model(user_input):
+    """
+    Model for this turn. Chit-chat prefers FAST_MODEL, everything else
+    CHAT_MODEL; either falls back to the other one when it failed recently or
+    is cold while the other is warm (and is warmed in the background for next
+    time). A slow FAST_MODEL gives way to CHAT_MODEL, never the other way
+    round, so long answers don't get worse.
+    """
+    if not FAST_MODEL:
+        return CHAT_MODEL
+    if not _router_synced:
+        _sync_router()
+    if classify_input(user_input) == "chat":
+        model, reason = router.choose(FAST_MODEL, CHAT_MODEL)
+    else:
+        model, reason = router.choose(CHAT_MODEL, FAST_MODEL, allow_slow=False)
+    last_turn["route"] = reason
+    if reason == "cold":
+        warmup_model(CHAT_MODEL if model == FAST_MODEL else FAST_MODEL)
+    return model
+
+def _record_route(model):
+    """Feed the finished turn's timings to the router (and metrics)."""
+    router.record(model, last_turn["ttft"], last_turn["total"], cold=bool(last_turn["cold"]))
+    if METRICS and last_turn["total"] is not None:
+        metrics.observe(f"llm:{model}", last_turn["total"])
+
+def _with_fallback(model, run):
+    """run(model) -> reply; if a routed model fails before producing anything, retry on CHAT_MODEL."""
+    try:
+        return run(model)
+    except Exception:
+        if model == CHAT_MODEL or last_turn["ttft"] is not None:
+            raise
+        router.failed(model)
+        last_turn["route"] = "failed"
+        return run(CHAT_MODEL)
+
+# --- LLM CALL ---
+# Filled in by every model turn; "ttft" = seconds until the first streamed token,
+# "load" = seconds Ollama spent loading the model, "cold" = load was slow.
+# "prompt_eval" = prompt tokens Ollama evaluated (the rest came from its cache),
+# "prompt_est" = our estimate of the whole prompt's tokens.
+last_turn = {"ttft": None, "total": None, "streamed": False, "load": None, "cold": None, "cached": False,
+             "model": None, "route": None, "prompt_eval": None, "prompt_est": 0}
+
+TASK_PREFIXES = ("add task ", "done ")
+
+# --- CONTEXT BUILDER (token budget + rolling summary) ---
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English)."""
+    return len(text) // 4 + 1
+
+def _clip_message(msg):
+    content = msg.get("content", "")
+    limit = CONTEXT_MAX_MESSAGE_TOKENS * 4
+    if len(content) > limit:
+        content = content[:limit] + " …[trimmed]"
+    return {"role": msg.get("role", "user"), "content": content}
+
+def _fit_start(costs, base, budget):
+    """full_history position where the newest messages (costs = per history message) fit budget."""
+    start = base + len(costs) - 1   # the latest message always goes in
+    budget -= costs[-1]
+    while start > base and costs[start - base - 1] <= budget:
+        budget -= costs[start - base - 1]
+        start -= 1
+    return start
+
+def _window_costs(history):
+    clipped = [_clip_message(msg) for msg in history]
+    # + role/formatting overhead per message
+    return clipped, [estimate_tokens(msg["content"]) + 4 for msg in clipped]
+
+def build_context_window():
+    """
+    Recent messages for the prompt, laid out so consecutive prompts share a
+    long prefix (Ollama reuses the KV cache of the longest common prefix).
+
+    The window starts at a fixed anchor (rolling_summary["anchor"]) and only
+    grows, turn after turn; messages that history has already dropped are
+    read back from full_history, so trimming history never moves it. Once it
+    outgrows CONTEXT_TOKEN_BUDGET there is a checkpoint: the anchor moves up
+    to keep the newest PROMPT_CHECKPOINT_KEEP of the budget, and the running
+    summary is pinned for the prompt prefix (rolling_summary["pinned"]) - the
+    only moments the prefix changes. Returns (messages, start) where start
+    is the full_history position of the first message in the window.
+    Call with memory_lock held.
+    """
+    history = memory["history"]
+    full_history = memory["full_history"]
+    if not history:
+        return [], len(full_history)
+    base = len(full_history) - len(history)   # position of history[0]
+    state = memory["rolling_summary"]
+    anchor = state["anchor"]
+    # every message costs at least 5 tokens: an anchor further back than this is over budget anyway
+    lo = max(min(anchor, base), base - CONTEXT_TOKEN_BUDGET // 5, 0)
+    messages = (full_history[lo:base] if lo < base else []) + list(history)
+    clipped, costs = _window_costs(messages)
+    if anchor < lo or sum(costs[anchor - lo:]) > CONTEXT_TOKEN_BUDGET:
+        anchor = _fit_start(costs, lo, CONTEXT_TOKEN_BUDGET * PROMPT_CHECKPOINT_KEEP)
+        if ROLLING_SUMMARY and _fit_start(costs, lo, CONTEXT_TOKEN_BUDGET) <= state["upto"] < anchor:
+            # summary lags behind: keep the unsummarized messages if they fit the full budget
+            # (if they don't, they go; the summary catches up with them when things are quiet)
+            anchor = state["upto"]
+        state["anchor"] = anchor
+        state["pinned"] = state["text"]
+        llm_stats["checkpoints"] += 1
+    return clipped[anchor - lo:], anchor
+
+def _checkpoint_target():
+    """Where the next checkpoint will move the anchor; the summarizer folds up to here ahead of time."""
+    history = memory["history"]
+    if not history:
+        return memory["rolling_summary"]["upto"]
+    base = len(memory["full_history"]) - len(history)
+    _, costs = _window_costs(history)
+    return _fit_start(costs, base, CONTEXT_TOKEN_BUDGET * PROMPT_CHECKPOINT_KEEP)
+
+_summary_wakeup = threading.Event()
+_summary_thread = None
+_summary_target = 0   # fold messages before this full_history position (the next checkpoint's anchor)
+_last_activity = time.monotonic()   # start / end of the latest turn
+
+def _wait_until_idle():
+    # fold off-peak: a summary call next to a live turn would compete with it for the model
+    while True:
+        idle = time.monotonic() - _last_activity
+        if idle >= SUMMARY_IDLE_SECONDS:
+            return
+        time.sleep(SUMMARY_IDLE_SECONDS - idle)
+
+def _request_summary(upto):
+    """Note where the next window will start and wake the summarizer if enough lies before it."""
+    global _summary_thread, _summary_target
+    if not ROLLING_SUMMARY:
+        return
+    _summary_target = upto
+    if upto - memory["rolling_summary"]["upto"] < SUMMARY_MIN_PENDING:
+        return
+    if _summary_thread is None:
+        _summary_thread = threading.Thread(target=_summary_loop, name="azrion-summary", daemon=True)
+        _summary_thread.start()
+    _summary_wakeup.set()
+
+def _summary_loop():
+    while True:
+        _summary_wakeup.wait()
+        _summary_wakeup.clear()
         try:
-            target_rel = user_input[len("list files in "):].strip()
-            base = os.path.expanduser("~")
-            target_dir = os.path.join(base, target_rel)
-            if not os.path.isdir(target_dir):
-                return f"'{target_dir}' is not a directory."
-            items = os.listdir(target_dir)
-            if not items:
-                return f"No files in '{target_dir}'."
-            listing = "\n".join(items[:50])
-            return f"Files in '{target_dir}':\n{listing}"
+            while True:
+                _wait_until_idle()
+                with metrics.span("summary"):
+                    if not _fold_into_summary():
+                        break
         except Exception as e:
-            return f"Could not list files: {e}"
+            print(f"[azrion] summary refresh failed: {e}", file=sys.stderr)
 
-    if text.startswith("open folder "):
-    # Examples:
-    #   "open folder Documents"
-    #   "open folder Documents/DSA"
-    #   "open folder SY_BTech/Subjects/DSA"
-        target_rel = user_input[len("open folder "):].strip()
-        if target_rel:
-            base = os.path.expanduser("~")
-        # Allow nested paths
-            target_dir = os.path.join(base, target_rel)
-            run_sys_command(["xdg-open", target_dir])
-            return f"Opening folder '{target_dir}' 😌"
-
-    # --- Local file search (using fd) ---
-    if text.startswith("search files for "):
-        # Example: "search files for demo.py"
-        pattern = user_input[len("search files for "):].strip()
-        if not pattern:
-            return "Tell me what filename or pattern to search for."
-        cmd = ["fd", pattern, os.path.expanduser("~")]
-        out = run_sys_command(cmd)
-        if not out.strip():
-            return f"No files found matching '{pattern}'."
-        lines = out.splitlines()[:30]
-        result_text = "\n".join(lines)
-        return f"Found these paths for '{pattern}':\n{result_text}"
-
-        # --- Delete files and folders (moves to trash if possible) ---
-    if text.startswith("delete file "):
-        # Example: "delete file notes.txt in Documents"
-        try:
-            rest = user_input[len("delete file "):].strip()
-            if " in " in rest.lower():
-                name_part, path_part = rest.split(" in ", 1)
-                file_name = name_part.strip()
-                target_rel = path_part.strip()
-            else:
-                file_name = rest
-                target_rel = ""
-            base = os.path.expanduser("~")
-            target_dir = os.path.join(base, target_rel) if target_rel else base
-            file_path = os.path.join(target_dir, file_name)
-            if not os.path.exists(file_path):
-                return f"File '{file_path}' does not exist."
-            # Prefer trash-cli or gio trash if available
-            # Attempt trash-cli
-            out = run_sys_command(["trash-put", file_path])
-            if "command not found" in out.lower():
-                # Fallback: gio trash
-                out2 = run_sys_command(["gio", "trash", file_path])
-                if "command not found" in out2.lower():
-                    # Last resort: permanent delete (be careful)
-                    os.remove(file_path)
-                    return f"Permanently deleted file '{file_path}'."
-            return f"Moved file '{file_path}' to Trash."
-        except Exception as e:
-            return f"Could not delete file: {e}"
+def _fold_into_summary():
+    """
+    Fold the next chunk of out-of-window messages into the running summary.
+    Only the previous summary + the new messages go to the model, never the
+    whole history. Returns True if it did something.
+    """
+    with memory_lock:
+        summary = memory["rolling_summary"]
+        upto, text = summary["upto"], summary["text"]
+        target = _summary_target
+        if target - upto < SUMMARY_MIN_PENDING:
+            return False
+        chunk, tokens = [], 0
+        for msg in memory["full_history"][upto:target]:
+            cost = estimate_tokens(msg.get("content", ""))
+            if chunk and tokens + cost > SUMMARY_CHUNK_TOKENS:
+                break
+            chunk.append(_clip_message(msg))
+            tokens += cost
+
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in chunk)
+    prompt = (
+        f"Current summary of the conversation so far:\n{text or '(empty)'}\n\n"
+        f"New messages:\n{transcript}\n\n"
+        f"Rewrite the summary so it also covers the new messages. Keep facts, names, "
+        f"tasks and preferences; drop small talk. At most {SUMMARY_MAX_WORDS} words, plain text."
+    )
+    response = get_client().chat(
+        model=CHAT_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        keep_alive=OLLAMA_KEEP_ALIVE,
+    )
+    new_text = _response_text(response).strip()
 
-    if text.startswith("delete folder "):
-        # Example: "delete folder test_azrion in Documents"
+    with memory_lock:
+        if memory["rolling_summary"]["upto"] != upto:
+            return True   # someone else moved it meanwhile; re-read and continue
+        # the prompt keeps using the pinned text until the next checkpoint
+        memory["rolling_summary"].update(text=new_text, upto=upto + len(chunk))
+    save_memory()
+    return True
+
+# --- LONG-TERM RECALL (embeddings of full_history, computed in the background) ---
+def _embed(texts):
+    if EMBED_MODEL == "hash":
+        return hash_embed(texts)
+    response = get_client().embed(model=EMBED_MODEL, input=texts, keep_alive=OLLAMA_KEEP_ALIVE)
+    return _meta(response, "embeddings")
+
+# hash_embed buckets (and most models) have no "important dimensions first" order to cut at
+recall = Recall(VECTORS_FILE, _embed, EMBED_MODEL, memory_lock, batch=EMBED_BATCH,
+                coarse_dims=RECALL_COARSE_DIMS if EMBED_MODEL.split(":")[0] in MATRYOSHKA_MODELS else 0) \
+    if RECALL and np is not None else None
+_recall_wakeup = threading.Event()
+_recall_thread = None
+_recall_failed_until = 0.0   # monotonic time; embedding calls are skipped until then
+
+def _recall_failed():
+    global _recall_failed_until
+    _recall_failed_until = time.monotonic() + RECALL_FAILURE_BACKOFF
+
+def _request_embedding():
+    """Wake the embedder; it embeds whatever full_history has beyond the vector file."""
+    global _recall_thread
+    if recall is None:
+        return
+    if _recall_thread is None:
+        _recall_thread = threading.Thread(target=_embed_loop, name="azrion-embed", daemon=True)
+        _recall_thread.start()
+    _recall_wakeup.set()
+
+def _embed_loop():
+    last_error = None
+    while True:
+        _recall_wakeup.wait()
+        _recall_wakeup.clear()
+        if time.monotonic() < _recall_failed_until:
+            continue    # the next turn after the backoff catches up
         try:
-            import shutil
-            rest = user_input[len("delete folder "):].strip()
-            if " in " in rest.lower():
-                name_part, path_part = rest.split(" in ", 1)
-                folder_name = name_part.strip()
-                target_rel = path_part.strip()
-            else:
-                folder_name = rest
-                target_rel = ""
-            base = os.path.expanduser("~")
-            target_dir = os.path.join(base, target_rel) if target_rel else base
-            folder_path = os.path.join(target_dir, folder_name)
-            if not os.path.exists(folder_path):
-                return f"Folder '{folder_path}' does not exist."
-            # Use trash when possible
-            out = run_sys_command(["trash-put", folder_path])
-            if "command not found" in out.lower():
-                out2 = run_sys_command(["gio", "trash", folder_path])
-                if "command not found" in out2.lower():
-                    # Fallback: recursive delete – careful
-                    shutil.rmtree(folder_path)
-                    return f"Permanently deleted folder '{folder_path}'."
-            return f"Moved folder '{folder_path}' to Trash."
+            with metrics.span("embed"):
+                recall.catch_up(memory["full_history"])
         except Exception as e:
-            return f"Could not delete folder: {e}"
-
-    # --- Raw command (explicit, potentially unsafe) ---
-    if text.startswith("run:"):
-        # Example: run: ls -la
-        cmd = user_input[4:].strip()
-        if not cmd:
-            return "You need to give me a command after 'run:'."
-        # Use a shell explicitly; only you should use this, it's powerful.
-        out = run_sys_command(["bash", "-lc", cmd])
-        return f"Command output:\n{out}"
+            _recall_failed()
+            if str(e) != last_error:   # don't repeat the same complaint every turn
+                last_error = str(e)
+                print(f"[azrion] embedding failed ({EMBED_MODEL}): {e}", file=sys.stderr)
 
-    return None
-
-# --- CHAT FUNCTION (updated: short-term memory + archive + typing)
-def azrion_chat(user_input):
+def recall_exchanges(query, before):
+    """
+    Past exchanges most similar to query, taken from full_history[:before]
+    (i.e. not already in the window), oldest first, as one text block.
+    Costs one embedding call for the query; the search itself is a single
+    matrix-vector product over the memory-mapped vectors.
+    """
+    if recall is None or time.monotonic() < _recall_failed_until:
+        return ""
+    try:
+        hits = recall.query(query, RECALL_TOP_K, RECALL_MIN_SCORE, before=before)
+    except Exception:
+        # embedding model unavailable: answer without recall, and stop asking for a while
+        _recall_failed()
+        return ""
+    if not hits:
+        return ""
+    with memory_lock:
+        full_history = memory["full_history"]
+        starts = set()
+        for row, _ in hits:
+            # pair each hit with its partner: a user message and the reply to it
+            start = row - 1 if full_history[row].get("role") == "assistant" and row > 0 else row
+            starts.add(start)
+        lines = []
+        for start in sorted(starts):
+            for msg in full_history[start:min(start + 2, before)]:
+                content = msg.get("content", "")
+                if len(content) > RECALL_MAX_CHARS:
+                    content = content[:RECALL_MAX_CHARS] + "…"
+                lines.append(f"[{msg.get('time', '?')}] {msg.get('role', 'user')}: {content}")
+    return "\n".join(lines)
+
+def _reply_cache_key(user_input):
+    """Cache key for this input, or None if the input must go to the model."""
+    if reply_cache is None:
+        return None
+    text = user_input.lower().strip()
+    if text.startswith(TASK_PREFIXES) or len(text.split()) > REPLY_CACHE_MAX_WORDS:
+        return None
+    # history already ends with this user message; fingerprint what came before it
+    context = memory["history"][-1 - REPLY_CACHE_CONTEXT:-1] if REPLY_CACHE_CONTEXT else []
+    return ReplyCache.make_key(user_input, context)
 
-     
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def _prompt_tokens(messages):
+    return sum(estimate_tokens(m["content"]) + 4 for m in messages)
 
-    # Store messages in both short-term 'history' and full archive 'full_history'
-    user_msg = {"role": "user", "content": user_input, "time": timestamp}
-    memory["full_history"].append(user_msg)
-    memory["history"].append(user_msg)
+def _response_text(response):
+    """Extract text only (robust)"""
+    if hasattr(response, "message") and hasattr(response.message, "content"):
+        return response.message.content or ""
+    elif hasattr(response, "text"):
+        return response.text
+    elif isinstance(response, dict):
+        return (response.get("message") or {}).get("content", "")
+    return str(response)
 
+def _generate_reply(messages, sink=None, model=CHAT_MODEL):
+    """
+    Run the model. With a sink and STREAM_REPLIES, chunks are written to the
+    sink as they arrive (sink.end() is left to the caller); returns the full text.
+    """
+    start = time.perf_counter()
+    streamed = sink is not None and STREAM_REPLIES
+    last_turn.update(ttft=None, total=None, streamed=streamed, load=None, cold=None, cached=False, model=model,
+                     prompt_eval=None, prompt_est=_prompt_tokens(messages))
+    client = get_client()
+    if not streamed:
+        response = client.chat(model=model, messages=messages, keep_alive=OLLAMA_KEEP_ALIVE)
+        last_turn["total"] = time.perf_counter() - start
+        _record_load(response)
+        _touch_idle_timer(model)
+        _record_route(model)
+        return _response_text(response)
+
+    parts = []
+    chunk = None
+    for chunk in client.chat(model=model, messages=messages, stream=True,
+                             keep_alive=OLLAMA_KEEP_ALIVE):
+        piece = _response_text(chunk)
+        if not piece:
+            continue
+        if last_turn["ttft"] is None:
+            last_turn["ttft"] = time.perf_counter() - start
+        parts.append(piece)
+        sink.write(piece)
+    last_turn["total"] = time.perf_counter() - start
+    _record_load(chunk)   # the final chunk carries the timings
+    _touch_idle_timer(model)
+    _record_route(model)
+    return "".join(parts)
+
+# --- CHAT FUNCTION (updated: short-term memory + archive + streaming)
+# A turn is split into steps shared by azrion_chat and azrion_chat_async;
+# only the blocking parts (system actions, recall lookup, the model call) differ.
+PUSH_TRIGGERS = ["lazy", "tired", "procrastinate", "stuck", "bug", "error", "fail", "lost", "can't"]
+for _word in PUSH_TRIGGERS:
+    keywords.add(_word, ("push", _word))
+
+def _remember(msg):
+    """Add a message to history + full_history (call with memory_lock held)."""
+    archive_message(msg)
+    memory["history"].append(msg)
     # trim short-term history to last SHORT_TERM_LIMIT messages to keep prompt small
     if len(memory["history"]) > SHORT_TERM_LIMIT:
         memory["history"] = memory["history"][-SHORT_TERM_LIMIT:]
 
-    # Update habits/stats/philosophy
-    update_stats(user_input)
-    track_habits(user_input)
-    track_philosophy(user_input)
+def _start_turn(user_input, timestamp):
+    """Store the user message, update habits/stats/philosophy; returns the push text."""
+    global _last_activity
+    _last_activity = time.monotonic()
+    with memory_lock:
+        # Store messages in both short-term 'history' and full archive 'full_history'
+        _remember({"role": "user", "content": user_input, "time": timestamp})
+
+        # Update habits/stats/philosophy
+        with metrics.span("stats"):
+            update_stats(user_input)
+        with metrics.span("habits"):
+            track_habits(user_input)
+        with metrics.span("philosophy"):
+            track_philosophy(user_input)
+
+        with metrics.span("reactions"):
+            # Auto-flirty/motivation push (decide later whether to append)
+            push_text = ai_react_to_user_message(user_input)
+
+            # Task reminder (append to push_text if relevant)
+            task_reminder = check_pending_tasks()
+            if task_reminder:
+                push_text += " " + task_reminder
+    return push_text
+
+def _system_reply(sys_response):
+    """Store a system action's response (no model call)."""
+    timestamp_sys = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with memory_lock:
+        _remember({"role": "assistant", "content": sys_response, "time": timestamp_sys})
+    save_memory()
 
-    # Auto-flirty/motivation push (decide later whether to append)
-    push_text = ai_react_to_user_message(user_input)
+def _search_reply(user_input):
+    """Answer "search history: ..." locally; None for any other input."""
+    if not user_input.lower().startswith("search history:"):
+        return None
+    query = user_input.split(":", 1)[1]
+    results = search_full_history(query, limit=6)
+    if not results:
+        return "No matches found in history."
+    # Return up to 6 results in a readable block
+    return "\n".join(results)
+
+def _prepare_messages(user_input):
+    """
+    Stable prefix (system prompt + summary pinned at the last checkpoint) and
+    the append-only window; see build_context_window. Returns
+    (head, window, window_start, cache_key, context_summary).
+    """
+    with memory_lock:
+        context_summary = summarize_context()
+        window, window_start = build_context_window()
+        head = [{"role": "system", "content": SYSTEM_PROMPT}]
+        earlier = memory["rolling_summary"]["pinned"]
+        if earlier:
+            head.append({"role": "system", "content": f"Earlier in this conversation: {earlier}"})
+        cache_key = _reply_cache_key(user_input)
+    return head, window, window_start, cache_key, context_summary
+
+def _assemble(head, window, context_summary, recalled):
+    """
+    head + window, with the per-turn context (top topics / habits, recalled
+    exchanges) right before the latest user message: it changes every turn,
+    so it goes where it costs the least prompt re-evaluation.
+    """
+    volatile = f"Context summary: {context_summary}"
+    if recalled:
+        volatile += f"\n\nPossibly relevant past exchanges:\n{recalled}"
+    return head + window[:-1] + [{"role": "system", "content": volatile}] + window[-1:]
+
+def _cached_reply(cache_key, sink):
+    """Reply from the cache (written to the sink), or None on a miss."""
+    cached = reply_cache.get(cache_key) if cache_key is not None else None
+    if cached is not None:
+        # same short input in the same context: skip the model round trip
+        streamed = sink is not None
+        last_turn.update(ttft=0.0, total=0.0, streamed=streamed, load=None, cold=None, cached=True)
+        if streamed:
+            sink.write(cached)
+    return cached
+
+def _finish_turn(user_input, text_response, push_text, streamed, sink, timestamp):
+    """Append extras, store the reply, queue background work and finish output."""
+    global _last_activity
+    # Post-processing runs once the whole reply is in; extras are appended
+    # after it (and sent to the sink as a final chunk)
+    extras = []
+    # Append push_text only if relevant (keeps normal replies clean)
+    if push_text.strip() and scan_message(user_input).any("push"):
+        extras.append(push_text)
 
-    # Task reminder (append to push_text if relevant)
-    task_reminder = check_pending_tasks()
-    if task_reminder:
-        push_text += " " + task_reminder
+    # Occasionally add a philosophy quote (kept brief)
+    if random.random() < 0.02:
+        extras.append(get_philosophy_quote())
+
+    if extras:
+        text_response = text_response.strip()
+        tail = "\n\n".join(extras)
+        if text_response:
+            tail = "\n\n" + tail
+        text_response += tail
+        if streamed:
+            sink.write(tail)
+
+    # Save assistant reply to memory (both short and full)
+    with memory_lock:
+        _remember({"role": "assistant", "content": text_response, "time": timestamp})
+
+    # only queues the write; the background writer saves after the reply is out
+    with metrics.span("save_memory"):
+        save_memory()
+    # messages the next checkpoint will drop get folded into the summary in the background,
+    # once the conversation has gone quiet
+    _last_activity = time.monotonic()
+    with memory_lock:
+        fold_upto = _checkpoint_target()
+    _request_summary(fold_upto)
+    # ...and new messages get embedded for recall
+    _request_embedding()
+
+    # Finish the streamed reply (or type it out / hand it to the sink in one go)
+    with metrics.span("output"):
+        if streamed:
+            sink.end()
+        else:
+            _deliver(text_response, sink)
+    return text_response
+
+def _record_first_token():
+    if METRICS and last_turn["ttft"] is not None:
+        metrics.observe("first_token", last_turn["ttft"])
+
+def azrion_chat(user_input, sink=None):
+    """
+    Handle one user message and return Azrion's reply.
+
+    The reply is also shown while it is produced: through `sink` (see the
+    REPLY SINKS section) or, by default, streamed to stdout. With
+    STREAM_REPLIES off and no sink it is typed out as before.
+    """
+    if sink is None and STREAM_REPLIES:
+        sink = StdoutSink()
+    with metrics.turn():
+        return _chat_turn(user_input, sink)
+
+def _chat_turn(user_input, sink):
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    push_text = _start_turn(user_input, timestamp)
 
     # --- System actions (apps, web, media, system info) ---
-    sys_response = system_action(user_input)
+    stream = {"sink": sink, "rest": None}
+    with metrics.span("system_action"):
+        sys_response = system_action(user_input, stream)
     if sys_response:
         # Print Azrion-style response and save to memory, but skip model call
-        timestamp_sys = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        assistant_msg = {"role": "assistant", "content": sys_response, "time": timestamp_sys}
-        memory["full_history"].append(assistant_msg)
-        memory["history"].append(assistant_msg)
-        if len(memory["history"]) > SHORT_TERM_LIMIT:
-            memory["history"] = memory["history"][-SHORT_TERM_LIMIT:]
-        save_memory()
-        type_out(sys_response)
+        _system_reply(sys_response)
+        _deliver(sys_response if stream["rest"] is None else stream["rest"], sink)
         return sys_response
 
     # If user requested a search, handle locally (no model call)
-    if user_input.lower().startswith("search history:"):
-        query = user_input.split(":", 1)[1]
-        results = search_full_history(query)
-        if not results:
-            return "No matches found in history."
-        # Return up to 6 results in a readable block
-        return "\n".join(results[:6])
-
-    # Prepare messages (use only short-term memory for speed)
-    context_summary = summarize_context()
-    # use system prompts + recent history only
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "system", "content": f"Context summary: {context_summary}"},
-    ] + memory["history"]
-
-    # Call Llama (model choice left as-is; for speed consider changing to a smaller model)
-    response = chat(model="llama3.1:latest", messages=messages)
-
-    # Extract text only (robust)
-    text_response = ""
-    if hasattr(response, "message") and hasattr(response.message, "content"):
-        text_response = response.message.content
-    elif hasattr(response, "text"):
-        text_response = response.text
+    with metrics.span("search"):
+        reply = _search_reply(user_input)
+    if reply is not None:
+        if sink is not None:
+            _deliver(reply, sink)
+        return reply
+
+    with metrics.span("context"):
+        head, window, window_start, cache_key, context_summary = _prepare_messages(user_input)
+
+    text_response = _cached_reply(cache_key, sink)
+    if text_response is not None:
+        streamed = sink is not None
     else:
-        text_response = str(response)
+        # similar older exchanges (embedding lookup runs without the lock)
+        with metrics.span("recall"):
+            recalled = recall_exchanges(user_input, window_start)
+        messages = _assemble(head, window, context_summary, recalled)
+        # Call the routed model (streams into the sink if there is one)
+        model = choose_model(user_input)
+        with metrics.span("llm"):
+            text_response = _with_fallback(model, lambda m: _generate_reply(messages, sink, m))
+        _record_first_token()
+        streamed = last_turn["streamed"]
+        if cache_key is not None and text_response.strip():
+            reply_cache.put(cache_key, text_response)
+
+    return _finish_turn(user_input, text_response, push_text, streamed, sink, timestamp)
+
+# --- ASYNC CHAT (asyncio front-ends; generation can be cancelled) ---
+# Blocking work (system commands, the recall embedding call, anything taking
+# memory_lock, synchronous saves) runs in worker threads via asyncio.to_thread,
+# so the event loop keeps listening / speaking while a reply is generated. Sink
+# writes happen on the loop, so sinks used here should be quick (hand slow work
+# to a queue).
+STOP_COMMANDS = ("stop", "stop it", "shut up", "be quiet", "cancel", "nevermind", "never mind")
+STOPPED_MARK = " …[stopped]"
+
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncClient (httpx async clients are bound to their loop)
+
+def get_async_client():
+    """The Ollama AsyncClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncClient(host=OLLAMA_HOST)
+    return client
+
+async def _generate_reply_async(messages, sink=None, parts=None, model=CHAT_MODEL):
+    """
+    Async twin of _generate_reply. Chunks are collected into `parts` as they
+    arrive, so whoever cancels the task still has the partial reply.
+    """
+    start = time.perf_counter()
+    streamed = sink is not None and STREAM_REPLIES
+    last_turn.update(ttft=None, total=None, streamed=streamed, load=None, cold=None, cached=False, model=model,
+                     prompt_eval=None, prompt_est=_prompt_tokens(messages))
+    parts = [] if parts is None else parts
+    client = get_async_client()
+    if not streamed:
+        response = await client.chat(model=model, messages=messages, keep_alive=OLLAMA_KEEP_ALIVE)
+        last_turn["total"] = time.perf_counter() - start
+        _record_load(response)
+        _touch_idle_timer(model)
+        _record_route(model)
+        parts.append(_response_text(response))
+        return parts[-1]
+
+    chunk = None
+    async for chunk in await client.chat(model=model, messages=messages, stream=True,
+                                         keep_alive=OLLAMA_KEEP_ALIVE):
+        piece = _response_text(chunk)
+        if not piece:
+            continue
+        if last_turn["ttft"] is None:
+            last_turn["ttft"] = time.perf_counter() - start
+        parts.append(piece)
+        sink.write(piece)
+    last_turn["total"] = time.perf_counter() - start
+    _record_load(chunk)
+    _touch_idle_timer(model)
+    _record_route(model)
+    return "".join(parts)
+
+async def _off_loop(func, *args):
+    """Run a step that saves memory; in a worker thread when saves are synchronous."""
+    if _writer is None:
+        return await asyncio.to_thread(func, *args)
+    return func(*args)
+
+async def azrion_chat_async(user_input, sink=None):
+    """
+    azrion_chat for asyncio callers. Same memory, prompts and sinks; the model
+    is called through the async Ollama client. Without a sink the reply goes
+    to stdout (no typing effect: it would block the loop).
+
+    Cancelling the task stops generation: whatever was produced so far is kept
+    in memory (marked as stopped), the sink is ended and CancelledError is
+    re-raised. A system action can't be stopped once started; its real reply
+    is recorded instead. See AsyncChatSession for "new message / stop cancels the old one".
+    """
+    if sink is None:
+        sink = StdoutSink()
+    # no cProfile here: other tasks run on the loop while this turn awaits
+    with metrics.turn(kind="async", profile=False):
+        return await _chat_turn_async(user_input, sink)
+
+def _record_stopped(partial, timestamp):
+    # keep the partial reply so history stays user/assistant paired
+    with memory_lock:
+        _remember({"role": "assistant", "content": partial.rstrip() + STOPPED_MARK, "time": timestamp})
+    save_memory()
 
-    # Append push_text only if relevant (keeps normal replies clean)
-    if push_text.strip() and any(word in user_input.lower()
-                                for word in ["lazy", "tired", "procrastinate", "stuck", "bug", "error", "fail", "lost", "can't"]):
-        text_response = text_response.strip()
-        if text_response:
-            text_response += "\n\n" + push_text
-        else:
-            text_response = push_text
+async def _chat_turn_async(user_input, sink):
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # steps that take memory_lock run in threads too: the background writer holds it while saving.
+    # A thread can't be cancelled, so the ones that change state are shielded and awaited on stop.
+    started = asyncio.ensure_future(asyncio.to_thread(_start_turn, user_input, timestamp))
+    action = None
 
-    # Occasionally add a philosophy quote (kept brief)
-    if random.random() < 0.02:
-        text_response = text_response.strip()
-        quote = get_philosophy_quote()
-        if text_response:
-            text_response += "\n\n" + quote
+    parts = []
+    try:
+        push_text = await asyncio.shield(started)
+        with metrics.span("system_action"):
+            action = asyncio.ensure_future(asyncio.to_thread(system_action, user_input))
+            sys_response = await asyncio.shield(action)
+        reply = None if sys_response else await asyncio.to_thread(_search_reply, user_input)
+        if not sys_response and reply is None:
+            with metrics.span("context"):
+                head, window, window_start, cache_key, context_summary = \
+                    await asyncio.to_thread(_prepare_messages, user_input)
+            text_response = _cached_reply(cache_key, sink)
+            if text_response is not None:
+                streamed = True
+            else:
+                with metrics.span("recall"):
+                    recalled = await asyncio.to_thread(recall_exchanges, user_input, window_start)
+                messages = _assemble(head, window, context_summary, recalled)
+                model = choose_model(user_input)
+                with metrics.span("llm"):
+                    try:
+                        text_response = await _generate_reply_async(messages, sink, parts, model)
+                    except Exception:
+                        if model == CHAT_MODEL or parts:
+                            raise
+                        # routed model unavailable: retry on CHAT_MODEL
+                        router.failed(model)
+                        last_turn["route"] = "failed"
+                        text_response = await _generate_reply_async(messages, sink, parts, CHAT_MODEL)
+                _record_first_token()
+                streamed = last_turn["streamed"]
+                if cache_key is not None and text_response.strip():
+                    reply_cache.put(cache_key, text_response)
+    except asyncio.CancelledError:
+        await started
+        sys_response = await action if action is not None else None
+        if sys_response:
+            # the action ran anyway (browser opened, command started): record what it did
+            await asyncio.to_thread(_system_reply, sys_response)
         else:
-            text_response = quote
-
-    # Save assistant reply to memory (both short and full)
-    assistant_msg = {"role": "assistant", "content": text_response, "time": timestamp}
-    memory["full_history"].append(assistant_msg)
-    memory["history"].append(assistant_msg)
+            await asyncio.to_thread(_record_stopped, "".join(parts), timestamp)
+        if parts and last_turn["streamed"]:
+            sink.end()
+        raise
 
-    # Trim short-term history again if needed
-    if len(memory["history"]) > SHORT_TERM_LIMIT:
-        memory["history"] = memory["history"][-SHORT_TERM_LIMIT:]
+    if sys_response:
+        await _off_loop(_system_reply, sys_response)
+        _deliver(sys_response, sink)
+        return sys_response
+    if reply is not None:
+        _deliver(reply, sink)
+        return reply
+    return await _off_loop(_finish_turn, user_input, text_response, push_text,
+                           streamed, sink, timestamp)
 
-    save_memory()
+class AsyncChatSession:
+    """
+    One conversation driven from an event loop: a new message cancels the
+    reply still being generated, and a stop command ("stop", "shut up", ...)
+    just cancels it without starting a new turn.
 
-    # Use typing effect to print reply to console and also return it as string
-    type_out(text_response)
-    return text_response
+        session = AsyncChatSession()
+        reply = await session.send(text, sink)   # None if stopped / superseded
+    """
 
+    def __init__(self):
+        self._task = None
+
+    @property
+    def busy(self):
+        return self._task is not None and not self._task.done()
+
+    async def cancel(self):
+        """Stop the reply in progress (if any) and wait until it has wound down."""
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def send(self, user_input, sink=None):
+        await self.cancel()
+        if user_input.lower().strip(" .!") in STOP_COMMANDS:
+            return None
+        task = self._task = asyncio.ensure_future(azrion_chat_async(user_input, sink))
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task is self._task:
+                raise   # the caller itself was cancelled
+            return None   # superseded by a newer message or a stop command
+        finally:
+            if self._task is task:
+                self._task = None
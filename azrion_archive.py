@@ -0,0 +1,188 @@
+import gzip
+import json
+import os
+import tempfile
+from bisect import bisect_right
+from collections import OrderedDict
+
+from azrion_store import write_json_atomic
+
+MANIFEST = "manifest.json"
+
+
+class SegmentedArchive:
+    """
+    full_history split into fixed-size segments on disk.
+
+    - sealed segments: seg-NNNNNN.jsonl.gz, written once and never touched again
+    - the open segment: open-NNNNNN.jsonl, one JSON line appended per message
+      (kept in RAM too, it's at most `segment_size` messages)
+    - manifest.json: per sealed segment its file, message count and time range
+
+    It behaves like the old list for what azrion.py needs (append, len, indexing,
+    iteration), but iteration streams one segment at a time.
+    """
+
+    def __init__(self, directory, segment_size=1000, cached_segments=2):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.cached_segments = cached_segments
+        os.makedirs(directory, exist_ok=True)
+        self._cache = OrderedDict()   # segment number -> decoded messages
+        self._load()
+
+    # --- manifest / open segment ---
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        try:
+            with open(self._path(MANIFEST), "r") as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {"segments": [], "open": 1}
+        # running message totals, for finding the segment that holds index i
+        self._starts = []
+        total = 0
+        for seg in self.manifest["segments"]:
+            self._starts.append(total)
+            total += seg["count"]
+        self._sealed_total = total
+
+        self._open_name = f"open-{self.manifest['open']:06d}.jsonl"
+        self._open_entries = []
+        good_end = 0
+        try:
+            with open(self._path(self._open_name), "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        self._open_entries.append(json.loads(line))
+                    except ValueError:
+                        break
+                    good_end += len(line)
+        except FileNotFoundError:
+            pass
+        self._open_file = open(self._path(self._open_name), "ab")
+        if self._open_file.tell() != good_end:
+            self._open_file.truncate(good_end)
+            self._open_file.seek(good_end)
+
+        # leftovers from a crash between sealing and deleting the old open file
+        for name in os.listdir(self.directory):
+            if name.startswith("open-") and name != self._open_name:
+                os.remove(self._path(name))
+
+    # --- writing ---
+    def append(self, msg):
+        self._open_file.write(json.dumps(msg).encode("utf-8") + b"\n")
+        self._open_file.flush()
+        self._open_entries.append(msg)
+        if len(self._open_entries) >= self.segment_size:
+            self._seal()
+
+    def extend(self, msgs):
+        for msg in msgs:
+            self.append(msg)
+
+    def sync(self):
+        """fsync the open segment (called once per saved turn)."""
+        os.fsync(self._open_file.fileno())
+
+    def _seal(self):
+        number = len(self.manifest["segments"]) + 1
+        name = f"seg-{number:06d}.jsonl.gz"
+        fd, tmp_path = tempfile.mkstemp(prefix=".azrion-", suffix=".tmp", dir=self.directory)
+        with os.fdopen(fd, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                for msg in self._open_entries:
+                    gz.write(json.dumps(msg).encode("utf-8") + b"\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, self._path(name))
+
+        entries = self._open_entries
+        self.manifest["segments"].append({
+            "file": name,
+            "count": len(entries),
+            "first_time": entries[0].get("time"),
+            "last_time": entries[-1].get("time"),
+        })
+        self.manifest["open"] += 1
+        write_json_atomic(self._path(MANIFEST), self.manifest, indent=1)
+
+        self._starts.append(self._sealed_total)
+        self._sealed_total += len(entries)
+        old_name = self._open_name
+        self._open_file.close()
+        self._open_name = f"open-{self.manifest['open']:06d}.jsonl"
+        self._open_file = open(self._path(self._open_name), "ab")
+        self._open_entries = []
+        os.remove(self._path(old_name))
+
+    # --- reading ---
+    def __len__(self):
+        return self._sealed_total + len(self._open_entries)
+
+    def _stream_segment(self, seg):
+        with gzip.open(self._path(seg["file"]), "rb") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def _segment(self, number):
+        cached = self._cache.get(number)
+        if cached is None:
+            cached = list(self._stream_segment(self.manifest["segments"][number]))
+            self._cache[number] = cached
+            if len(self._cache) > self.cached_segments:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(number)
+        return cached
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return [self[i] for i in range(start, stop, step)]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("archive index out of range")
+        if index >= self._sealed_total:
+            return self._open_entries[index - self._sealed_total]
+        number = bisect_right(self._starts, index) - 1
+        return self._segment(number)[index - self._starts[number]]
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def iter_from(self, start):
+        """Stream messages from position `start` on, skipping whole segments before it."""
+        for number, seg in enumerate(self.manifest["segments"]):
+            seg_start = self._starts[number]
+            if seg_start + seg["count"] <= start:
+                continue
+            for offset, msg in enumerate(self._stream_segment(seg)):
+                if seg_start + offset >= start:
+                    yield msg
+        skip = max(0, start - self._sealed_total)
+        yield from self._open_entries[skip:]
+
+    def iter_range(self, start_time=None, end_time=None):
+        """Stream messages whose "time" lies in [start_time, end_time] (same string format)."""
+        def in_range(t):
+            return t is not None and (start_time is None or t >= start_time) and \
+                (end_time is None or t <= end_time)
+
+        for seg in self.manifest["segments"]:
+            if start_time is not None and (seg["last_time"] or "") < start_time:
+                continue
+            if end_time is not None and (seg["first_time"] or "") > end_time:
+                continue
+            for msg in self._stream_segment(seg):
+                if in_range(msg.get("time")):
+                    yield msg
+        for msg in self._open_entries:
+            if in_range(msg.get("time")):
+                yield msg
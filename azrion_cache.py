@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from azrion_store import write_json_atomic
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_message(text):
+    """'Hey!!  ' and 'hey' should hit the same entry."""
+    text = _PUNCT_RE.sub("", text.lower())
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def context_fingerprint(messages):
+    """Short hash of the given messages' roles + contents."""
+    h = hashlib.sha1()
+    for msg in messages:
+        h.update(msg.get("role", "").encode("utf-8"))
+        h.update(b"\0")
+        h.update(msg.get("content", "").encode("utf-8"))
+        h.update(b"\1")
+    return h.hexdigest()[:16]
+
+
+class ReplyCache:
+    """
+    LRU cache of model replies with a TTL and a size bound.
+
+    Entries are {key: [reply, created_at]} in least- to most-recently-used
+    order; with a `path` the cache is loaded at start and save() writes it
+    back atomically.
+    """
+
+    def __init__(self, max_entries=256, ttl=6 * 3600, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self.load()
+
+    @staticmethod
+    def make_key(user_input, context):
+        return f"{normalize_message(user_input)}|{context_fingerprint(context)}"
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] > self.ttl:
+                del self._entries[key]
+                self.dirty = True
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, reply):
+        with self._lock:
+            self._entries[key] = [reply, time.time()]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.dirty = True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        now = time.time()
+        with self._lock:
+            for key, (reply, created) in data.items():
+                if now - created <= self.ttl:
+                    self._entries[key] = [reply, created]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = dict(self._entries)
+            self.dirty = False
+        write_json_atomic(self.path, data, indent=None)
+
+
+class AudioCache:
+    """
+    Content-addressed store of synthesized speech.
+
+    One raw PCM file per (voice, text) under `directory`, named by the sha1
+    of both, so the same sentence in the same voice is only synthesized once.
+    The total size stays under max_bytes by deleting the least recently used
+    files; recency is the file's mtime (bumped on every hit), so it survives
+    restarts.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, voice=""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.voice = voice
+        self._entries = OrderedDict()   # key -> size in bytes, least recently used first
+        self._lock = threading.Lock()
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def key(self, text):
+        return hashlib.sha1(f"{self.voice}\0{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pcm")
+
+    def __contains__(self, text):
+        return self.key(text) in self._entries
+
+    def get(self, text):
+        key = self.key(text)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                pcm = f.read()
+            os.utime(self._path(key))
+        except OSError:
+            with self._lock:
+                self.total -= self._entries.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return pcm
+
+    def put(self, text, pcm):
+        if not pcm or len(pcm) > self.max_bytes:
+            return
+        key = self.key(text)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".azrion-", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(pcm)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self.total += len(pcm) - self._entries.pop(key, 0)
+            self._entries[key] = len(pcm)
+            evicted = []
+            while self.total > self.max_bytes and self._entries:
+                old, size = self._entries.popitem(last=False)
+                self.total -= size
+                evicted.append(old)
+        for old in evicted:
+            try:
+                os.remove(self._path(old))
+            except OSError:
+                pass
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(".pcm")]
+        except OSError:
+            return
+        files = []
+        for name in names:
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            files.append((st.st_mtime, name[:-4], st.st_size))
+        files.sort()
+        with self._lock:
+            for _, key, size in files:
+                self._entries[key] = size
+                self.total += size
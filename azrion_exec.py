@@ -0,0 +1,217 @@
+import itertools
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+
+class Job:
+    """
+    One command started by Executor.
+
+    status is "running", "done" (exit code 0), "failed" (non-zero exit or
+    could not start), "timeout" or "killed". Output (stdout + stderr) is kept
+    up to the executor's max_output characters; past that it is still read
+    (so the child never blocks on a full pipe) but dropped, and truncated is
+    set. on_line, when set, gets every kept line as it arrives; the executor
+    calls it with the job lock held, so clearing it under the lock (detach())
+    guarantees no call comes after.
+    """
+
+    def __init__(self, job_id, cmd, timeout, on_line=None):
+        self.id = job_id
+        self.cmd = cmd
+        self.timeout = timeout
+        self.on_line = on_line
+        self.status = "running"
+        self.returncode = None
+        self.error = None
+        self.truncated = False
+        self.started = time.time()
+        self.finished = None
+        self.lock = threading.Lock()
+        self._chunks = []
+        self._size = 0
+        self._done = threading.Event()
+        self._proc = None
+        self._timer = None
+        self._stop_reason = None
+
+    @property
+    def running(self):
+        return not self._done.is_set()
+
+    def wait(self, timeout=None):
+        """True once the job has finished (False if still running after timeout seconds)."""
+        return self._done.wait(timeout)
+
+    def detach(self):
+        """Stop passing lines to on_line (they are still collected); returns the output passed so far."""
+        with self.lock:
+            self.on_line = None
+            return "".join(self._chunks)
+
+    def output(self):
+        with self.lock:
+            return "".join(self._chunks)
+
+    def describe(self):
+        """One line: id, status / exit code, runtime and the command."""
+        end = self.finished or time.time()
+        state = self.status if self.returncode is None else f"{self.status} (exit {self.returncode})"
+        cmd = self.cmd if isinstance(self.cmd, str) else " ".join(self.cmd)
+        return f"#{self.id} {state}, {end - self.started:.1f}s: {cmd}"
+
+
+class Executor:
+    """
+    Runs commands on background threads with a timeout and an output cap.
+
+        job = executor.submit(["playerctl", "play"])          # fire and forget
+        job = executor.submit(cmd, timeout=60, on_line=print)  # stream lines
+        job.wait(5)                                           # or executor.run(cmd)
+
+    Each child gets its own session, so a timeout or kill() takes down the
+    whole process group (e.g. everything a `bash -lc` started): SIGTERM,
+    then SIGKILL after kill_grace seconds. Up to keep_finished finished jobs
+    are remembered for status queries.
+
+    A job ends when its command exits, even if something it started in the
+    background (`cmd &`, the file manager behind xdg-open) still holds the
+    output pipe: after `linger` seconds the rest of the output is read but
+    no longer waited for.
+    """
+
+    def __init__(self, default_timeout=30.0, max_output=64 * 1024, keep_finished=20, kill_grace=2.0,
+                 linger=0.5):
+        self.default_timeout = default_timeout
+        self.max_output = max_output
+        self.keep_finished = keep_finished
+        self.kill_grace = kill_grace
+        self.linger = linger
+        self.jobs = OrderedDict()       # id -> Job, oldest first
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, cmd, timeout=None, on_line=None):
+        """Start cmd (a list; a string runs through the shell) and return its Job at once."""
+        timeout = self.default_timeout if timeout is None else timeout
+        with self._lock:
+            job = Job(next(self._ids), cmd, timeout, on_line)
+            self.jobs[job.id] = job
+            self._prune()
+        try:
+            job._proc = subprocess.Popen(
+                cmd,
+                shell=isinstance(cmd, str),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                errors="replace",
+                start_new_session=True,
+            )
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, "failed")
+            return job
+        if timeout:
+            job._timer = threading.Timer(timeout, self._stop, args=(job, "timeout"))
+            job._timer.daemon = True
+            job._timer.start()
+        threading.Thread(target=self._pump, args=(job,), name=f"azrion-job-{job.id}", daemon=True).start()
+        threading.Thread(target=self._reap, args=(job,), name=f"azrion-job-{job.id}-wait", daemon=True).start()
+        return job
+
+    def run(self, cmd, timeout=None):
+        """submit() and wait for the job to end (at most its timeout plus the kill grace)."""
+        job = self.submit(cmd, timeout)
+        if job.timeout:
+            if not job.wait(job.timeout + 2 * self.kill_grace + self.linger + 1):
+                self._stop(job, "timeout")
+        else:
+            job.wait()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def all_jobs(self):
+        with self._lock:
+            return list(self.jobs.values())
+
+    def kill(self, job_id):
+        """Stop a running job; False if there is no such job or it already ended."""
+        job = self.get(job_id)
+        if job is None or not job.running:
+            return False
+        self._stop(job, "killed")
+        return True
+
+    # --- internals ---
+    def _pump(self, job):
+        proc = job._proc
+        for line in proc.stdout:
+            with job.lock:
+                room = self.max_output - job._size
+                if room <= 0:
+                    job.truncated = True
+                    continue
+                if len(line) > room:
+                    line = line[:room]
+                    job.truncated = True
+                job._chunks.append(line)
+                job._size += len(line)
+                if job.on_line is not None:
+                    try:
+                        job.on_line(line)
+                    except Exception:
+                        job.on_line = None
+        proc.stdout.close()
+        self._exited(job, proc.wait())
+
+    def _reap(self, job):
+        # the command exited but the pipe stays open: don't wait on its background children
+        proc = job._proc
+        returncode = proc.wait()
+        if not job.wait(self.linger):
+            self._exited(job, returncode)
+
+    def _exited(self, job, returncode):
+        job.returncode = returncode
+        if job._timer is not None:
+            job._timer.cancel()
+        self._finish(job, job._stop_reason or ("done" if returncode == 0 else "failed"))
+
+    def _stop(self, job, reason):
+        proc = job._proc
+        if proc is None or not job.running:
+            return
+        job._stop_reason = reason
+        # signal the group even if its leader is gone: the rest of it may still be running
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(proc.pid, sig)
+            except (ProcessLookupError, PermissionError):
+                break
+            if job.wait(self.kill_grace):
+                return
+        # still not over (e.g. a child left the group and holds the pipe): stop waiting for it
+        self._exited(job, proc.poll())
+
+    def _finish(self, job, status):
+        with job.lock:
+            if job._done.is_set():
+                return
+            job.status = status
+            job.finished = time.time()
+            job._done.set()
+
+    def _prune(self):
+        # drop the oldest finished jobs beyond keep_finished (call with _lock held)
+        finished = [job_id for job_id, job in self.jobs.items() if not job.running]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job_id]
@@ -0,0 +1,302 @@
+import gzip
+import os
+import re
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from heapq import nsmallest
+
+MAGIC = "AZFILES1\n"
+GLOB_CHARS = set("*?[")
+
+
+def _glob_re(pattern):
+    """Shell glob -> regex over one path line ("*" and "?" never cross a "/")."""
+    out = []
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "*":
+            out.append("[^/\n]*")
+        elif ch == "?":
+            out.append("[^/\n]")
+        elif ch == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                out.append(re.escape(ch))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end
+        else:
+            out.append(re.escape(ch))
+        i += 1
+    return "".join(out)
+
+
+def _basename(path):
+    return path.rstrip("/").rsplit("/", 1)[-1]
+
+
+class FileIndex:
+    """
+    Index of every path under root, answering "search files for" without a walk.
+
+    dirs maps each directory (relative to root, "" or "a/b/") to its mtime and
+    entry names (sub-directories end with "/"). refresh() stats every directory
+    but only re-lists the ones whose mtime changed, which is what creating,
+    deleting or renaming something inside them updates. Queries run over one
+    newline-joined, lower-cased string of all paths in sorted order (str.find
+    / re at C speed) and map hits back to paths through an offset array.
+    """
+
+    def __init__(self, path, root, skip_hidden=True, exclude=()):
+        self.path = path
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.skip_hidden = skip_hidden
+        self.exclude = set(exclude)
+        self.dirs = {}              # rel dir -> (mtime_ns, tuple of names)
+        self.ready = False          # True once there is something to search (loaded or built)
+        self._snapshot = ([], ("", array("Q")), ("", array("Q")))
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+
+    # --- building ---
+    def _list(self, directory):
+        names = []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    name = entry.name
+                    if "\n" in name or name in self.exclude:
+                        continue
+                    if self.skip_hidden and name.startswith("."):
+                        continue
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        is_dir = False
+                    names.append(name + "/" if is_dir else name)
+        except OSError:
+            pass
+        names.sort()
+        return tuple(names)
+
+    def refresh(self):
+        """Bring the index up to date; returns the number of directories that were re-listed."""
+        with self._refresh_lock:
+            old = self.dirs
+            new = {}
+            relisted = 0
+            stack = [""]
+            while stack:
+                rel = stack.pop()
+                try:
+                    mtime = os.stat(os.path.join(self.root, rel)).st_mtime_ns
+                except OSError:
+                    continue
+                known = old.get(rel)
+                if known is not None and known[0] == mtime:
+                    names = known[1]
+                else:
+                    names = self._list(os.path.join(self.root, rel))
+                    relisted += 1
+                new[rel] = (mtime, names)
+                stack.extend(rel + name for name in names if name.endswith("/"))
+            if relisted or len(new) != len(old):
+                self.dirs = new
+                self._rebuild()
+            self.ready = True
+            return relisted
+
+    @staticmethod
+    def _joined(lines):
+        starts = array("Q")
+        pos = 0
+        for line in lines:
+            starts.append(pos)
+            pos += len(line) + 1
+        return "\n".join(lines), starts
+
+    def _rebuild(self):
+        paths = sorted(rel + name for rel, (_, names) in self.dirs.items() for name in names)
+        lowered = [p.lower() for p in paths]
+        # the same lines cut down to the name: globs and fuzzy queries without a "/" only look here
+        blob, starts = self._joined(lowered)
+        names, name_starts = self._joined([_basename(p) for p in lowered])
+        self._snapshot = (paths, (blob, starts), (names, name_starts))
+
+    def start(self, interval):
+        """Refresh now and then every `interval` seconds on a daemon thread (saving when changed)."""
+        if self._thread is not None:
+            return
+
+        def loop():
+            while True:
+                try:
+                    if self.refresh():
+                        self.save()
+                except Exception:
+                    pass
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=loop, name="azrion-files", daemon=True)
+        self._thread.start()
+
+    # --- queries ---
+    def _lines(self, text, needle=None, regex=None, check=None):
+        """
+        Indices of the lines of text ((blob, starts)) containing needle or
+        matching regex, and passing check(line) if given.
+        """
+        blob, starts = text
+        found = []
+        pos = 0
+        while True:
+            if needle is not None:
+                hit = blob.find(needle, pos)
+                if hit == -1:
+                    break
+            else:
+                m = regex.search(blob, pos)
+                if m is None:
+                    break
+                hit = m.start()
+            line = bisect_right(starts, hit) - 1
+            end = blob.find("\n", hit)
+            if check is None or check(blob[starts[line]:end if end != -1 else len(blob)]):
+                found.append(line)
+            if end == -1:
+                break
+            pos = end + 1
+        return found
+
+    def search(self, query, limit=30, offset=0, mode="auto"):
+        """
+        (mode, total, paths): absolute paths matching query, best first, limit
+        of them starting at offset. mode "auto" picks "glob" when query has
+        * ? or [, else "substring", falling back to "fuzzy" (the letters of
+        query in order) when nothing contains it. Case-insensitive. Globs and
+        fuzzy queries without a "/" are matched against names only; a glob
+        with one has to match whole trailing path components ("src/*.py").
+        Every hit is counted in total and ranked; only the best
+        offset + limit are sorted.
+        """
+        paths, full, names = self._snapshot
+        q = query.strip().lower()
+        if not q or not paths:
+            return mode, 0, []
+        if mode == "auto":
+            mode = "glob" if GLOB_CHARS & set(q) else "substring"
+            if mode == "substring" and full[0].find(q) == -1:
+                mode = "fuzzy"
+        text = full if "/" in q else names
+
+        if mode == "glob":
+            regex = re.compile(("(?:.*/)?" if "/" in q else "") + _glob_re(q) + "/?")
+            # let str.find pick candidate lines by the longest literal run, the regex only confirms
+            literal = max(re.split(r"[*?]|\[[^\]]*\]", q), key=len)
+            if literal:
+                lines = self._lines(text, needle=literal, check=regex.fullmatch)
+            else:
+                lines = self._lines(text, regex=re.compile("^" + regex.pattern + "$", re.M))
+            key = lambda i: (paths[i].count("/"), len(paths[i]), paths[i])
+        elif mode == "fuzzy":
+            # a[^\nb]*b[^\nc]*c: each gap stops at the next letter, so there is no backtracking
+            letters = [ch for ch in q if not ch.isspace()]
+            regex = re.compile(re.escape(letters[0]) + "".join(
+                "[^\n" + re.escape(ch) + "]*" + re.escape(ch) for ch in letters[1:]))
+            lines = self._lines(text, regex=regex)
+            key = lambda i: self._fuzzy_rank(paths[i].lower(), q)
+        else:
+            lines = self._lines(full, needle=q)
+            key = lambda i: self._substring_rank(paths[i].lower(), q)
+
+        page = nsmallest(offset + limit, lines, key=key)[offset:]
+        return mode, len(lines), [os.path.join(self.root, paths[i]) for i in page]
+
+    @staticmethod
+    def _substring_rank(path, q):
+        base = _basename(path)
+        if base == q:
+            tier = 0
+        elif base.startswith(q):
+            tier = 1
+        elif q in base:
+            tier = 2
+        else:
+            tier = 3        # only the directory part matched
+        return tier, path.count("/"), len(path), path
+
+    @staticmethod
+    def _fuzzy_rank(path, q):
+        # tightest span of the letters (greedy from the last possible start), name over directory
+        letters = [ch for ch in q if not ch.isspace()]
+        best = None
+        start = path.find(letters[0])
+        while start != -1:
+            pos = start
+            for ch in letters[1:]:
+                pos = path.find(ch, pos + 1)
+                if pos == -1:
+                    break
+            if pos == -1:
+                break
+            span = pos - start
+            if best is None or span <= best[0]:
+                best = (span, start)
+            start = path.find(letters[0], start + 1)
+        span, start = best if best is not None else (len(path), 0)
+        in_name = start > path.rstrip("/").rfind("/")
+        return 0 if in_name else 1, span, len(path), path
+
+    # --- persistence ---
+    # Layout (gzip text): MAGIC, root line, then one line per directory:
+    # mtime_ns \0 rel dir \0 name \0 name ... (names never contain \0 or \n)
+    def save(self):
+        dirs = self.dirs
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".azrion-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=1) as f:
+                f.write((MAGIC + self.root + "\n").encode("utf-8", "surrogateescape"))
+                for rel, (mtime, names) in dirs.items():
+                    line = "\0".join((str(mtime), rel) + names) + "\n"
+                    f.write(line.encode("utf-8", "surrogateescape"))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def load(self):
+        """Load the saved index; returns False (and stays empty) if missing, unreadable or for another root."""
+        try:
+            with gzip.open(self.path, "rb") as f:
+                text = f.read().decode("utf-8", "surrogateescape")
+        except (OSError, EOFError):
+            return False
+        if not text.startswith(MAGIC):
+            return False
+        lines = text[len(MAGIC):].split("\n")
+        if lines[0] != self.root:
+            return False
+        dirs = {}
+        try:
+            for line in lines[1:]:
+                if line:
+                    fields = line.split("\0")
+                    dirs[fields[1]] = (int(fields[0]), tuple(fields[2:]))
+        except (ValueError, IndexError):
+            return False
+        with self._refresh_lock:
+            self.dirs = dirs
+            self._rebuild()
+            self.ready = True
+        return True
@@ -1,12 +1,32 @@
 import sys
 from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QTextEdit, QLineEdit, QPushButton
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QObject, QThread, pyqtSignal
+from PyQt6.QtGui import QTextCursor
 
 # IMPORTANT:
 # Change 'azrion_main' to the actual filename of your current script (without .py).
 # For example, if your big script is in "azrion.py", use:
 #   from azrion import azrion_chat, get_ai_greeting
-from azrion import azrion_chat, get_ai_greeting  # adjust module name if needed
+from azrion import azrion_chat, get_ai_greeting, CallbackSink  # adjust module name if needed
+
+
+class ChatWorker(QObject):
+    """Runs azrion_chat off the UI thread and streams reply chunks back as signals."""
+    token = pyqtSignal(str)
+    finished = pyqtSignal(str)
+
+    def __init__(self, user_text):
+        super().__init__()
+        self.user_text = user_text
+
+    def run(self):
+        try:
+            reply = azrion_chat(self.user_text, sink=CallbackSink(self.token.emit))
+        except Exception as e:
+            # Ollama down, model missing...: show it, and still finish so the UI unlocks
+            reply = f"(couldn't answer: {e})"
+            self.token.emit(reply)
+        self.finished.emit(reply)
 
 
 class AzrionWindow(QWidget):
@@ -28,6 +48,8 @@ class AzrionWindow(QWidget):
 
         self.send_button.clicked.connect(self.send_message)
         self.input_line.returnPressed.connect(self.send_message)
+        self.chat_thread = None
+        self.chat_worker = None
 
         # Initial greeting from your existing function
         greeting = get_ai_greeting()
@@ -36,16 +58,38 @@ class AzrionWindow(QWidget):
     def append_message(self, sender, text):
         self.chat_view.append(f"{sender}: {text}")
 
+    def append_chunk(self, text):
+        cursor = self.chat_view.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+        self.chat_view.setTextCursor(cursor)
+
     def send_message(self):
         user_text = self.input_line.text().strip()
-        if not user_text:
+        if not user_text or self.chat_thread is not None:
             return
         self.append_message("You", user_text)
         self.input_line.clear()
+        self.send_button.setEnabled(False)
+
+        # Use your existing chat logic (includes system_action, memory, etc.),
+        # on a worker thread so the reply can stream in while the UI stays live
+        self.append_message("Azrion", "")
+        self.chat_thread = QThread(self)
+        self.chat_worker = ChatWorker(user_text)
+        self.chat_worker.moveToThread(self.chat_thread)
+        self.chat_thread.started.connect(self.chat_worker.run)
+        self.chat_worker.token.connect(self.append_chunk)
+        self.chat_worker.finished.connect(self.chat_done)
+        self.chat_worker.finished.connect(self.chat_thread.quit)
+        self.chat_worker.finished.connect(self.chat_worker.deleteLater)
+        self.chat_thread.finished.connect(self.chat_thread.deleteLater)
+        self.chat_thread.start()
 
-        # Use your existing chat logic (includes system_action, memory, etc.)
-        reply = azrion_chat(user_text)
-        self.append_message("Azrion", reply)
+    def chat_done(self, reply):
+        self.chat_thread = None
+        self.chat_worker = None
+        self.send_button.setEnabled(True)
 
 
 def main():
@@ -0,0 +1,200 @@
+import heapq
+import json
+import math
+import os
+import re
+import struct
+import tempfile
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+TOKEN_RE = re.compile(r"\w+")
+PHRASE_RE = re.compile(r'"([^"]+)"')
+MAGIC = b"AZIDX1\n"
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def _contains(postings, doc_id):
+    i = bisect_left(postings, doc_id)
+    return i < len(postings) and postings[i] == doc_id
+
+
+def _has_phrase(tokens, phrase):
+    n = len(phrase)
+    first = phrase[0]
+    for i, tok in enumerate(tokens):
+        if tok == first and tokens[i:i + n] == phrase:
+            return True
+    return False
+
+
+class HistoryIndex:
+    """
+    Inverted index over full_history messages (doc id = position in full_history).
+
+    postings[token] is an ascending array of doc ids with a parallel array of
+    term frequencies; doc_lens holds the token count of every doc. New messages
+    are appended with add(), so ids stay sorted without any re-sorting.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.postings = {}          # token -> array("I") of doc ids
+        self.freqs = {}             # token -> array("H") of term frequencies
+        self.doc_lens = array("H")  # doc id -> number of tokens
+        self.dirty = 0              # docs added since the last save
+
+    @property
+    def doc_count(self):
+        return len(self.doc_lens)
+
+    # --- building ---
+    def add(self, doc_id, text):
+        if doc_id != self.doc_count:
+            raise ValueError(f"index expected doc {self.doc_count}, got {doc_id}")
+        tokens = tokenize(text)
+        for tok, tf in Counter(tokens).items():
+            ids = self.postings.get(tok)
+            if ids is None:
+                ids = self.postings[tok] = array("I")
+                self.freqs[tok] = array("H")
+            ids.append(doc_id)
+            self.freqs[tok].append(min(tf, 0xFFFF))
+        self.doc_lens.append(min(len(tokens), 0xFFFF))
+        self.dirty += 1
+
+    def catch_up(self, full_history):
+        """Index whatever full_history has beyond what we have (or rebuild if it shrank)."""
+        if self.doc_count > len(full_history):
+            self.postings, self.freqs, self.doc_lens = {}, {}, array("H")
+        start = self.doc_count
+        if hasattr(full_history, "iter_from"):
+            entries = full_history.iter_from(start)  # segmented archive: stream, don't load
+        else:
+            entries = full_history[start:]
+        for offset, entry in enumerate(entries):
+            self.add(start + offset, entry.get("content", ""))
+
+    # --- querying ---
+    def search(self, query, full_history, limit=None, rank="recent", max_candidates=5000):
+        """
+        Return (doc_id, entry) pairs for messages containing every query term
+        (AND). "quoted text" must appear as an exact token sequence.
+
+        rank="recent": newest first, stops as soon as `limit` hits are found.
+        rank="relevance": BM25 over the newest `max_candidates` matches, then
+        entries are only fetched (and phrases checked) until `limit` is reached.
+        """
+        phrases = [tokenize(p) for p in PHRASE_RE.findall(query)]
+        phrases = [p for p in phrases if len(p) > 1]
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        lists = []
+        for tok in terms:
+            ids = self.postings.get(tok)
+            if ids is None:
+                return []
+            lists.append((tok, ids))
+        lists.sort(key=lambda item: len(item[1]))
+        (_, smallest), rest = lists[0], lists[1:]
+
+        def candidates():
+            # walk the rarest term newest-first, probe the others by bisection
+            for doc_id in reversed(smallest):
+                if all(_contains(ids, doc_id) for _, ids in rest):
+                    yield doc_id
+
+        if rank == "relevance":
+            ordered = self._rank(lists, candidates(), max_candidates)
+        else:
+            ordered = candidates()
+
+        results = []
+        for doc_id in ordered:
+            entry = full_history[doc_id]
+            if phrases:
+                tokens = tokenize(entry.get("content", ""))
+                if not all(_has_phrase(tokens, p) for p in phrases):
+                    continue
+            results.append((doc_id, entry))
+            if limit is not None and len(results) >= limit:
+                break
+        return results
+
+    def _rank(self, lists, candidates, max_candidates, k1=1.2, b=0.75):
+        n = self.doc_count
+        avg_len = (sum(self.doc_lens) / n) if n else 1.0
+        idf = {tok: math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5)) for tok, ids in lists}
+        scored = []
+        for count, doc_id in enumerate(candidates):
+            if count >= max_candidates:
+                break
+            norm = k1 * (1 - b + b * self.doc_lens[doc_id] / avg_len)
+            score = 0.0
+            for tok, ids in lists:
+                tf = self.freqs[tok][bisect_left(ids, doc_id)]
+                score += idf[tok] * tf * (k1 + 1) / (tf + norm)
+            scored.append((-score, -doc_id))
+        heapq.heapify(scored)
+        while scored:
+            yield -heapq.heappop(scored)[1]
+
+    # --- persistence ---
+    # Layout: MAGIC, u32 header length, JSON header {"docs", "terms": [[tok, df], ...]},
+    # then all doc-id arrays, all tf arrays and the doc length array, back to back.
+    def save(self):
+        terms = [[tok, len(ids)] for tok, ids in self.postings.items()]
+        header = json.dumps({"docs": self.doc_count, "terms": terms}).encode("utf-8")
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".azrion-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(MAGIC)
+                f.write(struct.pack("<I", len(header)))
+                f.write(header)
+                for tok, _ in terms:
+                    self.postings[tok].tofile(f)
+                for tok, _ in terms:
+                    self.freqs[tok].tofile(f)
+                self.doc_lens.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self.dirty = 0
+
+    def load(self):
+        """Load the saved index; returns False (and stays empty) if missing or unreadable."""
+        try:
+            with open(self.path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    return False
+                (header_len,) = struct.unpack("<I", f.read(4))
+                header = json.loads(f.read(header_len))
+                all_ids = array("I")
+                all_freqs = array("H")
+                total = sum(df for _, df in header["terms"])
+                all_ids.fromfile(f, total)
+                all_freqs.fromfile(f, total)
+                doc_lens = array("H")
+                doc_lens.fromfile(f, header["docs"])
+        except (OSError, ValueError, EOFError, struct.error):
+            return False
+        postings, freqs, pos = {}, {}, 0
+        for tok, df in header["terms"]:
+            postings[tok] = all_ids[pos:pos + df]
+            freqs[tok] = all_freqs[pos:pos + df]
+            pos += df
+        self.postings, self.freqs, self.doc_lens = postings, freqs, doc_lens
+        self.dirty = 0
+        return True
@@ -0,0 +1,110 @@
+import threading
+from collections import deque
+
+
+class Matches:
+    """What one scan found: payloads of every matched pattern, and the patterns themselves."""
+
+    __slots__ = ("payloads", "patterns")
+
+    def __init__(self, payloads, patterns):
+        self.payloads = payloads
+        self.patterns = patterns
+
+    def has(self, group, name):
+        return (group, name) in self.payloads
+
+    def names(self, group):
+        return {name for g, name in self.payloads if g == group}
+
+    def any(self, group):
+        return any(g == group for g, _ in self.payloads)
+
+
+class KeywordMatcher:
+    """
+    Registry of keyword patterns compiled into one Aho-Corasick automaton.
+
+    add(pattern, payload) registers a substring pattern (payload is a
+    (group, name) pair, e.g. ("habit", "work")); with prefix=True it only
+    counts when the text starts with it. scan(text) walks the text once and
+    returns every payload whose pattern occurs, no matter how many patterns
+    are registered. Matching is on the text as given: lower-case it first.
+
+    The automaton is a full DFA (failure links folded into the transitions),
+    so the scan is one dict lookup per character. It is (re)built lazily on
+    the first scan after an add().
+    """
+
+    def __init__(self):
+        self._entries = {}      # pattern -> [(payload, prefix_only), ...]
+        self._delta = None      # state -> {char: next state}
+        self._out = None        # state -> tuple of patterns ending here
+        self._lock = threading.Lock()
+
+    def add(self, pattern, payload, prefix=False):
+        if not pattern:
+            raise ValueError("empty pattern")
+        with self._lock:
+            self._entries.setdefault(pattern, []).append((payload, prefix))
+            self._delta = None
+
+    def _compile(self):
+        goto = [{}]
+        out = [[]]
+        for pattern in self._entries:
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append([])
+                state = nxt
+            out[state].append(pattern)
+
+        # breadth-first: failure links, then copy the missing transitions from
+        # the failure state so scanning never has to follow a link
+        fail = [0] * len(goto)
+        delta = [dict(edges) for edges in goto]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                if state:
+                    f = fail[state]
+                    while f and ch not in goto[f]:
+                        f = fail[f]
+                    fail[nxt] = goto[f].get(ch, 0)
+                out[nxt].extend(out[fail[nxt]])
+            if state:
+                for ch, target in delta[fail[state]].items():
+                    delta[state].setdefault(ch, target)
+        self._out = [tuple(o) for o in out]
+        self._delta = delta
+
+    def scan(self, text):
+        with self._lock:
+            if self._delta is None:
+                self._compile()
+            delta, out, entries = self._delta, self._out, self._entries
+        state = 0
+        found = []
+        for i, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            if out[state]:
+                found.append((i, out[state]))
+
+        payloads = set()
+        patterns = set()
+        for end, ended in found:
+            for pattern in ended:
+                at_start = end + 1 == len(pattern)
+                for payload, prefix_only in entries[pattern]:
+                    if prefix_only and not at_start:
+                        continue
+                    payloads.add(payload)
+                    patterns.add(pattern)
+        return Matches(payloads, patterns)
@@ -0,0 +1,250 @@
+import contextvars
+import cProfile
+import heapq
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+from azrion_store import write_text_atomic
+
+# Prometheus histogram bucket bounds (seconds)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# the turn a span belongs to; a ContextVar so threads and asyncio tasks each see their own
+_current_turn = contextvars.ContextVar("azrion_turn", default=None)
+
+
+class Histogram:
+    """Durations of one stage: the last `window` samples (for percentiles) plus lifetime buckets."""
+
+    def __init__(self, window):
+        self.recent = deque(maxlen=window)
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.recent.append(seconds)
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, p):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))]
+
+
+class _NullSpan:
+    # shared do-nothing context manager: all a span costs while metrics are off
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _Turn:
+    def __init__(self, metrics, kind, profile):
+        self.metrics = metrics
+        self.record = {"kind": kind, "stages": {}}
+        self.profile = profile
+        self.profiler = None
+
+    def __enter__(self):
+        self.token = _current_turn.set(self.record)
+        if self.profile:
+            self.profiler = self.metrics._start_profile()
+        self.start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, *exc):
+        total = time.perf_counter() - self.start
+        _current_turn.reset(self.token)
+        self.metrics._end_turn(self.record, total, self.profiler)
+        return False
+
+
+class Metrics:
+    """
+    Per-stage timing for chat turns.
+
+        with metrics.turn():                # one chat turn
+            with metrics.span("llm"):       # one stage of it (or of anything else)
+                ...
+
+    Every stage keeps a rolling histogram (METRICS_WINDOW samples); each turn
+    also becomes a record {"time", "kind", "total", "stages": {name: seconds}}.
+    Spans outside a turn (background saves, TTS of the greeting) only go to
+    the histograms. With enabled=False span() / turn() return a shared no-op.
+
+    profile_slowest=N runs cProfile + tracemalloc during every turn and keeps
+    the reports of the N slowest under profile_dir (this one is not cheap).
+    """
+
+    def __init__(self, enabled=False, window=1000, profile_slowest=0, profile_dir="azrion_profiles"):
+        self.enabled = enabled
+        self.window = window
+        self.profile_slowest = profile_slowest
+        self.profile_dir = profile_dir
+        self.histograms = {}
+        self.turns = deque(maxlen=window)
+        self._slowest = []            # min-heap of (total, report path prefix)
+        self._lock = threading.Lock()
+        self._profiling = False
+        self._profiled = 0            # turns profiled so far (keeps report names unique)
+
+    # --- recording ---
+    def span(self, name):
+        return _Span(self, name) if self.enabled else NULL_SPAN
+
+    def turn(self, kind="chat", profile=True):
+        if not self.enabled:
+            return NULL_SPAN
+        return _Turn(self, kind, profile and self.profile_slowest > 0)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram(self.window)
+            hist.observe(seconds)
+        record = _current_turn.get()
+        if record is not None:
+            stages = record["stages"]
+            stages[name] = stages.get(name, 0.0) + seconds
+
+    def annotate(self, **fields):
+        """Add fields (e.g. token counts) to the current turn's record."""
+        record = _current_turn.get()
+        if record is not None:
+            record.update(fields)
+
+    def _end_turn(self, record, total, profiler):
+        record["time"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        record["total"] = total
+        self.observe("turn", total)
+        with self._lock:
+            self.turns.append(record)
+        if profiler is not None:
+            self._finish_profile(profiler, total)
+
+    # --- slowest-turn profiles ---
+    def _start_profile(self):
+        with self._lock:
+            if self._profiling:   # one profiler at a time (overlapping async turns)
+                return None
+            self._profiling = True
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        tracemalloc.clear_traces()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler, started
+
+    def _finish_profile(self, profiling, total):
+        profiler, started = profiling
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        if started:
+            tracemalloc.stop()
+        try:
+            if len(self._slowest) >= self.profile_slowest and total <= self._slowest[0][0]:
+                return
+            os.makedirs(self.profile_dir, exist_ok=True)
+            self._profiled += 1
+            name = f"turn-{time.strftime('%Y%m%d-%H%M%S')}-{self._profiled}-{total * 1000:.0f}ms"
+            prefix = os.path.join(self.profile_dir, name)
+            profiler.dump_stats(prefix + ".prof")
+            with open(prefix + ".alloc.txt", "w") as f:
+                f.write(f"turn took {total * 1000:.1f} ms; top allocations by line:\n")
+                for stat in snapshot.statistics("lineno")[:25]:
+                    f.write(f"{stat}\n")
+            heapq.heappush(self._slowest, (total, prefix))
+            if len(self._slowest) > self.profile_slowest:
+                _, dropped = heapq.heappop(self._slowest)
+                for suffix in (".prof", ".alloc.txt"):
+                    try:
+                        os.remove(dropped + suffix)
+                    except OSError:
+                        pass
+        finally:
+            with self._lock:
+                self._profiling = False
+
+    # --- reading / export ---
+    def report(self):
+        """Plain-text table: count and p50 / p95 / p99 / max (ms) per stage."""
+        with self._lock:
+            hists = sorted(self.histograms.items())
+            lines = [f"{'stage':<16} {'count':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"]
+            for name, hist in hists:
+                cells = [hist.percentile(p) for p in (50, 95, 99)] + [max(hist.recent, default=None)]
+                cells = " ".join(f"{'-':>9}" if v is None else f"{v * 1000:>9.1f}" for v in cells)
+                lines.append(f"{name:<16} {hist.count:>7} {cells}")
+        return "\n".join(lines)
+
+    def write_jsonl(self, path):
+        """The recent turn records, one JSON object per line."""
+        with self._lock:
+            text = "".join(json.dumps(record) + "\n" for record in self.turns)
+        write_text_atomic(path, text)
+
+    def write_prometheus(self, path):
+        """Prometheus text format: a histogram per stage plus recent-window quantiles."""
+        out = [
+            "# HELP azrion_stage_seconds Time spent per stage of a chat turn.",
+            "# TYPE azrion_stage_seconds histogram",
+        ]
+        with self._lock:
+            hists = sorted(self.histograms.items())
+            for name, hist in hists:
+                cumulative = 0
+                for bound, n in zip(BUCKETS, hist.buckets):
+                    cumulative += n
+                    out.append(f'azrion_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                out.append(f'azrion_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {hist.count}')
+                out.append(f'azrion_stage_seconds_sum{{stage="{name}"}} {hist.sum:.6f}')
+                out.append(f'azrion_stage_seconds_count{{stage="{name}"}} {hist.count}')
+            out.append("# HELP azrion_stage_recent_seconds Quantiles over the most recent samples per stage.")
+            out.append("# TYPE azrion_stage_recent_seconds summary")
+            for name, hist in hists:
+                for q in (50, 95, 99):
+                    value = hist.percentile(q)
+                    if value is not None:
+                        out.append(f'azrion_stage_recent_seconds{{stage="{name}",quantile="{q / 100}"}} {value:.6f}')
+        write_text_atomic(path, "\n".join(out) + "\n")
+
+    def export(self, path):
+        """Write to path: Prometheus text for *.prom / *.txt, JSONL otherwise."""
+        if path.endswith((".prom", ".txt")):
+            self.write_prometheus(path)
+        else:
+            self.write_jsonl(path)
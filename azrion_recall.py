@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # retrieval is optional; azrion.py turns it off without numpy
+    np = None
+
+from azrion_index import tokenize
+from azrion_store import write_json_atomic
+
+
+def hash_embed(texts, dim=256):
+    """
+    Stand-in embedder (no model needed): signed hashing of word unigrams and
+    bigrams. Much weaker than a real embedding model, but keeps recall working
+    offline.
+    """
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        for feature in tokens + [a + " " + b for a, b in zip(tokens, tokens[1:])]:
+            h = zlib.crc32(feature.encode("utf-8"))
+            out[row, h % dim] += 1.0 if (h >> 31) else -1.0
+    return out
+
+
+class VectorStore:
+    """
+    One float32 row per full_history message (row i = message i), in a
+    memory-mapped file that grows by doubling. Rows are L2-normalized, so a
+    single matrix-vector product gives cosine similarity for every message.
+
+    A full scan is memory-bound (100k x 768 floats is 300 MB per query), so
+    with `coarse_dims` the first that many dimensions of every row are also
+    kept, renormalized, in a small contiguous matrix (`<path>.coarse`).
+    search() scans that one and reranks the best candidates with the full
+    vectors. Matryoshka-trained models (nomic-embed-text) put most of the
+    meaning into the leading dimensions, which is what makes this work.
+    `<path>.json` holds dim / count / model / coarse_dims.
+    """
+
+    def __init__(self, path, coarse_dims=64):
+        self.path = path
+        self.coarse_path = path + ".coarse"
+        self.meta_path = path + ".json"
+        self.coarse_dims = coarse_dims
+        self.dim = None
+        self.count = 0
+        self.model = None
+        self.capacity = 0
+        self._mat = None
+        self._coarse = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if not os.path.exists(self.path) or meta.get("coarse_dims") != self.coarse_dims:
+            return   # start over (also when the coarse setting changed)
+        self.dim, self.count, self.model = meta["dim"], meta["count"], meta["model"]
+        self._open(os.path.getsize(self.path) // (4 * self.dim))
+
+    @property
+    def _coarse_width(self):
+        return self.coarse_dims if self.coarse_dims and self.coarse_dims < self.dim else 0
+
+    def _map(self, path, capacity, width):
+        with open(path, "ab") as f:
+            if f.tell() < capacity * width * 4:
+                f.truncate(capacity * width * 4)
+        return np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, width))
+
+    def _open(self, capacity):
+        for mat in (self._mat, self._coarse):
+            if mat is not None:
+                mat.flush()
+        self._mat = self._map(self.path, capacity, self.dim)
+        width = self._coarse_width
+        self._coarse = self._map(self.coarse_path, capacity, width) if width else None
+        self.capacity = capacity
+
+    def _save_meta(self):
+        write_json_atomic(self.meta_path, {"dim": self.dim, "count": self.count, "model": self.model,
+                                           "coarse_dims": self.coarse_dims}, indent=None)
+
+    def reset(self, model, dim):
+        with self._lock:
+            self._mat = self._coarse = None
+            for path in (self.path, self.coarse_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.model, self.dim, self.count = model, dim, 0
+            self._open(1024)
+            self._save_meta()
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def append(self, vectors):
+        vectors = self._normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            needed = self.count + len(vectors)
+            if needed > self.capacity:
+                self._open(max(needed, 2 * self.capacity))
+            self._mat[self.count:needed] = vectors
+            self._mat.flush()
+            if self._coarse is not None:
+                self._coarse[self.count:needed] = self._normalize(vectors[:, :self._coarse_width])
+                self._coarse.flush()
+            self.count = needed
+            self._save_meta()
+
+    def search(self, query, k, limit=None, candidates=128):
+        """Top-k (row, score) among the first `limit` rows (default: all), best first."""
+        query = self._normalize(np.asarray(query, dtype=np.float32).ravel())
+        with self._lock:
+            n = self.count if limit is None else min(limit, self.count)
+            if n == 0:
+                return []
+            k = min(k, n)
+            if self._coarse is not None and n > candidates:
+                # coarse pass over the small matrix, exact rerank of the best few
+                coarse = self._coarse[:n] @ self._normalize(query[:self._coarse_width])
+                rows = np.sort(np.argpartition(-coarse, candidates - 1)[:candidates])
+                scores = self._mat[rows] @ query
+            else:
+                rows = None
+                scores = self._mat[:n] @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        if rows is not None:
+            return [(int(rows[i]), float(scores[i])) for i in top]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+class Recall:
+    """
+    Keeps a VectorStore in step with full_history and answers similarity queries.
+
+    `embed(texts) -> 2D array` is the embedding function (Ollama or hash_embed);
+    `model` names it, and a store built with another model is thrown away.
+    catch_up() is meant for a background thread; embeddings are computed
+    without holding `lock`, only reading new messages needs it.
+    """
+
+    def __init__(self, path, embed, model, lock, batch=32, coarse_dims=64):
+        self.store = VectorStore(path, coarse_dims=coarse_dims)
+        self.embed = embed
+        self.model = model
+        self.lock = lock
+        self.batch = batch
+
+    def catch_up(self, full_history):
+        with self.lock:
+            total = len(full_history)
+            if self.store.model not in (None, self.model) or self.store.count > total:
+                self.store.model = None  # different model or replaced history: start over
+        while True:
+            with self.lock:
+                start = self.store.count if self.store.model else 0
+                texts = [m.get("content", "") for m in full_history[start:start + self.batch]]
+            if not texts:
+                return
+            vectors = np.asarray(self.embed(texts), dtype=np.float32)
+            if self.store.model is None:
+                self.store.reset(self.model, vectors.shape[1])
+            self.store.append(vectors)
+
+    def query(self, text, k, min_score=0.0, before=None):
+        """Rows most similar to text, restricted to rows < before; [(row, score)]."""
+        if self.store.model != self.model or self.store.count == 0:
+            return []
+        vector = np.asarray(self.embed([text]), dtype=np.float32)[0]
+        return [(row, score) for row, score in self.store.search(vector, k, limit=before)
+                if score >= min_score]
@@ -0,0 +1,103 @@
+import math
+import threading
+import time
+
+_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value):
+    """Ollama keep_alive value ("30m", "1h", 300, -1) -> seconds (inf = forever)."""
+    if isinstance(value, str):
+        value = value.strip()
+        if value and value[-1] in _UNITS:
+            return float(value[:-1]) * _UNITS[value[-1]]
+        value = float(value)
+    return math.inf if value < 0 else float(value)
+
+
+class ModelRouter:
+    """
+    Remembers how each model has been doing and picks between a preferred
+    model and a fallback.
+
+    Per model: EWMA of time to first token and of total reply time (turns
+    where the model had to be loaded are left out, a load is not slowness),
+    until when it is probably still loaded (last use + keep_alive) and a
+    back-off after a failed call (model not pulled, server error).
+    """
+
+    def __init__(self, keep_alive="30m", slow_seconds=3.0, alpha=0.3, failure_backoff=600):
+        self.keep_alive = parse_duration(keep_alive)
+        self.slow_seconds = slow_seconds
+        self.alpha = alpha
+        self.failure_backoff = failure_backoff
+        self.models = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, model):
+        entry = self.models.get(model)
+        if entry is None:
+            entry = self.models[model] = {"ttft": None, "total": None, "turns": 0,
+                                          "warm_until": 0.0, "failed_until": 0.0}
+        return entry
+
+    # --- observations ---
+    def mark_loaded(self, model, until=None):
+        with self._lock:
+            self._entry(model)["warm_until"] = until if until is not None else time.monotonic() + self.keep_alive
+
+    def mark_unloaded(self, model):
+        with self._lock:
+            self._entry(model)["warm_until"] = 0.0
+
+    def record(self, model, ttft, total, cold=False):
+        """A finished reply: ttft / total in seconds (ttft None when not streamed)."""
+        with self._lock:
+            entry = self._entry(model)
+            entry["turns"] += 1
+            entry["failed_until"] = 0.0
+            if not cold:
+                for key, value in (("ttft", ttft), ("total", total)):
+                    if value is not None:
+                        old = entry[key]
+                        entry[key] = value if old is None else old + self.alpha * (value - old)
+        self.mark_loaded(model)
+
+    def failed(self, model):
+        with self._lock:
+            entry = self._entry(model)
+            entry["failed_until"] = time.monotonic() + self.failure_backoff
+            entry["warm_until"] = 0.0
+
+    # --- decisions ---
+    def is_warm(self, model):
+        return self._entry(model)["warm_until"] > time.monotonic()
+
+    def is_slow(self, model):
+        ttft = self._entry(model)["ttft"]
+        return ttft is not None and ttft > self.slow_seconds
+
+    def choose(self, preferred, fallback, allow_slow=True):
+        """
+        (model, reason): preferred unless it recently failed, is cold while the
+        fallback is warm, or (allow_slow) has been slow while the fallback has not.
+        reason is None, "failed", "cold" or "slow".
+        """
+        if not fallback or fallback == preferred:
+            return preferred, None
+        with self._lock:
+            if self._entry(preferred)["failed_until"] > time.monotonic():
+                return fallback, "failed"
+            if not self.is_warm(preferred) and self.is_warm(fallback):
+                return fallback, "cold"
+            if allow_slow and self.is_slow(preferred) and not self.is_slow(fallback):
+                return fallback, "slow"
+        return preferred, None
+
+    def summary(self):
+        """{model: {"ttft", "total", "turns", "warm", "failing"}} for display."""
+        now = time.monotonic()
+        with self._lock:
+            return {model: {"ttft": e["ttft"], "total": e["total"], "turns": e["turns"],
+                            "warm": e["warm_until"] > now, "failing": e["failed_until"] > now}
+                    for model, e in self.models.items()}
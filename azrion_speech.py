@@ -6,20 +6,40 @@ import queue
 import json
 import sounddevice as sd
 from vosk import Model, KaldiRecognizer
-from azrion import azrion_chat,say,get_ai_greeting
+from azrion import azrion_chat,say,speak,speech,stop_speaking,get_ai_greeting,SentenceSink,StdoutSink,TeeSink,prewarm_tts
 import subprocess
+from azrion_vad import VoiceActivityDetector, np
+
+HELLO = "Hey Triquetrus!"
+BYE = "Bye! Talk to you later."
+# said while Azrion is talking: cut the reply short
+STOP_WORDS = ["stop", "shut up", "be quiet", "enough", "okay stop"]
+BLOCKSIZE = 1600        # frames per microphone block (100 ms at 16 kHz)
+VAD = True              # only pass speech (plus padding) to Vosk and end utterances on our own silence timer (needs numpy)
+
+def _text(result):
+    try:
+        return json.loads(result).get("text", "").strip()
+    except Exception:
+        return ""
 
 def main():
+    # python azrion_speech.py --prewarm: synthesize all fixed lines into the TTS cache and exit
+    if "--prewarm" in sys.argv[1:]:
+        print(f"Cached {prewarm_tts([HELLO, BYE])} new phrases.")
+        return
+
     # Same greeting as text client
-    print("Hey Triquetrus!")
+    print(HELLO)
     greeting = get_ai_greeting()
     print(greeting)
-    # Speak both lines
-    say("Hey Triquetrus!")
-    say(greeting)
+    # Speak both lines (in the background, while the Vosk model loads)
+    speak(HELLO)
+    speak(greeting)
 
     # Load Vosk model ...
     model = Model("models/en_us_small")
+    speech.wait()
 
     samplerate = 16000  # Hz
     device = None       # default input device
@@ -32,39 +52,53 @@ def main():
         q.put(bytes(indata))
 
     with sd.RawInputStream(samplerate=samplerate,
-                           blocksize=8000,
+                           blocksize=BLOCKSIZE,
                            dtype="int16",
                            channels=1,
                            callback=callback,
                            device=device):
         rec = KaldiRecognizer(model, samplerate)
+        vad = VoiceActivityDetector(samplerate) if VAD and np is not None else None
+
+        def hear(data):
+            """Text of an utterance that ended in this block of audio, or ""."""
+            if vad is None:
+                return _text(rec.Result()) if rec.AcceptWaveform(data) else ""
+            heard = []
+            # silence never reaches Vosk; at the end of speech the utterance is finalized right away
+            for audio, ended in vad.feed(data):
+                if rec.AcceptWaveform(audio):
+                    heard.append(_text(rec.Result()))
+                if ended:
+                    heard.append(_text(rec.FinalResult()))
+            return " ".join(t for t in heard if t)
 
         while True:
-            data = q.get()
-            if rec.AcceptWaveform(data):
-                result = rec.Result()
-                try:
-                    text = json.loads(result).get("text", "").strip()
-                except Exception:
-                    text = ""
+            text = hear(q.get())
+            if text:
+                print(f"🎙 Heard: {text}")
+                lower = text.lower()
 
-                if text:
-                    print(f"🎙 Heard: {text}")
-                    lower = text.lower()
+                # Voice-level exit keywords
+                if lower in ["exit", "by" ,"bye", "goodbye", "quit"]:
+                    reply = BYE
+                    print(f"Azrion: {reply}")
+                    say(reply)
+                    break  # leave the while loop
 
-                    # Voice-level exit keywords
-                    if lower in ["exit", "by" ,"bye", "goodbye", "quit"]:
-                        reply = "Bye! Talk to you later."
-                        print(f"Azrion: {reply}")
-                        say(reply)
-                        break  # leave the while loop
+                # print the reply as it streams; each sentence is synthesized while the one before plays
+                reply = azrion_chat(text, sink=TeeSink(StdoutSink(), SentenceSink(speak)))
+                #print(f"Azrion: {reply}")
 
-                    reply = azrion_chat(text)
-                    #print(f"Azrion: {reply}")
-                    say(reply)
-            else:
-                # ignore partials for now
-                pass
+                # keep listening while it is spoken, but only for "stop"
+                while speech.busy:
+                    try:
+                        data = q.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    if hear(data).lower() in STOP_WORDS:
+                        print("🤐")
+                        stop_speaking()
     print("Azrion voice: session ended.") 
 
 if __name__ == "__main__":
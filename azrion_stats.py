@@ -0,0 +1,234 @@
+import heapq
+from collections import Counter
+from operator import itemgetter
+
+# Words that say nothing about what the user cares about (plus chat filler).
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before
+being below between both but by can cannot could did do does doing down during each few
+for from further had has have having he her here hers herself him himself his how i if in
+into is it its itself just let me more most my myself no nor not now of off on once only or
+other ought our ours ourselves out over own same she should so some such than that the their
+theirs them themselves then there these they this those through to too under until up very
+was we were what when where which while who whom why will with would you your yours yourself
+yourselves also get got gonna wanna like really yeah yes yep nope okay ok hey hi hello huh hmm
+lol haha thanks thank please sure well oh um uh ah im dont cant wont its thats whats
+""".split())
+
+
+class TopK:
+    """
+    The k largest counters of a growing word -> count table.
+
+    Call update(word, new_count) whenever a counter goes up. Members live in a
+    dict plus a min-heap (with lazily dropped stale entries), so an update is
+    O(log k) no matter how many words the table has. Counts only ever increase,
+    which keeps the result exact.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.counts = {}   # member word -> count
+        self._heap = []    # (count, word); entries whose count is outdated are skipped
+        self._ranked = ()
+
+    @classmethod
+    def from_counts(cls, counts, k):
+        top = cls(k)
+        if hasattr(counts, "most_common"):
+            items = counts.most_common(k)
+        else:
+            items = Counter(counts).most_common(k)
+        for word, count in items:
+            top.counts[word] = count
+        top._rebuild()
+        top._ranked = top._rank()
+        return top
+
+    def update(self, word, count):
+        """Record a new count for word; returns True if the ranked word list changed."""
+        if word in self.counts:
+            self.counts[word] = count
+            heapq.heappush(self._heap, (count, word))
+            if len(self._heap) > 4 * self.k:
+                self._rebuild()
+        elif len(self.counts) < self.k:
+            self.counts[word] = count
+            heapq.heappush(self._heap, (count, word))
+        else:
+            low_count, low_word = self._min()
+            if count <= low_count:
+                return False
+            heapq.heappop(self._heap)
+            del self.counts[low_word]
+            self.counts[word] = count
+            heapq.heappush(self._heap, (count, word))
+        ranked = self._rank()
+        if ranked == self._ranked:
+            return False
+        self._ranked = ranked
+        return True
+
+    def words(self):
+        """Member words, highest count first."""
+        return self._ranked
+
+    def _min(self):
+        heap = self._heap
+        while self.counts.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0]
+
+    def _rank(self):
+        # k is tiny (5 by default), sorting the members is cheaper than bookkeeping
+        return tuple(w for w, _ in sorted(self.counts.items(), key=lambda kv: -kv[1]))
+
+    def _rebuild(self):
+        self._heap = [(c, w) for w, c in self.counts.items()]
+        heapq.heapify(self._heap)
+
+
+class SpaceSaving:
+    """
+    Bounded word counter (Space-Saving sketch) with at most `capacity` words.
+
+    A new word arriving when the table is full replaces the word with the
+    smallest count and inherits that count (+1); the inherited part is kept as
+    its error, so count - error is a guaranteed lower bound. Frequent words are
+    never evicted, so the top topics stay accurate while memory and the saved
+    form stay fixed in size.
+
+    Reads look like the old stats dict (get / [] / in / len / most_common).
+    `dirty` collects changed or evicted words for the journal / DB.
+    """
+
+    def __init__(self, capacity, keep=None):
+        self.capacity = capacity
+        self.keep = keep              # optional word filter applied when loading old data
+        self.counts = {}
+        self.errors = {}
+        self._heap = []               # (count, word) min-heap, stale entries skipped lazily
+        self.dirty = set()
+        self.evicted = None           # word pushed out by the last add(), if any
+
+    # --- updates ---
+    def add(self, word):
+        """Count one occurrence of word; returns its new (estimated) count."""
+        self.evicted = None
+        counts = self.counts
+        if word in counts:
+            count = counts[word] + 1
+        elif len(counts) < self.capacity:
+            count = 1
+            self.errors[word] = 0
+        else:
+            low_count, low_word = self._pop_min()
+            del counts[low_word]
+            del self.errors[low_word]
+            self.dirty.add(low_word)
+            self.evicted = low_word
+            count = low_count + 1
+            self.errors[word] = low_count
+        counts[word] = count
+        self.dirty.add(word)
+        heapq.heappush(self._heap, (count, word))
+        if len(self._heap) > 2 * self.capacity + 16:
+            self._rebuild()
+        return count
+
+    def restore(self, word, count, error=0):
+        """Put a saved entry back (used when loading); ignores filtered words."""
+        if self.keep is not None and not self.keep(word):
+            return
+        self.counts[word] = count
+        self.errors[word] = error
+        heapq.heappush(self._heap, (count, word))
+
+    def _pop_min(self):
+        heap = self._heap
+        while True:
+            count, word = heapq.heappop(heap)
+            if self.counts.get(word) == count:
+                return count, word
+
+    def _rebuild(self):
+        self._heap = [(c, w) for w, c in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def _trim(self):
+        """Drop the smallest entries if we hold more than capacity (e.g. after a migration)."""
+        if len(self.counts) > self.capacity:
+            keep = heapq.nlargest(self.capacity, self.counts.items(), key=itemgetter(1))
+            dropped = set(self.counts) - {w for w, _ in keep}
+            for word in dropped:
+                del self.counts[word]
+                del self.errors[word]
+            self.dirty |= dropped
+        self._rebuild()
+
+    # --- dict-like reads ---
+    def get(self, word, default=None):
+        return self.counts.get(word, default)
+
+    def __getitem__(self, word):
+        return self.counts[word]
+
+    def __contains__(self, word):
+        return word in self.counts
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __iter__(self):
+        return iter(self.counts)
+
+    def items(self):
+        return self.counts.items()
+
+    def most_common(self, n):
+        return heapq.nlargest(n, self.counts.items(), key=itemgetter(1))
+
+    def guaranteed(self, word):
+        """Lower bound on the true count of word."""
+        return self.counts.get(word, 0) - self.errors.get(word, 0)
+
+    # --- persistence ---
+    # On disk: {"capacity": N, "items": "word:count:error word:count:error ..."}
+    # (stats words are alphabetic, so ":" and " " are safe separators).
+    def to_json(self):
+        items = " ".join(f"{w}:{c}:{self.errors[w]}" for w, c in self.counts.items())
+        return {"capacity": self.capacity, "items": items}
+
+    @classmethod
+    def from_json(cls, raw, capacity, keep=None):
+        """Load the compact form, or migrate an old plain {word: count} stats dict."""
+        sketch = cls(capacity, keep=keep)
+        if isinstance(raw, dict) and isinstance(raw.get("items"), str):
+            for item in raw["items"].split():
+                word, count, error = item.rsplit(":", 2)
+                sketch.restore(word, int(count), int(error))
+        elif raw:
+            for word, count in raw.items():
+                sketch.restore(word, count)
+        sketch._trim()
+        sketch.dirty.clear()
+        return sketch
+
+    def delta(self):
+        """Changes since dirty was last cleared: {word: [count, error] or None if evicted}."""
+        return {w: ([self.counts[w], self.errors[w]] if w in self.counts else None)
+                for w in self.dirty}
+
+    def apply_delta(self, delta):
+        for word, value in delta.items():
+            if value is None:
+                self.counts.pop(word, None)
+                self.errors.pop(word, None)
+            elif isinstance(value, int):
+                # journal written before stats were bounded: plain counts
+                if self.keep is None or self.keep(word):
+                    self.counts[word] = value
+                    self.errors.setdefault(word, 0)
+            else:
+                self.counts[word], self.errors[word] = value
+        self._trim()
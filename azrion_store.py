@@ -0,0 +1,621 @@
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import MutableMapping
+
+from azrion_stats import SpaceSaving
+
+# Sections that stay small (bounded or rarely touched). They are compared
+# against their last written form and re-journaled whole when they change.
+SMALL_SECTIONS = ("history", "habits", "preferences", "tasks", "philosophy", "rolling_summary")
+
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# mode for files that don't exist yet, as open() would create them (mkstemp always uses 0600)
+NEW_FILE_MODE = 0o666 & ~_umask()
+
+
+def write_text_atomic(path, text):
+    """Write text to path via temp file + fsync + rename (never leaves a half-written file)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = os.stat(path).st_mode & 0o7777   # keep the permissions of the file being replaced
+    except OSError:
+        mode = NEW_FILE_MODE
+    fd, tmp_path = tempfile.mkstemp(prefix=".azrion-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            if hasattr(os, "fchmod"):
+                os.fchmod(f.fileno(), mode)
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_json_atomic(path, data, indent=4):
+    """write_text_atomic for JSON."""
+    write_text_atomic(path, json.dumps(data, indent=indent))
+
+
+class TrackedDict(dict):
+    """dict that remembers which keys changed since the last journal record."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dirty = set()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.dirty.add(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.dirty.add(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self.dirty.add(key)
+        return super().pop(key, *default)
+
+
+class JournalStore:
+    """
+    Snapshot + write-ahead journal for the memory dict.
+
+    - save() appends ONE line per call with only what changed: new full_history
+      entries, changed stat counters and any small section that differs.
+    - every `compact_every` records the whole dict is written as a new snapshot
+      (atomically) and the journal is truncated.
+    - load() replays journal records newer than the snapshot's journal_seq, so a
+      crash between snapshot rename and journal truncate can't double-apply.
+    - with an `archive`, full_history lives in the segment files instead: it is
+      moved there once at load and left out of snapshots and journal records.
+    """
+
+    def __init__(self, snapshot_path, journal_path, compact_every=200, archive=None,
+                 stats_factory=TrackedDict):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compact_every = compact_every
+        self.archive = archive  # optional SegmentedArchive that owns full_history
+        # builds memory["stats"] from its saved form; TrackedDict, or e.g. a
+        # bounded SpaceSaving sketch (anything with delta()/apply_delta()/to_json())
+        self.stats_factory = stats_factory
+        self.seq = 0            # seq of the last record written or replayed
+        self.records = 0        # records in the journal since the last compaction
+        self._archived = 0      # how many full_history entries are already on disk
+        self._last = {}         # section -> last journaled JSON text
+
+    # --- loading ---
+    def load(self, default):
+        try:
+            with open(self.snapshot_path, "r") as f:
+                memory = json.load(f)
+        except FileNotFoundError:
+            memory = default
+        self.seq = memory.pop("journal_seq", 0)
+        for key, value in default.items():
+            memory.setdefault(key, value)
+        memory["stats"] = self.stats_factory(memory["stats"])
+
+        self.records = self._replay(memory)
+        memory["stats"].dirty.clear()
+        moved = self._move_to_archive(memory) if self.archive is not None else False
+        self._archived = len(memory["full_history"])
+        self._last = {s: json.dumps(memory[s]) for s in SMALL_SECTIONS}
+
+        if moved or self.records >= self.compact_every:
+            self.compact(memory)
+        return memory
+
+    def _move_to_archive(self, memory):
+        """Hand full_history over to the archive; True if the snapshot still had a list."""
+        old = memory["full_history"]
+        # a crash after a partial move just continues where the archive stops
+        if len(old) > len(self.archive):
+            self.archive.extend(old[len(self.archive):])
+            self.archive.sync()
+        memory["full_history"] = self.archive
+        return len(old) > 0
+
+    def _replay(self, memory):
+        try:
+            f = open(self.journal_path, "rb")
+        except FileNotFoundError:
+            return 0
+        applied = 0
+        good_end = 0
+        with f:
+            for line in f:
+                # a torn last line (crash mid-append) has no newline or bad JSON
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                good_end += len(line)
+                if record.get("seq", 0) <= self.seq:
+                    continue
+                self._apply(memory, record)
+                self.seq = record["seq"]
+                applied += 1
+        if good_end != os.path.getsize(self.journal_path):
+            # drop the broken tail so the next append starts on a clean line
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good_end)
+        return applied
+
+    @staticmethod
+    def _apply(memory, record):
+        memory["full_history"].extend(record.get("full_history", []))
+        stats = memory["stats"]
+        if hasattr(stats, "apply_delta"):
+            stats.apply_delta(record.get("stats", {}))
+        else:
+            for word, count in record.get("stats", {}).items():
+                if count is None:
+                    stats.pop(word, None)
+                else:
+                    stats[word] = count
+        for section in SMALL_SECTIONS:
+            if section in record:
+                memory[section] = record[section]
+
+    # --- saving ---
+    def save(self, memory):
+        record = {}
+
+        full_history = memory["full_history"]
+        if self.archive is not None:
+            self.archive.sync()
+        elif len(full_history) > self._archived:
+            record["full_history"] = full_history[self._archived:]
+
+        stats = memory["stats"]
+        if hasattr(stats, "delta"):
+            if stats.dirty:
+                record["stats"] = stats.delta()
+        else:
+            if not isinstance(stats, TrackedDict):
+                stats = memory["stats"] = TrackedDict(stats)
+                stats.dirty.update(stats.keys())
+            if stats.dirty:
+                record["stats"] = {word: stats.get(word) for word in stats.dirty}
+
+        changed = {}
+        for section in SMALL_SECTIONS:
+            blob = json.dumps(memory[section])
+            if blob != self._last.get(section):
+                record[section] = memory[section]
+                changed[section] = blob
+
+        if not record:
+            return
+
+        record["seq"] = self.seq + 1
+        line = json.dumps(record) + "\n"
+        with open(self.journal_path, "a") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.seq += 1
+        self.records += 1
+        self._archived = len(full_history)
+        self._last.update(changed)
+        stats.dirty.clear()
+
+        if self.records >= self.compact_every:
+            self.compact(memory)
+
+    def compact(self, memory):
+        """Fold the journal into a fresh snapshot and start a new journal."""
+        snapshot = dict(memory)
+        if self.archive is not None:
+            del snapshot["full_history"]
+        if hasattr(memory["stats"], "to_json"):
+            snapshot["stats"] = memory["stats"].to_json()
+        snapshot["journal_seq"] = self.seq
+        write_json_atomic(self.snapshot_path, snapshot)
+        with open(self.journal_path, "w"):
+            pass
+        self.records = 0
+
+
+# --- SQLITE BACKEND ---
+# Big, ever-growing parts of memory (full_history, stats, tasks) live in tables
+# and are exposed through small list/dict look-alikes, so azrion.py keeps using
+# memory["full_history"].append(...), memory["stats"][w] etc. and nothing big
+# is ever loaded into RAM. history/habits/preferences/philosophy stay plain.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    time TEXT
+);
+CREATE TABLE IF NOT EXISTS stats (
+    word TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    error INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS stats_by_count ON stats (count);
+CREATE TABLE IF NOT EXISTS habits (
+    name TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    status TEXT NOT NULL,
+    time TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+# small sections kept as JSON blobs in the meta table
+META_SECTIONS = ("preferences", "philosophy", "rolling_summary")
+
+
+def _saved_stats(raw):
+    # stats as the JSON backends saved them (compact sketch or plain {word: count}), nothing dropped
+    return SpaceSaving.from_json(raw, sys.maxsize)
+
+
+def _row_to_message(row):
+    return {"role": row[0], "content": row[1], "time": row[2]}
+
+
+class MessageLog:
+    """List-like view of the messages table (ids are position + 1)."""
+
+    def __init__(self, db):
+        self._db = db
+        self._len = db.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+
+    def append(self, msg):
+        self._len += 1
+        self._db.execute(
+            "INSERT INTO messages (id, role, content, time) VALUES (?, ?, ?, ?)",
+            (self._len, msg.get("role", ""), msg.get("content", ""), msg.get("time")),
+        )
+
+    def extend(self, msgs):
+        for msg in msgs:
+            self.append(msg)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        # the cursor fetches rows as we go, so this streams
+        cur = self._db.execute("SELECT role, content, time FROM messages ORDER BY id")
+        for row in cur:
+            yield _row_to_message(row)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            rows = self._db.execute(
+                "SELECT role, content, time FROM messages WHERE id > ? AND id <= ? ORDER BY id",
+                (start, stop),
+            ).fetchall()
+            return [_row_to_message(r) for r in rows][::step]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("message index out of range")
+        row = self._db.execute(
+            "SELECT role, content, time FROM messages WHERE id = ?", (index + 1,)
+        ).fetchone()
+        return _row_to_message(row)
+
+    def tail(self, n):
+        return self[max(0, self._len - n):]
+
+
+class StatsTable(MutableMapping):
+    """word -> count mapping stored in the stats table."""
+
+    def __init__(self, db):
+        self._db = db
+
+    def __getitem__(self, word):
+        row = self._db.execute("SELECT count FROM stats WHERE word = ?", (word,)).fetchone()
+        if row is None:
+            raise KeyError(word)
+        return row[0]
+
+    def __setitem__(self, word, count):
+        self._db.execute(
+            "INSERT INTO stats (word, count) VALUES (?, ?) "
+            "ON CONFLICT(word) DO UPDATE SET count = excluded.count",
+            (word, count),
+        )
+
+    def __delitem__(self, word):
+        if self._db.execute("DELETE FROM stats WHERE word = ?", (word,)).rowcount == 0:
+            raise KeyError(word)
+
+    def __iter__(self):
+        for (word,) in self._db.execute("SELECT word FROM stats"):
+            yield word
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM stats").fetchone()[0]
+
+    def most_common(self, n):
+        return self._db.execute(
+            "SELECT word, count FROM stats ORDER BY count DESC LIMIT ?", (n,)
+        ).fetchall()
+
+
+class TaskRow(dict):
+    """A task dict whose edits (e.g. t["status"] = "done") are written back."""
+
+    def __init__(self, db, task_id, data):
+        super().__init__(data)
+        self._db = db
+        self._id = task_id
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if key in ("description", "status", "time"):
+            self._db.execute(f"UPDATE tasks SET {key} = ? WHERE id = ?", (value, self._id))
+
+
+class TaskList:
+    """List-like view of the tasks table."""
+
+    def __init__(self, db):
+        self._db = db
+
+    def append(self, task):
+        self._db.execute(
+            "INSERT INTO tasks (description, status, time) VALUES (?, ?, ?)",
+            (task["description"], task.get("status", "pending"), task.get("time")),
+        )
+
+    def __iter__(self):
+        rows = self._db.execute("SELECT id, description, status, time FROM tasks ORDER BY id").fetchall()
+        for task_id, description, status, time_ in rows:
+            yield TaskRow(self._db, task_id, {"description": description, "status": status, "time": time_})
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+
+class SQLiteStore:
+    """
+    SQLite-backed memory. Writes go straight into the tables through the
+    proxies above; save() writes the small in-RAM sections and commits, so one
+    chat turn is one transaction.
+    """
+
+    def __init__(self, db_path, history_limit):
+        self.db_path = db_path
+        self.history_limit = history_limit
+        # written from the persistence thread too; callers serialize access with their lock
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(stats)")]
+        if "error" not in columns:   # DB created before stats were bounded
+            self.db.execute("ALTER TABLE stats ADD COLUMN error INTEGER NOT NULL DEFAULT 0")
+            self.db.commit()
+        self._last = {}
+
+    def load(self, default, json_path=None, journal_path=None, archive=None, stats_sketch=None,
+             stats_factory=None):
+        """
+        Build the memory dict. With `stats_sketch` (an empty SpaceSaving) the
+        stats table is bounded: its largest rows are loaded into the sketch,
+        the rest deleted, and save() writes only the sketch's changes.
+        stats_factory is how migrate_json() reads the old stats (see there).
+        """
+        if self._get_meta("migrated_from") is None:
+            if json_path and os.path.exists(json_path):
+                self.migrate_json(json_path, journal_path, default, archive, stats_factory)
+            else:
+                with self.db:
+                    self._set_meta("migrated_from", "")
+        self._repair_stats()
+
+        full_history = MessageLog(self.db)
+        memory = {
+            "history": full_history.tail(self.history_limit),
+            "full_history": full_history,
+            "habits": dict(self.db.execute("SELECT name, count FROM habits")),
+            "stats": self._load_sketch(stats_sketch) if stats_sketch is not None else StatsTable(self.db),
+            "tasks": TaskList(self.db),
+        }
+        for section in META_SECTIONS:
+            memory[section] = json.loads(self._get_meta(section) or "null") or default.get(section)
+        self._last = {s: json.dumps(memory[s]) for s in ("habits",) + META_SECTIONS}
+        return memory
+
+    def migrate_json(self, json_path, journal_path, default, archive=None, stats_factory=None):
+        """
+        One-shot import of azrion_memory.json (+ its journal and segment archive, if any).
+        stats_factory builds the stats from their saved form, e.g. the same
+        bounded sketch the JSON backends used; by default every saved word is kept.
+        """
+        old = JournalStore(json_path, journal_path or json_path + ".journal", archive=archive,
+                           stats_factory=stats_factory or _saved_stats).load(default)
+        stats = old["stats"]
+        errors = getattr(stats, "errors", {})
+        with self.db:
+            full_history = MessageLog(self.db)
+            full_history.extend(old["full_history"])
+            self.db.executemany(
+                "INSERT OR REPLACE INTO stats (word, count, error) VALUES (?, ?, ?)",
+                [(word, count, errors.get(word, 0)) for word, count in stats.items()],
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO habits (name, count) VALUES (?, ?)", old["habits"].items()
+            )
+            tasks = TaskList(self.db)
+            for task in old["tasks"]:
+                tasks.append(task)
+            for section in META_SECTIONS:
+                self._set_meta(section, json.dumps(old.get(section)))
+            self._set_meta("migrated_from", os.path.abspath(json_path))
+
+    def _repair_stats(self):
+        # migrations before the compact stats form was understood left it behind
+        # as two rows, ("capacity", N) and ("items", "w:c:e ..."): unpack them
+        row = self.db.execute("SELECT count FROM stats WHERE word = 'items' AND typeof(count) = 'text'").fetchone()
+        if row is None:
+            return
+        stats = _saved_stats({"items": row[0]})
+        with self.db:
+            self.db.execute("DELETE FROM stats WHERE word IN ('capacity', 'items')")
+            self.db.executemany(
+                "INSERT OR REPLACE INTO stats (word, count, error) VALUES (?, ?, ?)",
+                [(word, count, stats.errors[word]) for word, count in stats.items()],
+            )
+
+    def _load_sketch(self, sketch):
+        rows = self.db.execute("SELECT word, count, error FROM stats ORDER BY count DESC").fetchall()
+        for word, count, error in rows:
+            sketch.restore(word, count, error)
+        sketch._trim()
+        kept = set(sketch.counts)
+        dropped = [(row[0],) for row in rows if row[0] not in kept]
+        if dropped:
+            with self.db:
+                self.db.executemany("DELETE FROM stats WHERE word = ?", dropped)
+        sketch.dirty.clear()
+        return sketch
+
+    def save(self, memory):
+        stats = memory["stats"]
+        if hasattr(stats, "delta") and stats.dirty:
+            changes = stats.delta()
+            self.db.executemany(
+                "INSERT INTO stats (word, count, error) VALUES (?, ?, ?) "
+                "ON CONFLICT(word) DO UPDATE SET count = excluded.count, error = excluded.error",
+                [(w, v[0], v[1]) for w, v in changes.items() if v is not None],
+            )
+            self.db.executemany(
+                "DELETE FROM stats WHERE word = ?", [(w,) for w, v in changes.items() if v is None]
+            )
+            stats.dirty.clear()
+
+        blob = json.dumps(memory["habits"])
+        if blob != self._last.get("habits"):
+            self.db.executemany(
+                "INSERT OR REPLACE INTO habits (name, count) VALUES (?, ?)", memory["habits"].items()
+            )
+            self._last["habits"] = blob
+        for section in META_SECTIONS:
+            blob = json.dumps(memory[section])
+            if blob != self._last.get(section):
+                self._set_meta(section, blob)
+                self._last[section] = blob
+        self.db.commit()
+
+    def _get_meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+# --- BACKGROUND WRITER ---
+class PersistenceWorker:
+    """
+    Runs `write` on a daemon thread instead of the chat thread.
+
+    notify() only marks memory dirty. The thread writes once nothing new has
+    arrived for `debounce` seconds (but never later than `max_delay` after the
+    first change), so a burst of notifications becomes one write. stop() writes
+    whatever is pending and joins the thread; call it at exit.
+    """
+
+    def __init__(self, write, debounce=0.5, max_delay=5.0):
+        self._write = write
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._dirty_since = None
+        self._last_notify = 0.0
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="azrion-persist", daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        with self._cond:
+            now = time.monotonic()
+            if self._dirty_since is None:
+                self._dirty_since = now
+            self._last_notify = now
+            self._cond.notify()
+
+    def flush(self):
+        """Write pending changes now, on the calling thread."""
+        with self._cond:
+            pending = self._dirty_since is not None
+            self._dirty_since = None
+        if pending:
+            self._write_now()
+        else:
+            # make sure an in-flight background write has finished
+            with self._write_lock:
+                pass
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._dirty_since is None and not self._stopping:
+                    self._cond.wait()
+                if self._dirty_since is None:
+                    return
+                while not self._stopping and self._dirty_since is not None:
+                    due = min(self._last_notify + self.debounce, self._dirty_since + self.max_delay)
+                    remaining = due - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._dirty_since is None:
+                    continue   # flush() wrote it while we were waiting
+                self._dirty_since = None
+            self._write_now()
+
+    def _write_now(self):
+        with self._write_lock:
+            try:
+                self._write()
+            except Exception as e:
+                print(f"[azrion] saving memory failed, will retry: {e}", file=sys.stderr)
+                if not self._stopping:
+                    self.notify()
@@ -0,0 +1,250 @@
+import os
+import threading
+import time
+from collections import deque
+
+# file systems that are not disks (df -h hides most of these too)
+VIRTUAL_FS = {
+    "proc", "sysfs", "devtmpfs", "devpts", "tmpfs", "securityfs", "cgroup", "cgroup2",
+    "pstore", "bpf", "debugfs", "tracefs", "configfs", "fusectl", "mqueue", "hugetlbfs",
+    "autofs", "binfmt_misc", "efivarfs", "ramfs", "rpc_pipefs", "nsfs", "overlay",
+    "squashfs", "fuse.gvfsd-fuse", "fuse.portal", "fuse.lxcfs",
+}
+
+
+def available():
+    return os.path.exists("/proc/stat")
+
+
+def format_bytes(n):
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if abs(n) < 1024 or unit == "TiB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024.0
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read().decode("ascii", "replace")
+
+
+def read_cpu():
+    """(busy, total) jiffies summed over all CPUs, and the number of CPUs."""
+    busy = total = 0
+    cores = 0
+    for line in _read("/proc/stat").splitlines():
+        if line.startswith("cpu "):
+            # user nice system idle iowait irq softirq steal (guest is already in user)
+            values = [int(v) for v in line.split()[1:9]]
+            total = sum(values)
+            busy = total - values[3] - values[4]
+        elif line.startswith("cpu"):
+            cores += 1
+    return busy, total, cores
+
+
+def read_memory():
+    """/proc/meminfo fields in bytes (MemTotal, MemAvailable, SwapTotal, SwapFree, ...)."""
+    info = {}
+    for line in _read("/proc/meminfo").splitlines():
+        key, _, rest = line.partition(":")
+        parts = rest.split()
+        if parts:
+            info[key] = int(parts[0]) * (1024 if len(parts) > 1 else 1)
+    return info
+
+
+def read_loadavg():
+    return tuple(float(v) for v in _read("/proc/loadavg").split()[:3])
+
+
+def read_processes():
+    """{pid: (name, cpu jiffies, rss bytes)} for every process we can read."""
+    page = os.sysconf("SC_PAGE_SIZE")
+    procs = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            stat = _read(f"/proc/{entry}/stat")
+        except OSError:
+            continue            # exited meanwhile / not ours
+        head, _, rest = stat.rpartition(")")
+        fields = rest.split()
+        if len(fields) < 22:
+            continue
+        name = head.partition("(")[2]
+        procs[int(entry)] = (name, int(fields[11]) + int(fields[12]), int(fields[21]) * page)
+    return procs
+
+
+def read_disks():
+    """[(mount point, total, used, available)] in bytes for real file systems, one per device."""
+    disks = []
+    seen = set()
+    for line in _read("/proc/self/mounts").splitlines():
+        parts = line.split()
+        if len(parts) < 3:
+            continue
+        device, mount, fstype = parts[0], parts[1].replace("\\040", " "), parts[2]
+        if fstype in VIRTUAL_FS or device in seen or not device.startswith("/"):
+            continue
+        try:
+            st = os.statvfs(mount)
+        except OSError:
+            continue
+        if not st.f_blocks:
+            continue
+        seen.add(device)
+        total = st.f_blocks * st.f_frsize
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        disks.append((mount, total, used, st.f_bavail * st.f_frsize))
+    return disks
+
+
+class SystemMonitor:
+    """
+    CPU / memory / process numbers straight from /proc, without spawning anything.
+
+    A daemon thread samples /proc/stat and /proc/meminfo every `interval`
+    seconds into rolling windows of `window` seconds, and the per-process
+    counters every `proc_interval` seconds (reading every /proc/<pid>/stat is
+    the expensive part). Questions are answered from those samples, so "now"
+    means the last interval and "avg" the whole window. Disks are statvfs'd on
+    demand, that is only a syscall per mount.
+    """
+
+    def __init__(self, interval=2.0, window=60.0, proc_interval=5.0):
+        self.interval = interval
+        self.window = window
+        self.proc_interval = proc_interval
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        self.cores = os.cpu_count() or 1
+        self._cpu = deque()            # (time, busy, total)
+        self._mem = deque()            # (time, used bytes)
+        self._procs = deque(maxlen=2)  # (time, {pid: (name, jiffies, rss)})
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def sample(self, processes=False):
+        now = time.monotonic()
+        busy, total, cores = read_cpu()
+        mem = read_memory()
+        used = mem.get("MemTotal", 0) - mem.get("MemAvailable", mem.get("MemFree", 0))
+        procs = read_processes() if processes else None
+        with self._lock:
+            self.cores = cores or self.cores
+            self._cpu.append((now, busy, total))
+            self._mem.append((now, used))
+            for samples in (self._cpu, self._mem):
+                while len(samples) > 2 and now - samples[0][0] > self.window:
+                    samples.popleft()
+            if procs is not None:
+                self._procs.append((now, procs))
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        def loop():
+            last_procs = 0.0
+            while True:
+                try:
+                    due = time.monotonic() - last_procs >= self.proc_interval
+                    self.sample(processes=due)
+                    if due:
+                        last_procs = time.monotonic()
+                except Exception:
+                    pass
+                time.sleep(self.interval)
+
+        self._thread = threading.Thread(target=loop, name="azrion-sysmon", daemon=True)
+        self._thread.start()
+
+    def _ensure(self):
+        # asked before the sampler has two of everything (or without one): take them now
+        with self._lock:
+            enough = len(self._cpu) >= 2 and len(self._procs) >= 2
+        if not enough:
+            self.sample(processes=True)
+            if len(self._cpu) < 2 or len(self._procs) < 2:
+                time.sleep(0.25)
+                self.sample(processes=True)
+
+    # --- answers ---
+    def cpu(self):
+        """{"now", "avg", "span", "cores", "load"}: busy % over the last interval and the window."""
+        self._ensure()
+        with self._lock:
+            first, prev, last = self._cpu[0], self._cpu[-2], self._cpu[-1]
+            cores = self.cores
+
+        def busy(a, b):
+            total = b[2] - a[2]
+            return 100.0 * (b[1] - a[1]) / total if total > 0 else 0.0
+
+        return {"now": busy(prev, last), "avg": busy(first, last), "span": last[0] - first[0],
+                "cores": cores, "load": read_loadavg()}
+
+    def memory(self):
+        """Current /proc/meminfo numbers plus "avg_used" over the window."""
+        self._ensure()
+        mem = read_memory()
+        with self._lock:
+            samples = list(self._mem)
+        total = mem.get("MemTotal", 0)
+        avail = mem.get("MemAvailable", mem.get("MemFree", 0))
+        return {"total": total, "used": total - avail, "available": avail,
+                "swap_total": mem.get("SwapTotal", 0),
+                "swap_used": mem.get("SwapTotal", 0) - mem.get("SwapFree", 0),
+                "avg_used": sum(used for _, used in samples) / len(samples),
+                "span": samples[-1][0] - samples[0][0]}
+
+    def top_processes(self, n=5, by="cpu"):
+        """[(pid, name, cpu %, rss bytes)] between the last two process samples; by "cpu" or "rss"."""
+        self._ensure()
+        with self._lock:
+            (t0, before), (t1, after) = self._procs[0], self._procs[-1]
+        seconds = max(t1 - t0, 1e-6)
+        rows = []
+        for pid, (name, jiffies, rss) in after.items():
+            old = before.get(pid)
+            spent = jiffies - old[1] if old is not None and old[0] == name else 0
+            rows.append((pid, name, 100.0 * spent / self.clock_ticks / seconds, rss))
+        index = 2 if by == "cpu" else 3
+        rows.sort(key=lambda row: row[index], reverse=True)
+        return rows[:n]
+
+    def disks(self):
+        return read_disks()
+
+    # --- plain-text reports ---
+    def cpu_report(self, top=5):
+        c = self.cpu()
+        lines = [f"CPU {c['now']:.0f}% now, {c['avg']:.0f}% avg over {c['span']:.0f}s "
+                 f"({c['cores']} cores) · load {c['load'][0]:.2f} {c['load'][1]:.2f} {c['load'][2]:.2f}"]
+        for pid, name, cpu, _ in self.top_processes(top, by="cpu"):
+            if cpu < 0.05:
+                break
+            lines.append(f"  {cpu:5.1f}%  {name} ({pid})")
+        return "\n".join(lines)
+
+    def memory_report(self, top=5):
+        m = self.memory()
+        pct = 100.0 * m["used"] / m["total"] if m["total"] else 0.0
+        lines = [f"RAM {format_bytes(m['used'])} used of {format_bytes(m['total'])} ({pct:.0f}%), "
+                 f"{format_bytes(m['available'])} available · avg {format_bytes(m['avg_used'])} "
+                 f"over {m['span']:.0f}s"]
+        if m["swap_total"]:
+            lines.append(f"Swap {format_bytes(m['swap_used'])} used of {format_bytes(m['swap_total'])}")
+        for pid, name, _, rss in self.top_processes(top, by="rss"):
+            lines.append(f"  {format_bytes(rss):>10}  {name} ({pid})")
+        return "\n".join(lines)
+
+    def disk_report(self):
+        lines = []
+        for mount, total, used, avail in self.disks():
+            pct = 100.0 * used / (used + avail) if used + avail else 0.0
+            lines.append(f"{mount:<20} {format_bytes(used):>10} of {format_bytes(total):>10} "
+                         f"({pct:.0f}%), {format_bytes(avail)} free")
+        return "\n".join(lines) or "No disks found."
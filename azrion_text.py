@@ -4,6 +4,7 @@ from azrion import (
     complete_task,
     search_full_history,
     azrion_chat,
+    metrics,
 )
 import time
 import subprocess
@@ -30,14 +31,21 @@ def main():
         # on-demand search command
         if user_input.lower().startswith("search history:"):
             # azrion_chat already handles this, but allow direct call to show results
-            results = search_full_history(user_input.split(":",1)[1])
+            results = search_full_history(user_input.split(":",1)[1], limit=8)
             if not results:
                 print("Azrion: No matches found in history.")
             else:
                 print("Azrion: Found these matches:")
-                for r in results[:8]:
+                for r in results:
                     print(" -", r)
             continue
+        # per-stage timings (METRICS = True in azrion.py)
+        if user_input.lower() == "metrics":
+            if metrics.enabled:
+                print(metrics.report())
+            else:
+                print("Azrion: Metrics are off (set METRICS = True in azrion.py).")
+            continue
         # exit text mode
         if user_input.lower() in ["exit", "bye"]:
             print("Azrion: Bye! Talk to you later 😉")
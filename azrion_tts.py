@@ -0,0 +1,383 @@
+import hashlib
+import json
+import os
+import queue
+import re
+import subprocess
+import threading
+import time
+
+# piper logs one of these on stderr after each input line; its audio is on stdout by then
+RTF_RE = re.compile(r"Real-time factor:.*audio=([0-9.]+) sec")
+
+PLAYERS = (
+    ["paplay", "--raw", "--rate={rate}", "--format=s16le", "--channels=1"],
+    ["aplay", "-q", "-r", "{rate}", "-f", "S16_LE", "-t", "raw", "-c", "1"],
+)
+
+
+def model_sample_rate(model_path, default=16000):
+    """Sample rate from the voice's .onnx.json (piper writes raw audio at this rate)."""
+    try:
+        with open(model_path + ".json") as f:
+            return int(json.load(f)["audio"]["sample_rate"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return default
+
+
+def voice_id(model_path):
+    """Identifies the voice for cache keys: model file name, size and mtime, and its config."""
+    h = hashlib.sha1(os.path.basename(model_path).encode("utf-8"))
+    for path in (model_path, model_path + ".json"):
+        try:
+            st = os.stat(path)
+            h.update(f"{st.st_size}:{st.st_mtime_ns}".encode("ascii"))
+        except OSError:
+            h.update(b"-")
+    return h.hexdigest()[:16]
+
+
+class PiperEngine:
+    """
+    One long-lived `piper --output_raw` process: the voice is loaded once and
+    every synthesize(text) is a line on its stdin.
+
+    Raw 16-bit mono PCM comes back on stdout. An utterance is complete when
+    piper logs its "Real-time factor ... audio=X sec" line on stderr and the
+    X seconds of samples have arrived (then stdout has to stay quiet for
+    `idle` seconds, so no tail end leaks into the next utterance).
+    Builds that don't log that line are spotted on the first utterance (audio
+    came, then `probe` seconds of nothing); from then on an utterance ends
+    after `quiet_end` seconds without new samples.
+    synthesize() returns None when piper is missing, dies or stalls; the
+    process is restarted on the next call.
+    """
+
+    def __init__(self, piper_bin, model_path, sample_rate=None, timeout=30.0, idle=0.03,
+                 probe=2.0, quiet_end=0.4):
+        self.piper_bin = piper_bin
+        self.model_path = model_path
+        self.sample_rate = sample_rate or model_sample_rate(model_path)
+        self.timeout = timeout
+        self.idle = idle
+        self.probe = probe
+        self.quiet_end = quiet_end
+        self._logs_rtf = None               # does this piper log Real-time factor? None until known
+        self._proc = None
+        self._lock = threading.Lock()       # one utterance in the pipe at a time
+        self._cond = threading.Condition()
+        self._buf = bytearray()
+        self._audio_seconds = None          # from the last Real-time factor line
+        self._last_data = 0.0
+
+    def available(self):
+        return os.path.isfile(self.piper_bin) and os.path.isfile(self.model_path)
+
+    def _alive(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self):
+        """Start piper (loads the voice); False if it cannot run."""
+        if self._alive():
+            return True
+        if not self.available():
+            return False
+        try:
+            proc = subprocess.Popen(
+                [self.piper_bin, "--model", self.model_path, "--output_raw"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                bufsize=0,
+            )
+        except OSError:
+            return False
+        self._proc = proc
+        threading.Thread(target=self._read_audio, args=(proc,), name="azrion-piper-out", daemon=True).start()
+        threading.Thread(target=self._read_log, args=(proc,), name="azrion-piper-log", daemon=True).start()
+        return True
+
+    def _read_audio(self, proc):
+        fd = proc.stdout.fileno()
+        while True:
+            try:
+                data = os.read(fd, 65536)
+            except OSError:
+                data = b""
+            with self._cond:
+                if not data:
+                    self._cond.notify_all()
+                    return
+                if proc is self._proc:
+                    self._buf += data
+                    self._last_data = time.monotonic()
+                    self._cond.notify_all()
+
+    def _read_log(self, proc):
+        for raw in proc.stderr:
+            m = RTF_RE.search(raw.decode("utf-8", "replace"))
+            if m:
+                with self._cond:
+                    self._audio_seconds = float(m.group(1))
+                    self._logs_rtf = True
+                    self._cond.notify_all()
+        with self._cond:
+            self._cond.notify_all()
+
+    def synthesize(self, text):
+        """Raw s16le mono PCM at sample_rate for one utterance, or None."""
+        text = " ".join(text.split())
+        if not text:
+            return b""
+        with self._lock:
+            if not self.start():
+                return None
+            proc = self._proc
+            with self._cond:
+                self._buf = bytearray()
+                self._audio_seconds = None
+            try:
+                proc.stdin.write(text.encode("utf-8") + b"\n")
+                proc.stdin.flush()
+            except (OSError, ValueError):
+                self.close()
+                return None
+
+            deadline = time.monotonic() + self.timeout
+            with self._cond:
+                # 1) piper says the utterance is done (or, without its log line, stdout went quiet)
+                while self._audio_seconds is None:
+                    step = 0.25
+                    if self._buf and self._logs_rtf is not True:
+                        limit = self.probe if self._logs_rtf is None else self.quiet_end
+                        step = limit - (time.monotonic() - self._last_data)
+                        if step <= 0:
+                            self._logs_rtf = False
+                            break
+                    if not self._wait(proc, deadline, step):
+                        return self._fail()
+                if self._audio_seconds is None:
+                    pcm = bytes(self._buf)
+                    self._buf = bytearray()
+                    return pcm[:len(pcm) - len(pcm) % 2]
+                # 2) ...and its samples are here (the log line can overtake them)
+                expected = int(self._audio_seconds * self.sample_rate) * 2
+                slack = self.sample_rate // 50 * 2        # 20 ms: audio= is rounded
+                while len(self._buf) < expected - slack:
+                    if not self._wait(proc, min(deadline, time.monotonic() + 1.0)):
+                        break
+                # 3) ...and nothing more is on its way
+                while time.monotonic() - self._last_data < self.idle:
+                    self._cond.wait(self.idle)
+                pcm = bytes(self._buf)
+                self._buf = bytearray()
+        return pcm[:len(pcm) - len(pcm) % 2]
+
+    def _wait(self, proc, deadline, step=0.25):
+        # one condition wait; False once piper died or the deadline passed
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or proc.poll() is not None:
+            return False
+        self._cond.wait(min(remaining, step, 0.25))
+        return True
+
+    def _fail(self):
+        # stalled or crashed mid-utterance: drop the process so the next call starts clean
+        threading.Thread(target=self.close, daemon=True).start()
+        return None
+
+    def close(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            proc.wait(2)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+class RawPlayer:
+    """
+    One long-lived paplay (or aplay) reading raw PCM from a pipe.
+
+    play(pcm) writes the samples in small chunks and returns once they should
+    have been heard (it keeps track of how much audio is queued ahead), so
+    callers can treat it like the old blocking `paplay file.wav`. stop() from
+    another thread cuts playback short: the player is killed (dropping what it
+    had buffered) and restarted by the next play().
+    """
+
+    def __init__(self, sample_rate=16000, commands=PLAYERS, chunk_seconds=0.1):
+        self.sample_rate = sample_rate
+        self.commands = [[arg.format(rate=sample_rate) for arg in cmd] for cmd in commands]
+        self.chunk = int(sample_rate * chunk_seconds) * 2
+        self._proc = None
+        self._playing_until = 0.0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def _ensure(self):
+        if self._proc is not None and self._proc.poll() is None:
+            return True
+        self._playing_until = 0.0
+        for cmd in self.commands:
+            try:
+                self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                              stderr=subprocess.DEVNULL, bufsize=0)
+                return True
+            except OSError:
+                continue
+        self._proc = None
+        return False
+
+    def play(self, pcm):
+        """Play raw s16le mono PCM; True if it played to the end, False if stopped / no player."""
+        with self._lock:
+            self._stopped.clear()
+            if not pcm or not self._ensure():
+                return bool(not pcm)
+            proc = self._proc
+            start = max(time.monotonic(), self._playing_until)
+            self._playing_until = start + len(pcm) / (2.0 * self.sample_rate)
+            try:
+                for i in range(0, len(pcm), self.chunk):
+                    if self._stopped.is_set():
+                        return False
+                    proc.stdin.write(pcm[i:i + self.chunk])
+            except (OSError, ValueError):
+                self._kill()
+                return False
+            # written (the pipe paces us); wait until the last chunk has been heard
+            while not self._stopped.is_set():
+                remaining = self._playing_until - time.monotonic()
+                if remaining <= 0:
+                    return True
+                self._stopped.wait(min(remaining, 0.05))
+            return False
+
+    def stop(self):
+        """Cut the current play() short (callable from any thread)."""
+        self._stopped.set()
+        self._kill()
+
+    def _kill(self):
+        proc, self._proc = self._proc, None
+        self._playing_until = 0.0
+        if proc is not None:
+            try:
+                proc.kill()
+                proc.wait(1)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+
+    def close(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()      # lets it play out what it has
+            proc.wait(5)
+        except (OSError, subprocess.TimeoutExpired):
+            proc.kill()
+
+
+class SpeechPipeline:
+    """
+    Speaks a stream of sentences: one thread synthesizes, another plays, with
+    at most `depth` synthesized sentences waiting in between. Sentence N+1 is
+    rendered while sentence N plays, so the first audio only waits for the
+    first sentence.
+
+    speak(text) only queues, so it is safe to call from a reply sink (even
+    on an event loop); wait() blocks until everything queued has been heard;
+    interrupt() drops what is queued and cuts the current sentence short.
+    synthesize(text) returns PCM, b"" for nothing to say, or None when it
+    cannot; then fallback(text) (if given) speaks it some other way.
+    """
+
+    def __init__(self, synthesize, play, stop_playback, depth=2, fallback=None):
+        self.synthesize = synthesize
+        self.play = play
+        self.stop_playback = stop_playback
+        self.fallback = fallback
+        self._texts = queue.Queue()
+        self._audio = queue.Queue(maxsize=depth)
+        self._generation = 0        # bumped by interrupt(); older items are dropped
+        self._pending = 0           # sentences queued and not yet played / dropped
+        self._cond = threading.Condition()
+        self._threads = None
+
+    @property
+    def busy(self):
+        return self._pending > 0
+
+    def speak(self, text):
+        if not text or not text.strip():
+            return
+        with self._cond:
+            if self._threads is None:
+                self._threads = [
+                    threading.Thread(target=self._synth_loop, name="azrion-tts-synth", daemon=True),
+                    threading.Thread(target=self._play_loop, name="azrion-tts-play", daemon=True),
+                ]
+                for thread in self._threads:
+                    thread.start()
+            self._pending += 1
+            self._texts.put((self._generation, text))
+
+    def wait(self, timeout=None):
+        """True once everything queued has been spoken (or dropped)."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def interrupt(self):
+        with self._cond:
+            self._generation += 1
+            for q in (self._texts, self._audio):
+                while True:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        break
+                    self._pending -= 1
+            self._cond.notify_all()
+        self.stop_playback()
+
+    def _done(self):
+        with self._cond:
+            self._pending -= 1
+            self._cond.notify_all()
+
+    def _synth_loop(self):
+        while True:
+            generation, text = self._texts.get()
+            if generation != self._generation:
+                self._done()
+                continue
+            try:
+                pcm = self.synthesize(text)
+            except Exception:
+                pcm = None
+            if pcm == b"" or generation != self._generation:
+                self._done()
+                continue
+            self._audio.put((generation, text, pcm))   # blocks while `depth` are waiting
+
+    def _play_loop(self):
+        while True:
+            generation, text, pcm = self._audio.get()
+            try:
+                if generation != self._generation:
+                    continue
+                if pcm is not None:
+                    self.play(pcm)
+                elif self.fallback is not None:
+                    self.fallback(text)
+            except Exception:
+                pass
+            finally:
+                self._done()
@@ -0,0 +1,101 @@
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:  # the voice client feeds the recognizer everything without numpy
+    np = None
+
+
+class VoiceActivityDetector:
+    """
+    Energy + zero-crossing gate between the microphone and the recognizer.
+
+    feed(data) takes raw int16 mono audio, cuts it into frame_ms frames and
+    classifies all of them at once: a frame is speech when its RMS is above
+    max(min_rms, noise floor * ratio), or above half that with a high
+    zero-crossing rate (the quiet "s" / "f" at the edges of words). The noise
+    floor follows the RMS of non-speech frames while nobody talks.
+
+    A segment starts after start_ms of speech frames (clicks and bumps don't
+    open it) and brings padding_ms of audio from before; it ends after
+    hangover_ms of non-speech (which is passed on too, as trailing padding)
+    or after max_ms. feed() returns [(audio, ended)]: what to pass to the
+    recognizer, and whether the utterance is over after it. Silence gives [].
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=20, ratio=3.0, min_rms=200.0, fricative_zcr=0.25,
+                 start_ms=60, hangover_ms=400, padding_ms=300, max_ms=15000, adapt=0.05):
+        self.frame = sample_rate * frame_ms // 1000      # samples per frame
+        self.ratio = ratio
+        self.min_rms = min_rms
+        self.fricative_zcr = fricative_zcr
+        self.start_frames = max(1, start_ms // frame_ms)
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.max_frames = max_ms // frame_ms
+        self.adapt = adapt
+        self.noise = None           # RMS noise floor, from the first block on
+        self.in_speech = False
+        self._pre = deque(maxlen=max(1, padding_ms // frame_ms))
+        self._rest = b""            # partial frame left over from the last block
+        self._run = 0               # speech frames in a row (idle) / non-speech frames in a row (in speech)
+        self._length = 0            # frames in the current segment
+
+    def classify(self, frames):
+        """Speech flags and RMS for an (n, frame) int16 array."""
+        x = frames.astype(np.float32)
+        rms = np.sqrt(np.mean(x * x, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame - 1)
+        if self.noise is None:
+            self.noise = float(rms.min())
+        threshold = max(self.min_rms, self.noise * self.ratio)
+        speech = (rms > threshold) | ((rms > threshold / 2) & (zcr > self.fricative_zcr))
+        return speech, rms
+
+    def feed(self, data):
+        data = self._rest + bytes(data)
+        size = 2 * self.frame
+        n = len(data) // size
+        self._rest = data[n * size:]
+        if not n:
+            return []
+        speech, rms = self.classify(np.frombuffer(data, dtype=np.int16, count=n * self.frame).reshape(n, self.frame))
+
+        pieces = []
+        out = []
+        for i, is_speech in enumerate(speech.tolist()):
+            frame = data[i * size:(i + 1) * size]
+            if not self.in_speech:
+                self._pre.append(frame)
+                self._run = self._run + 1 if is_speech else 0
+                if self._run >= self.start_frames:
+                    self.in_speech = True
+                    out.extend(self._pre)
+                    self._length = len(self._pre)
+                    self._pre.clear()
+                    self._run = 0
+                continue
+            out.append(frame)
+            self._length += 1
+            self._run = 0 if is_speech else self._run + 1
+            if self._run >= self.hangover_frames or self._length >= self.max_frames:
+                pieces.append((b"".join(out), True))
+                out = []
+                self.in_speech = False
+                self._run = 0
+        if out:
+            pieces.append((b"".join(out), False))
+
+        if not self.in_speech:
+            quiet = rms[~speech]
+            if quiet.size:
+                self.noise += self.adapt * (float(quiet.mean()) - self.noise)
+        return pieces
+
+    def reset(self):
+        """Forget the current segment (e.g. after the recognizer was reset)."""
+        self.in_speech = False
+        self._pre.clear()
+        self._rest = b""
+        self._run = 0
+        self._length = 0
@@ -0,0 +1,483 @@
+"""
+Turn benchmark for Azrion, against a local fake Ollama server.
+
+    python bench_azrion.py                                # default sizes, prints a table
+    python bench_azrion.py --sizes 1000,1000000 --turns 200 --json bench.jsonl
+    python bench_azrion.py --latency 0.3 --token-rate 40  # closer to llama3.1 on a laptop
+    python bench_azrion.py --serve --port 11434           # just run the fake server
+
+Every history size runs in a fresh process and temp directory: the history is
+seeded (synthetic messages built from the user inputs in azrion_memory.json),
+azrion is imported (= startup, including the one-time migration into the
+configured backend), then recorded inputs are replayed through azrion_chat.
+
+Reported per size: startup, turn latency p50/p95/p99, time to first token as
+the user sees it (from the call until the sink gets text), save cost (the
+background writer's flush after every turn) and per-turn allocations
+(tracemalloc peak, measured in a separate pass because tracing is slow).
+
+System actions are disabled while replaying (recorded inputs like "open
+youtube" would really open things); pass --system-actions to keep them.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+import zlib
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+RESULT_PREFIX = "BENCH_RESULT "
+FALLBACK_INPUTS = ["hey", "what should i work on today", "i'm tired", "tell me a joke",
+                   "add task write the report", "search history: anime", "how was my week"]
+REPLY_WORDS = ("sure thing you got this keep going one step at a time and take a short "
+               "break when the code fights back").split()
+
+
+# --- FAKE OLLAMA SERVER ---
+class FakeOllama(ThreadingHTTPServer):
+    """
+    Speaks enough of the Ollama HTTP API for azrion: /api/chat and
+    /api/generate (streamed as NDJSON or not), /api/embed, /api/ps.
+
+    latency: seconds before the first token; token_rate: tokens per second
+    after it (0 = all at once); reply_tokens: words per reply; load_seconds:
+    extra delay (reported as load_duration) the first time a model is used.
+
+    Like Ollama, it remembers each model's previous prompt: prompt_eval_count
+    only counts what comes after the common prefix (~4 characters a token).
+    """
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.02, token_rate=500.0, reply_tokens=30,
+                 load_seconds=0.0, embed_dim=256):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.token_rate = token_rate
+        self.reply_tokens = reply_tokens
+        self.load_seconds = load_seconds
+        self.embed_dim = embed_dim
+        self.loaded = set()
+        self.requests = 0
+        self.last_prompt = {}    # model -> previous prompt text (prefix cache)
+
+    def handle_error(self, request, client_address):
+        # a worker exiting drops its keep-alive connections; that's not an error
+        if not isinstance(sys.exc_info()[1], (ConnectionError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+    @property
+    def host(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def load(self, model):
+        """Simulated model load; returns the load time in seconds."""
+        if model in self.loaded:
+            return 0.0
+        self.loaded.add(model)
+        time.sleep(self.load_seconds)
+        return self.load_seconds
+
+    def prompt_eval(self, model, prompt):
+        """Characters of prompt not covered by the cached prefix, as tokens."""
+        cached = os.path.commonprefix([self.last_prompt.get(model, ""), prompt])
+        self.last_prompt[model] = prompt
+        return (len(prompt) - len(cached)) // 4 + 1
+
+    def embed(self, text):
+        # deterministic per text, so repeated messages get the same vector
+        seed = zlib.crc32(text.encode("utf-8"))
+        if np is not None:
+            return np.random.default_rng(seed).standard_normal(self.embed_dim).round(5).tolist()
+        rng = random.Random(seed)
+        return [round(rng.gauss(0, 1), 5) for _ in range(self.embed_dim)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, like the real server
+    disable_nagle_algorithm = True  # small NDJSON chunks must not wait for delayed ACKs
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, data, status=200):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_chunk(self, data):
+        line = json.dumps(data).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        self.server.requests += 1
+        if self.path == "/api/ps":
+            self._send_json({"models": [{"name": m, "model": m} for m in sorted(self.server.loaded)]})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        elif self.path == "/api/tags":
+            self._send_json({"models": []})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        self.server.requests += 1
+        body = self._body()
+        if self.path == "/api/embed":
+            inputs = body.get("input") or []
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            self._send_json({"model": body.get("model"),
+                             "embeddings": [self.server.embed(t) for t in inputs]})
+        elif self.path in ("/api/chat", "/api/generate"):
+            self._generate(body, chat=self.path == "/api/chat")
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _generate(self, body, chat):
+        server = self.server
+        start = time.perf_counter()
+        model = body.get("model", "")
+        load = server.load(model)
+        if chat:
+            prompt = "".join(f"<{m.get('role')}>{m.get('content', '')}" for m in body.get("messages") or [])
+        else:
+            prompt = body.get("prompt") or ""
+        prompt_tokens = server.prompt_eval(model, prompt)
+        empty = not chat and not body.get("prompt")   # warmup / unload request
+        words = [] if empty else [REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(server.reply_tokens)]
+        pieces = [w + " " for w in words]
+
+        def part(text, done):
+            data = {"model": model, "created_at": datetime.now().isoformat(), "done": done}
+            if chat:
+                data["message"] = {"role": "assistant", "content": text}
+            else:
+                data["response"] = text
+            if done:
+                data.update(done_reason="stop", prompt_eval_count=prompt_tokens,
+                            eval_count=len(pieces), load_duration=int(load * 1e9),
+                            total_duration=int((time.perf_counter() - start) * 1e9))
+            return data
+
+        if pieces:
+            time.sleep(server.latency)
+        if body.get("stream", True) is False:
+            if server.token_rate:
+                time.sleep(len(pieces) / server.token_rate)
+            self._send_json(part("".join(pieces), True))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for piece in pieces:
+            self._send_chunk(part(piece, False))
+            if server.token_rate:
+                time.sleep(1.0 / server.token_rate)
+        self._send_chunk(part("", True))
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def start_server(args, port=0):
+    server = FakeOllama(("127.0.0.1", port), latency=args.latency, token_rate=args.token_rate,
+                        reply_tokens=args.reply_tokens, load_seconds=args.load_seconds,
+                        embed_dim=args.embed_dim)
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server
+
+
+# --- SEEDING ---
+def load_inputs(path):
+    """User messages recorded in a memory file (falls back to a few canned ones)."""
+    try:
+        with open(path, "r") as f:
+            memory = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return list(FALLBACK_INPUTS)
+    messages = memory.get("full_history") or memory.get("history") or []
+    inputs = [m["content"] for m in messages if m.get("role") == "user" and m.get("content", "").strip()]
+    return inputs or list(FALLBACK_INPUTS)
+
+
+def synth_history(inputs, count):
+    """`count` alternating user / assistant messages, a minute apart, ending now."""
+    start = datetime.now() - timedelta(minutes=count)
+    history = []
+    for i in range(count):
+        stamp = (start + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S")
+        text = inputs[(i // 2) % len(inputs)]
+        if i % 2:
+            text = "Noted: " + text
+        history.append({"role": "assistant" if i % 2 else "user", "content": text, "time": stamp})
+    return history
+
+
+def seed_memory(path, inputs, count, short_term):
+    full_history = synth_history(inputs, count)
+    memory = {
+        "history": full_history[-short_term:],
+        "full_history": full_history,
+        "habits": {}, "preferences": {}, "stats": {}, "tasks": [],
+        "philosophy": {"liked_schools": [], "favorite_philosophers": [], "favorite_quotes": []},
+    }
+    with open(path, "w") as f:
+        json.dump(memory, f)
+
+
+def seed_vectors(azrion, count, dim):
+    """Fill the recall vector file for the seeded history (random rows; only timing matters)."""
+    store = azrion.recall.store
+    store.reset(azrion.EMBED_MODEL, dim)
+    rng = np.random.default_rng(0)
+    for start in range(0, count, 50000):
+        store.append(rng.standard_normal((min(50000, count - start), dim), dtype=np.float32))
+
+
+# --- WORKER (one history size, run in its own process) ---
+def load_azrion(overrides):
+    """Import azrion.py with some tunables replaced (they are read at import time)."""
+    path = os.path.join(REPO, "azrion.py")
+    with open(path, "r") as f:
+        source = f.read()
+    for name, value in overrides.items():
+        source, found = re.subn(rf"^{name} = .*$", f"{name} = {value!r}", source, count=1, flags=re.M)
+        if not found:
+            raise SystemExit(f"unknown tunable {name}")
+    module = types.ModuleType("azrion")
+    module.__file__ = path
+    sys.modules["azrion"] = module
+    exec(compile(source, path, "exec"), module.__dict__)
+    return module
+
+
+class TimingSink:
+    def __init__(self):
+        self.first = None
+
+    def write(self, text):
+        if self.first is None and text:
+            self.first = time.perf_counter()
+
+    def end(self):
+        pass
+
+
+def run_worker(args):
+    sys.path.insert(0, REPO)
+    inputs = load_inputs(args.inputs)
+    workdir = tempfile.mkdtemp(prefix="azrion-bench-")
+    os.chdir(workdir)
+
+    seed_start = time.perf_counter()
+    seed_memory("azrion_memory.json", inputs, args.size, short_term=40)
+    seeded = time.perf_counter() - seed_start
+
+    overrides = {"MEMORY_BACKEND": args.backend, "STREAM_REPLIES": True,
+                 "RECALL": args.recall and np is not None, "REPLY_CACHE": args.reply_cache,
+                 "FILE_INDEX": False, "SYSMON": False}   # no background walk of ~ / sampler while timing turns
+    start = time.perf_counter()
+    azrion = load_azrion(overrides)
+    startup = time.perf_counter() - start
+    if azrion.recall is not None:
+        seed_vectors(azrion, len(azrion.memory["full_history"]), args.embed_dim)
+    if not args.system_actions:
+        azrion.system_action = lambda user_input, stream=None: None
+
+    def turn(text):
+        sink = TimingSink()
+        begin = time.perf_counter()
+        azrion.azrion_chat(text, sink=sink)
+        end = time.perf_counter()
+        return end - begin, (sink.first - begin) if sink.first else None
+
+    def save():
+        begin = time.perf_counter()
+        if azrion._writer is not None:
+            azrion._writer.flush()
+        return time.perf_counter() - begin
+
+    for i in range(args.warmup):
+        turn(inputs[i % len(inputs)])
+        save()
+
+    latencies, ttfts, saves, evals, prompts = [], [], [], [], []
+    checkpoints = azrion.llm_stats["checkpoints"]
+    for i in range(args.turns):
+        latency, ttft = turn(inputs[(args.warmup + i) % len(inputs)])
+        latencies.append(latency)
+        if ttft is not None:
+            ttfts.append(ttft)
+        if azrion.last_turn.get("prompt_eval") is not None:
+            evals.append(azrion.last_turn["prompt_eval"])
+            prompts.append(azrion.last_turn["prompt_est"])
+        saves.append(save())
+    checkpoints = azrion.llm_stats["checkpoints"] - checkpoints
+
+    peaks, retained = [], []
+    if args.alloc_turns:
+        tracemalloc.start()
+        for i in range(args.alloc_turns):
+            save()
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            turn(inputs[i % len(inputs)])
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+        tracemalloc.stop()
+
+    result = {
+        "size": args.size,
+        "backend": args.backend,
+        "recall": azrion.recall is not None,
+        "seed_s": seeded,
+        "startup_s": startup,
+        "turns": len(latencies),
+        "turn_ms": summarize(latencies, 1000),
+        "ttft_ms": summarize(ttfts, 1000),
+        "save_ms": summarize(saves, 1000),
+        "prompt_eval_tokens": summarize(evals),
+        "prompt_tokens": summarize(prompts),
+        "checkpoints": checkpoints,
+        "alloc_peak_kib": summarize(peaks, 1 / 1024),
+        "alloc_retained_kib": summarize(retained, 1 / 1024),
+        "max_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "workdir": workdir,
+    }
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+    if not args.keep:
+        subprocess.run(["rm", "-rf", workdir])
+    os._exit(0)   # don't wait for background threads / atexit saves of a throwaway dir
+
+
+# --- REPORT ---
+def percentile(values, p):
+    """Linear-interpolated percentile (p in 0..100) of an unsorted list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * p / 100.0
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def summarize(values, scale=1.0):
+    if not values:
+        return None
+    return {"p50": percentile(values, 50) * scale, "p95": percentile(values, 95) * scale,
+            "p99": percentile(values, 99) * scale, "max": max(values) * scale}
+
+
+def _fmt(stats, key, width=8):
+    value = stats.get(key) if stats else None
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}.1f}"
+
+
+def print_table(rows):
+    print(f"{'messages':>9} {'startup s':>9} | {'turn p50':>8} {'p95':>8} {'p99':>8} | "
+          f"{'ttft p50':>8} {'p95':>8} | {'save p50':>8} {'p95':>8} | {'alloc KiB':>9} | {'rss MiB':>7} | "
+          f"{'eval tok':>8} {'/prompt':>7} {'ckpts':>5}")
+    for r in rows:
+        print(f"{r['size']:>9} {r['startup_s']:>9.2f} | {_fmt(r['turn_ms'], 'p50')} {_fmt(r['turn_ms'], 'p95')} "
+              f"{_fmt(r['turn_ms'], 'p99')} | {_fmt(r['ttft_ms'], 'p50')} {_fmt(r['ttft_ms'], 'p95')} | "
+              f"{_fmt(r['save_ms'], 'p50')} {_fmt(r['save_ms'], 'p95')} | {_fmt(r['alloc_peak_kib'], 'p50', 9)} | "
+              f"{r['max_rss_mib']:>7.0f} | {_fmt(r['prompt_eval_tokens'], 'p50')} {_fmt(r['prompt_tokens'], 'p50', 7)} {r['checkpoints']:>5}")
+    print("(times in ms unless noted; alloc = tracemalloc peak per turn; "
+          "eval tok = prompt tokens evaluated past the cached prefix, p50; "
+          "ckpts = context-window checkpoints during the timed turns)")
+
+
+def worker_command(args, size):
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", "--size", str(size),
+           "--backend", args.backend, "--turns", str(args.turns), "--warmup", str(args.warmup),
+           "--alloc-turns", str(args.alloc_turns), "--inputs", args.inputs,
+           "--embed-dim", str(args.embed_dim)]
+    for flag in ("recall", "reply_cache", "system_actions", "keep"):
+        if getattr(args, flag):
+            cmd.append("--" + flag.replace("_", "-"))
+    return cmd
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Azrion turn benchmark (fake Ollama server).")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000",
+                        help="comma-separated history sizes (messages)")
+    parser.add_argument("--turns", type=int, default=100, help="timed turns per size")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed turns before measuring")
+    parser.add_argument("--alloc-turns", type=int, default=10, help="turns traced with tracemalloc (0 = skip)")
+    parser.add_argument("--backend", default="journal", choices=("journal", "sqlite", "json"))
+    parser.add_argument("--recall", action="store_true", help="keep embedding recall on (needs numpy)")
+    parser.add_argument("--reply-cache", action="store_true")
+    parser.add_argument("--system-actions", action="store_true", help="let replayed inputs run system actions")
+    parser.add_argument("--inputs", default=os.path.join(REPO, "azrion_memory.json"),
+                        help="memory file whose user messages are replayed")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake server: seconds to first token")
+    parser.add_argument("--token-rate", type=float, default=500.0, help="fake server: tokens/second (0 = instant)")
+    parser.add_argument("--reply-tokens", type=int, default=30, help="fake server: tokens per reply")
+    parser.add_argument("--load-seconds", type=float, default=0.0, help="fake server: first-use model load time")
+    parser.add_argument("--embed-dim", type=int, default=256, help="fake server: embedding size")
+    parser.add_argument("--json", help="append one JSON result line per size to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the temp directories")
+    parser.add_argument("--serve", action="store_true", help="only run the fake server")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args)
+        return
+    server = start_server(args, port=args.port)
+    if args.serve:
+        print(f"fake Ollama listening on {server.host} (Ctrl+C to stop)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            return
+    env = dict(os.environ, OLLAMA_HOST=server.host)
+    rows = []
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        print(f"[bench] {size} messages ...", file=sys.stderr, flush=True)
+        proc = subprocess.run(worker_command(args, size), env=env, stdout=subprocess.PIPE, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith(RESULT_PREFIX)]
+        if proc.returncode != 0 or not lines:
+            print(f"[bench] {size}: worker failed (exit {proc.returncode})", file=sys.stderr)
+            continue
+        row = json.loads(lines[-1][len(RESULT_PREFIX):])
+        rows.append(row)
+        if args.json:
+            with open(args.json, "a") as f:
+                f.write(json.dumps(row) + "\n")
+    server.shutdown()
+    if rows:
+        print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+from azrion_index import HistoryIndex
+
+HISTORY = [
+    "I pushed the fix to github",                  # 0
+    "git rebase went wrong again",                 # 1
+    "the stoic view on python errors",             # 2
+    "python errors, python errors everywhere",     # 3
+    "errors in python",                            # 4
+    "Python Errors: a stoic guide",                # 5
+]
+
+
+class CountingHistory(list):
+    """full_history that counts how many entries search() fetched."""
+
+    fetched = 0
+
+    def __getitem__(self, i):
+        self.fetched += 1
+        return super().__getitem__(i)
+
+
+def _index(tmp_path, texts):
+    history = CountingHistory({"role": "user", "content": t, "time": "t"} for t in texts)
+    index = HistoryIndex(str(tmp_path / "history.idx"))
+    index.catch_up(history)
+    history.fetched = 0
+    return index, history
+
+
+def _ids(hits):
+    return [doc_id for doc_id, _ in hits]
+
+
+def test_terms_are_whole_tokens(tmp_path):
+    index, history = _index(tmp_path, HISTORY)
+    # the old substring scan found "git" inside "github"; tokens don't
+    assert _ids(index.search("git", history)) == [1]
+    assert index.search("err", history) == []
+
+
+def test_all_terms_must_match(tmp_path):
+    index, history = _index(tmp_path, HISTORY)
+    assert _ids(index.search("python errors", history)) == [5, 4, 3, 2]
+    assert _ids(index.search("STOIC python", history)) == [5, 2]
+    assert index.search("python rebase", history) == []
+
+
+def test_quoted_phrase_is_exact_sequence(tmp_path):
+    index, history = _index(tmp_path, HISTORY)
+    assert _ids(index.search('"python errors"', history)) == [5, 3, 2]
+    assert _ids(index.search('"errors python"', history)) == [3]   # not "errors in python"
+    assert _ids(index.search('"python errors" stoic', history)) == [5, 2]
+
+
+def test_relevance_ranks_and_stops_early(tmp_path):
+    index, history = _index(tmp_path, HISTORY)
+    hits = index.search("python errors", history, rank="relevance")
+    assert _ids(hits)[0] == 3           # highest term frequency wins
+    assert sorted(_ids(hits)) == [2, 3, 4, 5]
+
+    history.fetched = 0
+    assert _ids(index.search("python errors", history, limit=1, rank="relevance")) == [3]
+    assert history.fetched == 1         # entries are only fetched until the limit
+
+
+def test_relevance_only_scores_newest_candidates(tmp_path):
+    texts = ["python python python errors"] + ["python errors"] * 10
+    index, history = _index(tmp_path, texts)
+    # the best match is older than the newest max_candidates matches
+    assert 0 not in _ids(index.search("python errors", history, rank="relevance", max_candidates=5))
+    assert _ids(index.search("python errors", history, limit=1, rank="relevance"))[0] == 0
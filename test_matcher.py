@@ -0,0 +1,76 @@
+import pytest
+
+from azrion_matcher import KeywordMatcher
+
+# the keyword lists as the old if-chains had them (azrion.py registers the same ones)
+MOODS = [
+    ("lazy", ["lazy", "tired", "procrastinate"]),
+    ("stuck", ["stuck", "bug", "error"]),
+    ("down", ["fail", "lost", "can't"]),
+]
+HABITS = ["study", "work", "sleep", "music", "exercise", "code", "coding", "anime", "movie"]
+SCHOOLS = ["existentialism", "absurdism", "nihilism", "stoicism", "stoic", "existentialist", "absurdist", "nihilist"]
+PHILOSOPHERS = ["camus", "nietzsche", "kierkegaard", "sartre", "dostoevsky", "epictetus", "seneca",
+                "marcus aurelius", "plato", "aristotle"]
+PREFIXES = ["open:", "search google for ", "run:", "open folder "]
+
+CORPUS = [
+    "",
+    "I'm so tired of this bug",
+    "I'm SO TIRED of this BUG",                   # case
+    "coding all night, then some code review",   # code and coding
+    "stoicism vs the stoics",                     # stoic inside stoicism / stoics
+    "existentialist nihilists are absurdists",     # school inside a longer word
+    "homework and networking",                     # work inside other words
+    "debugging the errors",                        # bug / error inside other words
+    "read marcus aurelius and marcus  aurelius",   # phrase, and a near miss
+    "platonic love, aristotelian logic",          # plato inside platonic
+    "i can't, i failed, i'm lost",
+    "open: https://example.com",
+    "please open: https://example.com",           # prefix not at the start
+    "search google for open: things",
+    "run: sleep 5 && echo work",
+    "open folder music",
+    "moviemusicanimestudy",                         # back-to-back overlaps
+    "procrastinateprocrastinate",
+]
+
+
+def _old(text):
+    """The old predicates: substring tests on the lower-cased, stripped message."""
+    text = text.lower().strip()
+    found = set()
+    for mood, words in MOODS:
+        if any(word in text for word in words):
+            found.add(("mood", mood))
+    found.update(("habit", kw) for kw in HABITS if kw in text)
+    found.update(("school", s) for s in SCHOOLS if s in text)
+    found.update(("philosopher", p) for p in PHILOSOPHERS if p in text)
+    found.update(("prefix", p) for p in PREFIXES if text.startswith(p))
+    return found
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    m = KeywordMatcher()
+    for mood, words in MOODS:
+        for word in words:
+            m.add(word, ("mood", mood))
+    for group, names in (("habit", HABITS), ("school", SCHOOLS), ("philosopher", PHILOSOPHERS)):
+        for name in names:
+            m.add(name, (group, name))
+    for p in PREFIXES:
+        m.add(p, ("prefix", p), prefix=True)
+    return m
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_matcher_agrees_with_if_chain(matcher, text):
+    assert matcher.scan(text.lower().strip()).payloads == _old(text)
+
+
+def test_overlapping_patterns_all_reported(matcher):
+    found = matcher.scan("stoicism and coding")
+    assert found.has("school", "stoicism") and found.has("school", "stoic")
+    assert found.has("habit", "coding") and not found.has("habit", "code")
+    assert not found.any("mood")
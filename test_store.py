@@ -0,0 +1,129 @@
+import json
+
+from azrion_stats import SpaceSaving
+from azrion_store import NEW_FILE_MODE, JournalStore, SQLiteStore, write_json_atomic
+
+
+def _memory(stats):
+    return {"history": [], "full_history": [{"role": "user", "content": "hi", "time": "t"}],
+            "habits": {"coding": 2}, "preferences": {}, "stats": stats, "tasks": [],
+            "philosophy": {}, "rolling_summary": None}
+
+
+def _compact_stats():
+    sketch = SpaceSaving(3)
+    for word in ["python", "python", "python", "coffee", "coffee", "music", "stoic"]:
+        sketch.add(word)
+    return sketch
+
+
+def test_sqlite_migrates_compact_stats(tmp_path):
+    json_path = tmp_path / "azrion_memory.json"
+    saved = _compact_stats()
+    json_path.write_text(json.dumps(_memory(saved.to_json())))
+
+    store = SQLiteStore(str(tmp_path / "azrion.db"), history_limit=12)
+    memory = store.load(_memory({}), json_path=str(json_path), stats_sketch=SpaceSaving(2000))
+    assert dict(memory["stats"].items()) == dict(saved.items())
+    assert memory["stats"].errors == saved.errors
+    assert "capacity" not in memory["stats"] and "items" not in memory["stats"]
+
+    # and the next start reads the same rows back
+    store.db.close()
+    again = SQLiteStore(str(tmp_path / "azrion.db"), history_limit=12)
+    assert dict(again.load(_memory({}), stats_sketch=SpaceSaving(2000))["stats"].items()) == dict(saved.items())
+
+
+def test_sqlite_repairs_badly_migrated_stats(tmp_path):
+    saved = _compact_stats()
+    store = SQLiteStore(str(tmp_path / "azrion.db"), history_limit=12)
+    with store.db:
+        store.db.executemany("INSERT INTO stats (word, count) VALUES (?, ?)",
+                             list(saved.to_json().items()))
+        store.db.execute("INSERT INTO meta (key, value) VALUES ('migrated_from', 'x')")
+    memory = store.load(_memory({}), stats_sketch=SpaceSaving(2000))
+    assert dict(memory["stats"].items()) == dict(saved.items())
+
+
+def test_sqlite_migrates_plain_stats(tmp_path):
+    json_path = tmp_path / "azrion_memory.json"
+    json_path.write_text(json.dumps(_memory({"python": 4, "coffee": 1})))
+    store = SQLiteStore(str(tmp_path / "azrion.db"), history_limit=12)
+    memory = store.load(_memory({}), json_path=str(json_path))
+    assert dict(memory["stats"].items()) == {"python": 4, "coffee": 1}
+
+
+def test_atomic_write_keeps_mode(tmp_path):
+    target = tmp_path / "azrion_memory.json"
+    target.write_text("{}")
+    target.chmod(0o644)
+    write_json_atomic(str(target), {"a": 1})
+    assert json.loads(target.read_text()) == {"a": 1}
+    assert target.stat().st_mode & 0o777 == 0o644
+
+    fresh = tmp_path / "new.json"
+    write_json_atomic(str(fresh), {})
+    assert fresh.stat().st_mode & 0o777 == NEW_FILE_MODE
+
+
+def _journal(tmp_path, compact_every=200):
+    return JournalStore(str(tmp_path / "azrion_memory.json"), str(tmp_path / "azrion_memory.journal"),
+                        compact_every=compact_every)
+
+
+def _say(store, memory, n):
+    for i in range(n):
+        memory["full_history"].append({"role": "user", "content": f"msg {i}", "time": "t"})
+        memory["stats"]["python"] = memory["stats"].get("python", 0) + 1
+        memory["habits"]["coding"] += 1
+        store.save(memory)
+
+
+def test_journal_replays_after_crash(tmp_path):
+    store = _journal(tmp_path)
+    memory = store.load(_memory({}))
+    _say(store, memory, 5)
+    # no compaction and no clean shutdown: everything is in the journal only
+    assert not (tmp_path / "azrion_memory.json").exists()
+
+    again = _journal(tmp_path).load(_memory({}))
+    assert len(again["full_history"]) == 6
+    assert again["full_history"][-1]["content"] == "msg 4"
+    assert again["stats"] == {"python": 5}
+    assert again["habits"] == {"coding": 7}
+
+
+def test_journal_ignores_torn_last_line(tmp_path):
+    store = _journal(tmp_path)
+    memory = store.load(_memory({}))
+    _say(store, memory, 3)
+    journal = tmp_path / "azrion_memory.journal"
+    lines = journal.read_bytes().splitlines(keepends=True)
+    journal.write_bytes(b"".join(lines[:-1]) + lines[-1][:len(lines[-1]) // 2])
+
+    store = _journal(tmp_path)
+    again = store.load(_memory({}))
+    assert [m["content"] for m in again["full_history"]] == ["hi", "msg 0", "msg 1"]
+    assert again["stats"] == {"python": 2}
+    # the torn tail is cut off, so the next record starts on a clean line
+    assert journal.read_bytes() == b"".join(lines[:-1])
+    _say(store, again, 1)
+    assert len(_journal(tmp_path).load(_memory({}))["full_history"]) == 4
+
+
+def test_journal_compaction(tmp_path):
+    store = _journal(tmp_path, compact_every=3)
+    memory = store.load(_memory({}))
+    journal = tmp_path / "azrion_memory.journal"
+    _say(store, memory, 2)
+    before = journal.read_bytes()
+    _say(store, memory, 1)
+    assert journal.read_bytes() == b""
+    snapshot = json.loads((tmp_path / "azrion_memory.json").read_text())
+    assert snapshot["journal_seq"] == 3 and len(snapshot["full_history"]) == 4
+
+    # crash between the snapshot rename and the journal truncate: old records are skipped
+    journal.write_bytes(before)
+    again = _journal(tmp_path).load(_memory({}))
+    assert len(again["full_history"]) == 4
+    assert again["stats"] == {"python": 3}